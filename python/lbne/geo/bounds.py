@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+'''Axis-aligned bounding boxes (AABBs) of shapes, volumes and placements.
+
+An extent is a pair (lo, hi) of arrays holding the minimum and maximum
+corner of a box in some frame.  Lengths are plain floats in units of
+lbne.geo.flat.LUNIT.
+
+The Bounds object caches extents per shape and per logical volume.  A
+cached entry is dropped when the object in the geometry store is
+replaced (as the rewrite passes in lbne.geo do), when the placements
+of an assembly or their transforms are replaced or when invalidate()
+is called.
+
+Builders should use envelope() to get the half dimensions of a box
+which tightly holds a set of placements.
+'''
+
+import math
+import numpy
+
+from gegede import Quantity as Q
+
+from lbne.geo.flat import LUNIT, AUNIT, length, local_transform
+from lbne.geo.shapes import get_shape, boolean_transform, box_half
+
+
+def transform_extent(rot, pos, extent):
+    '''
+    Return the extent holding <extent> after rotation <rot> and translation <pos>.
+    '''
+    lo, hi = extent
+    center = numpy.dot(rot, 0.5*(lo + hi)) + pos
+    half = numpy.dot(numpy.abs(rot), 0.5*(hi - lo))
+    return center - half, center + half
+
+
+def union_extent(extents):
+    '''
+    Return the extent holding all of the given <extents>.
+    '''
+    extents = list(extents)
+    lo = numpy.min([e[0] for e in extents], axis=0)
+    hi = numpy.max([e[1] for e in extents], axis=0)
+    return lo, hi
+
+
+def tubs_extent(shape):
+    '''
+    Return the extent of a Tubs, accounting for a phi segment.
+    '''
+    rmin, rmax, dz = length(shape.rmin), length(shape.rmax), length(shape.dz)
+    sphi = shape.sphi.to(AUNIT).magnitude
+    dphi = shape.dphi.to(AUNIT).magnitude
+    if dphi >= 2.0*math.pi:
+        return numpy.array([-rmax, -rmax, -dz]), numpy.array([rmax, rmax, dz])
+    angles = [sphi, sphi + dphi]
+    for quarter in range(-4, 9):
+        phi = 0.5*math.pi*quarter
+        if sphi < phi < sphi + dphi:
+            angles.append(phi)
+    xy = [(r*math.cos(a), r*math.sin(a)) for a in angles for r in (rmin, rmax)]
+    xs, ys = zip(*xy)
+    return numpy.array([min(xs), min(ys), -dz]), numpy.array([max(xs), max(ys), dz])
+
+
+class Bounds(object):
+    '''
+    Cached bounding boxes over a geometry.
+    '''
+
+    def __init__(self, geom):
+        self.geom = geom
+        self._shapes = dict()
+        self._volumes = dict()
+
+    def invalidate(self, name = None):
+        '''
+        Drop cached extent for the shape or volume <name> or all if None.
+        '''
+        if name is None:
+            self._shapes.clear()
+            self._volumes.clear()
+            return
+        self._shapes.pop(name, None)
+        self._volumes.pop(name, None)
+
+    def shape(self, shape):
+        '''
+        Return the extent of <shape> (object or name) in its own frame.
+        '''
+        shape = get_shape(self.geom, shape)
+        if self._shape_valid(shape.name):
+            return self._shapes[shape.name][1]
+
+        typename = type(shape).__name__
+        if typename == 'Box':
+            half = box_half(shape)
+            extent = (-half, half)
+        elif typename == 'Tubs':
+            extent = tubs_extent(shape)
+        elif typename == 'Sphere':
+            rmax = length(shape.rmax)
+            extent = (-rmax*numpy.ones(3), rmax*numpy.ones(3))
+        elif typename == 'Boolean':
+            first = self.shape(shape.first)
+            rot, pos = boolean_transform(self.geom, shape)
+            second = transform_extent(rot, pos, self.shape(shape.second))
+            if shape.type == 'union':
+                extent = union_extent([first, second])
+            elif shape.type == 'intersection':
+                extent = (numpy.maximum(first[0], second[0]), numpy.minimum(first[1], second[1]))
+            else:
+                extent = first
+        else:
+            raise ValueError('Unsupported shape type: "%s"' % typename)
+
+        self._shapes[shape.name] = (shape, extent)
+        return extent
+
+    def _shape_valid(self, name):
+        cached = self._shapes.get(name)
+        if not cached or cached[0] is not self.geom.store.shapes.get(name):
+            return False
+        if type(cached[0]).__name__ == 'Boolean':
+            return self._shape_valid(cached[0].first) and self._shape_valid(cached[0].second)
+        return True
+
+    def _placement_objects(self, vol):
+        store = self.geom.store.structure
+        ret = list()
+        for pname in vol.placements or ():
+            place = store.get(pname)
+            ret.append(place)
+            if place is not None:
+                ret += [store.get(place.pos), store.get(place.rot)]
+        return ret
+
+    def _valid(self, name):
+        cached = self._volumes.get(name)
+        if not cached:
+            return False
+        vol = self.geom.store.structure.get(name)
+        if cached[0] is not vol:
+            return False
+        objects = self._placement_objects(vol)
+        if len(objects) != len(cached[1]) or any([a is not b for a, b in zip(objects, cached[1])]):
+            return False
+        if vol.shape is not None:
+            return self._shape_valid(vol.shape)
+        return all([self._valid(d) for d in cached[2]])
+
+    def volume(self, volume):
+        '''Return the extent of the logical <volume> (object or name) in
+        its own frame.  An assembly is bounded by its daughters.
+        '''
+        if hasattr(volume, 'name'):
+            volume = volume.name
+        if self._valid(volume):
+            return self._volumes[volume][3]
+
+        store = self.geom.store.structure
+        vol = store[volume]
+        daughters = list()
+        if vol.shape is not None:
+            extent = self.shape(vol.shape)
+        else:
+            extent = self.placements(vol.placements)
+            daughters = [store[p].volume for p in vol.placements]
+        self._volumes[volume] = (vol, self._placement_objects(vol), daughters, extent)
+        return extent
+
+    def placement(self, place):
+        '''
+        Return the extent of placement <place> (object or name) in the mother frame.
+        '''
+        store = self.geom.store.structure
+        if isinstance(place, type("")):
+            place = store[place]
+        rot, pos = local_transform(store, place)
+        return transform_extent(rot, pos, self.volume(place.volume))
+
+    def placements(self, places):
+        '''
+        Return the extent holding all the placements <places> in their mother frame.
+        '''
+        return union_extent([self.placement(p) for p in places])
+
+    def nodes(self, flat):
+        '''Return (lo, hi) arrays of shape (N,3) holding the global
+        extent of each node of the Flat object <flat>.
+        '''
+        local = [self.volume(v) for v in flat.volumes]
+        lo = numpy.array([e[0] for e in local])
+        hi = numpy.array([e[1] for e in local])
+        center = numpy.einsum('nij,nj->ni', flat.rot, 0.5*(lo + hi)) + flat.pos
+        half = numpy.einsum('nij,nj->ni', numpy.abs(flat.rot), 0.5*(hi - lo))
+        return center - half, center + half
+
+
+def get_bounds(geom):
+    '''
+    Return the Bounds object which caches extents for <geom>.
+    '''
+    bounds = getattr(geom, '_bounds', None)
+    if bounds is None:
+        bounds = Bounds(geom)
+        geom._bounds = bounds
+    return bounds
+
+
+def envelope(geom, placements):
+    '''Return (dx,dy,dz) Quantities giving the half dimensions of the
+    smallest box centered on the origin of the mother frame which holds
+    the given <placements>.
+    '''
+    lo, hi = get_bounds(geom).placements(placements)
+    half = numpy.maximum(numpy.abs(lo), numpy.abs(hi))
+    return tuple([Q(h, LUNIT) for h in half])
@@ -5,6 +5,9 @@ The lbne.geo.builders module
 
 import gegede.builder
 from gegede import Quantity as Q
+
+from lbne.geo.transforms import get_interner
+
 class World(gegede.builder.Builder):
     '''
     Build a simple box world of given material and size.
@@ -43,10 +46,34 @@ class BoxWithOne(gegede.builder.Builder):
     def construct(self, geom):
         dim = [0.5*d for d in self.dim]
         shape = geom.shapes.Box(self.name, *dim)
-        pos = geom.structure.Position(None, *self.off)
+        pos = get_interner(geom).position(*self.off)
         child = self.get_builder(self.sbind).get_volume(self.volind)
         place = geom.structure.Placement(None, volume = child, pos = pos)
         vol = geom.structure.Volume('vol'+self.name, material = self.material, shape=shape,
                                     placements = [place])
         self.add_volume(vol)
         return
+
+
+class Simplified(gegede.builder.Builder):
+    '''
+    Pass through the one volume of a sub-builder after reducing its level of detail.
+
+    See lbne.geo.lod for the meaning of the levels and
+    lbne.geo.decompose for the Boolean rewrite.
+    '''
+    defaults = dict(
+        lod = 'full',
+        homogenize = None,      # explicit list of (builder class name, keep pattern)
+        decompose = False,      # replace Box-minus-Box shapes with Box slabs
+    )
+
+    def construct(self, geom):
+        import lbne.geo.lod
+        sb = self.get_builder(0)
+        lbne.geo.lod.simplify(geom, sb, self.lod, self.homogenize)
+        if self.decompose:
+            import lbne.geo.decompose
+            lbne.geo.decompose.decompose(geom, sb.get_volume(0).name)
+        self.add_volume(geom.store.structure[sb.get_volume(0).name])
+        return
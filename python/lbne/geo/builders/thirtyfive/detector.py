@@ -1,6 +1,10 @@
 import gegede.builder
 from gegede import Quantity as Q
 
+from lbne.geo.flat import LUNIT
+from lbne.geo.bounds import get_bounds, envelope
+from lbne.geo.transforms import get_interner
+
 
 
 class Detector(gegede.builder.Builder):
@@ -26,22 +30,20 @@ class Detector(gegede.builder.Builder):
         volumes = [sb.get_volume(0) for sb in self.get_builders()]
         if len(volumes) == 4:
             volumes.append(volumes[0])
-        shapes = [geom.get_shape(v) for v in volumes]
-
-        # Get envelop just fitting the sandwich
-        dx_extent = sum([s.dx for s in shapes])
-        dy_extent = max([s.dy for s in shapes])
-        dz_extent = max([s.dz for s in shapes])
+        bounds = get_bounds(geom)
+        extents = [bounds.volume(v) for v in volumes]
 
-        x_cursor = -1 * dx_extent
+        # stack along X centered on the origin
+        x_cursor = -0.5 * sum([hi[0] - lo[0] for lo,hi in extents])
         placements = list()
-        for shape,volume in zip(shapes,volumes):
-            x_cursor += shape.dx
-            pos = geom.structure.Position(None, x=x_cursor)
-            x_cursor += shape.dx            
+        for (lo,hi),volume in zip(extents,volumes):
+            pos = get_interner(geom).position(x=Q(x_cursor - lo[0], LUNIT))
+            x_cursor += hi[0] - lo[0]
             place = geom.structure.Placement(None, volume=volume, pos=pos)
             placements.append(place)
             
+        # Get envelop just fitting the sandwich
+        dx_extent, dy_extent, dz_extent = envelope(geom, placements)
         shape = geom.shapes.Box(self.name, dx = dx_extent, dy = dy_extent, dz = dz_extent)
         top = geom.structure.Volume('vol'+self.name, material=self.material, shape=shape, 
                                     placements = placements)
@@ -107,8 +109,6 @@ class WireFrame(gegede.builder.Builder):
     def construct(self, geom):
         children = list()
 
-        maxyext = Q('0 m')
-
         s_volume = self.get_builder(0).get_volume(0)
         s_shape = geom.get_shape(s_volume)
         m_volume = self.get_builder(1).get_volume(0)
@@ -118,32 +118,30 @@ class WireFrame(gegede.builder.Builder):
 
         # small
         small_center = -0.5*self.y_gap - m_shape.dy + self.y_offset_sm
-        pos = geom.structure.Position(None, y = small_center)
+        pos = get_interner(geom).position(y = small_center)
         place = geom.structure.Placement(None, volume=s_volume, pos=pos)
         children.append(place)
-        maxyext = max(maxyext, abs(small_center - s_shape.dy))
 
         # medium
         medium_center = 0.5*self.y_gap + s_shape.dy  + self.y_offset_sm
-        pos = geom.structure.Position(None, y=medium_center)
+        pos = get_interner(geom).position(y=medium_center)
         place = geom.structure.Placement(None, volume=m_volume, pos=pos)
         children.append(place)
-        maxyext = max(maxyext, medium_center + m_shape.dy)
 
         # large
         large_center = Q('0 m') + self.y_offset_ll
         large_offset = s_shape.dz + l_shape.dz + self.z_gap
-        posm = geom.structure.Position(None, z = -1*large_offset, y=large_center)
-        posp = geom.structure.Position(None, z = +1*large_offset, y=large_center)
+        posm = get_interner(geom).position(z = -1*large_offset, y=large_center)
+        posp = get_interner(geom).position(z = +1*large_offset, y=large_center)
         children += [
             geom.structure.Placement(None, volume=l_volume, pos=posm),
             geom.structure.Placement(None, volume=l_volume, pos=posp)
         ]
-        maxyext = max(maxyext, large_center + l_shape.dy)
 
         # envelope
         # fixme: maybe want to add 0.5*self.z_gap to dz
-        env_shape = geom.shapes.Box(None, dx=l_shape.dx, dy = maxyext, dz = large_offset + l_shape.dz)
+        dx, dy, dz = envelope(geom, children)
+        env_shape = geom.shapes.Box(None, dx=dx, dy=dy, dz=dz)
         env_vol = geom.structure.Volume('vol' + self.name, material = self.material,
                                         shape=env_shape, placements = children)
         self.add_volume(env_vol)
@@ -185,12 +183,12 @@ class WireFrameOne(gegede.builder.Builder):
         bar = self.make_bar_tube(volname, geom, self.thickness, self.bar_width, length)
         off = 0.5*(width - self.bar_width)
         if rot: 
-            rot = geom.structure.Rotation(None, x=Q(rot))
-            posp = geom.structure.Position(None, z=+1*off)
-            posm = geom.structure.Position(None, z=-1*off)
+            rot = get_interner(geom).rotation(x=Q(rot))
+            posp = get_interner(geom).position(z=+1*off)
+            posm = get_interner(geom).position(z=-1*off)
         else:
-            posp = geom.structure.Position(None, y=+1*off)
-            posm = geom.structure.Position(None, y=-1*off)
+            posp = get_interner(geom).position(y=+1*off)
+            posm = get_interner(geom).position(y=-1*off)
 
         return (geom.structure.Placement(None, volume=bar, pos=posp, rot=rot),
                 geom.structure.Placement(None, volume=bar, pos=posm, rot=rot))
@@ -209,7 +207,7 @@ class WireFrameOne(gegede.builder.Builder):
             cross_center -= (self.cross_gap + 0.5* self.cross_width)
             volname = 'vol%sCross%d' % (self.name, count+1)
             bar = self.make_bar_tube(volname, geom, self.thickness, self.cross_width, cross_length)
-            pos = geom.structure.Position(None, y=cross_center)
+            pos = get_interner(geom).position(y=cross_center)
             cross_center -= 0.5* self.cross_width
             place = geom.structure.Placement(None, volume=bar, pos=pos)
             children.append(place)
@@ -275,23 +273,23 @@ class Drift(gegede.builder.Builder):
         cage_shape, stpc_shape, mtpc_shape, ltpc_shape = shapes
 
         # place cage
-        pos = geom.structure.Position(None, x=self.x_cage_offset)
+        pos = get_interner(geom).position(x=self.x_cage_offset)
         place = geom.structure.Placement(None, volume=cage_vol, pos=pos)
         children.append(place)
 
         # place large
         for sign in [-1, +1]:
-            pos = geom.structure.Position(None, z=sign*(stpc_shape.dz+ltpc_shape.dz))
+            pos = get_interner(geom).position(z=sign*(stpc_shape.dz+ltpc_shape.dz))
             place = geom.structure.Placement(None, volume=ltpc_vol, pos=pos)
             children.append(place)
 
         # place medium nominally up in Y by small's dy 
-        pos = geom.structure.Position(None, y=+1*stpc_shape.dy + self.y_sm_tpc_offset)
+        pos = get_interner(geom).position(y=+1*stpc_shape.dy + self.y_sm_tpc_offset)
         place = geom.structure.Placement(None, volume=mtpc_vol, pos=pos)
         children.append(place)
 
         # place small nominally down in Y by medium's dy
-        pos = geom.structure.Position(None, y=-1*mtpc_shape.dy + self.y_sm_tpc_offset)
+        pos = get_interner(geom).position(y=-1*mtpc_shape.dy + self.y_sm_tpc_offset)
         place = geom.structure.Placement(None, volume=stpc_vol, pos=pos)
         children.append(place)
 
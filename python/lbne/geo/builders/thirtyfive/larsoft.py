@@ -6,6 +6,10 @@ seen in lbne35t4apa_v2.gdml '''
 import gegede.builder
 from gegede import Quantity as Q
 
+from lbne.geo.flat import LUNIT
+from lbne.geo.bounds import get_bounds, envelope
+from lbne.geo.transforms import get_interner
+
 
 
 class Cryostat(gegede.builder.Builder):
@@ -58,9 +62,9 @@ class Cryostat(gegede.builder.Builder):
                     z_factors = [-1.0, 1.0]
 
                 vol = tpcb.get_volume(0)
-                rot = geom.structure.Rotation(None, y = rot_angle)
+                rot = get_interner(geom).rotation(y = rot_angle)
                 for z_factor in z_factors:
-                    pos = geom.structure.Position(None, x=x_offset, y=y_offset, z=z_factor*z_offset)
+                    pos = get_interner(geom).position(x=x_offset, y=y_offset, z=z_factor*z_offset)
                     place = geom.structure.Placement(None, volume=vol, pos=pos, rot=rot)
                     children.append(place)
                 continue
@@ -70,30 +74,27 @@ class Cryostat(gegede.builder.Builder):
         long_drift_distance  = 2.0*self.get_builder('TPC_ML').hdim[0]
 
         tpcs_xtot = short_drift_distance + long_drift_distance + self.x_gap
-        tpcs_ytot =   2.0*self.get_builder('TPC_ML').hdim[1] + 2.0*self.get_builder('TPC_SL').hdim[1] + self.y_gap
-        tpcs_ztot = 3*2.0*self.get_builder('TPC_ML').hdim[2] + 2.0*self.z_gap
 
         # place wire frame volume into gap
         frame_builder = self.get_builder('WireFrame')
         frame_x = -0.5*tpcs_xtot + short_drift_distance + 0.5*self.x_gap
-        frame_pos = geom.structure.Position(None, x=frame_x)
+        frame_pos = get_interner(geom).position(x=frame_x)
         frame_place = geom.structure.Placement(None, volume = frame_builder.get_volume(0), pos=frame_pos)
         children.append(frame_place)
 
         # place two CPA planes
         cpa_builder = self.get_builder('CPA')
         cpa_volume = cpa_builder.get_volume(0)
-        cpa_width = 2.0 * geom.get_shape(cpa_volume.shape).dx # warning: assumes box!
+        cpa_lo, cpa_hi = get_bounds(geom).volume(cpa_volume)
+        cpa_width = Q(cpa_hi[0] - cpa_lo[0], LUNIT)
         cpa_x = 0.5*(tpcs_xtot + cpa_width)
         for sign in [+1, -1]:
-            cpa_pos = geom.structure.Position(None, x= sign*cpa_x)
+            cpa_pos = get_interner(geom).position(x= sign*cpa_x)
             cpa_place = geom.structure.Placement(None, volume = cpa_volume, pos=cpa_pos)
             children.append(cpa_place)
             
-        shape = geom.shapes.Box(self.name,
-                                dx = 0.5*tpcs_xtot + cpa_width,
-                                dy = 0.5*tpcs_ytot, # + self.field_cage_thickness,
-                                dz = 0.5*tpcs_ztot) # + self.field_cage_thickness)
+        dx, dy, dz = envelope(geom, children)
+        shape = geom.shapes.Box(self.name, dx = dx, dy = dy, dz = dz)
 
         top = geom.structure.Volume('vol'+self.name, material=self.material, shape=shape, 
                                     placements = children)
@@ -209,12 +210,12 @@ class WireFrameOne(gegede.builder.Builder):
         bar = self.make_bar_tube(volname, geom, dim[0], dim[1], length)
         off = 0.5*(width - dim[1])
         if rot: 
-            rot = geom.structure.Rotation(None, x=Q(rot))
-            posp = geom.structure.Position(None, z=+1*off)
-            posm = geom.structure.Position(None, z=-1*off)
+            rot = get_interner(geom).rotation(x=Q(rot))
+            posp = get_interner(geom).position(z=+1*off)
+            posm = get_interner(geom).position(z=-1*off)
         else:
-            posp = geom.structure.Position(None, y=+1*off)
-            posm = geom.structure.Position(None, y=-1*off)
+            posp = get_interner(geom).position(y=+1*off)
+            posm = get_interner(geom).position(y=-1*off)
 
         return (geom.structure.Placement(None, volume=bar, pos=posp, rot=rot),
                 geom.structure.Placement(None, volume=bar, pos=posm, rot=rot))
@@ -232,7 +233,7 @@ class WireFrameOne(gegede.builder.Builder):
             abs_cross_center = center - cross_center
             volname = 'vol%sCross%d' % (self.name, count)
             bar = self.make_bar_tube(volname, geom, self.cross_dim[0], self.cross_dim[1], cross_width)
-            pos = geom.structure.Position(None, y=abs_cross_center)
+            pos = get_interner(geom).position(y=abs_cross_center)
             place = geom.structure.Placement(None, volume=bar, pos=pos)
             children.append(place)
 
@@ -260,37 +261,30 @@ class WireFrame(gegede.builder.Builder):
     def construct(self, geom):
         children = list()
 
-        maxyext = Q('0 m')
-
         # small
         s_volume = self.get_builder(0).get_volume(0)
-        s_shape = geom.get_shape(s_volume.shape)
-        pos = geom.structure.Position(None, y=self.small_center)
+        pos = get_interner(geom).position(y=self.small_center)
         place = geom.structure.Placement(None, volume=s_volume, pos=pos)
         children.append(place)
-        maxyext = max(maxyext, abs(self.small_center - s_shape.dy))
 
         # medium
         m_volume = self.get_builder(1).get_volume(0)
-        m_shape = geom.get_shape(m_volume.shape)
-        pos = geom.structure.Position(None, y=self.medium_center)
+        pos = get_interner(geom).position(y=self.medium_center)
         place = geom.structure.Placement(None, volume=m_volume, pos=pos)
         children.append(place)
-        maxyext = max(maxyext, self.medium_center + m_shape.dy)
 
         # large
         l_volume = self.get_builder(2).get_volume(0)
-        l_shape = geom.get_shape(l_volume.shape)
-        posm = geom.structure.Position(None, z = -1*self.large_offset, y=self.large_center)
-        posp = geom.structure.Position(None, z = +1*self.large_offset, y=self.large_center)
+        posm = get_interner(geom).position(z = -1*self.large_offset, y=self.large_center)
+        posp = get_interner(geom).position(z = +1*self.large_offset, y=self.large_center)
         children += [
             geom.structure.Placement(None, volume=l_volume, pos=posm),
             geom.structure.Placement(None, volume=l_volume, pos=posp)
         ]
-        maxyext = max(maxyext, self.large_center + l_shape.dy)
 
         # envelope
-        env_shape = geom.shapes.Box(None, dx=l_shape.dx, dy = maxyext, dz = self.large_offset + l_shape.dz)
+        dx, dy, dz = envelope(geom, children)
+        env_shape = geom.shapes.Box(None, dx=dx, dy=dy, dz=dz)
         env_vol = geom.structure.Volume('vol' + self.name, material = self.material,
                                         shape=env_shape, placements = children)
         self.add_volume(env_vol)
@@ -5,6 +5,9 @@ Some builders of simplified 35t geometry
 import gegede.builder
 from gegede import Quantity as Q
 
+from lbne.geo.transforms import get_interner
+
+
 class Cryostat(gegede.builder.Builder):
     '''Build a simple (incorrect) cryostat.
 
@@ -99,7 +102,7 @@ class Detector(gegede.builder.Builder):
         for b in self.builders:
             vol = b.get_volume(0)
             place = gs.Placement(None, volume = vol,
-                                 pos = gs.Position(None, y = arrow + 0.5 * b.length))
+                                 pos = get_interner(geom).position(y = arrow + 0.5 * b.length))
             arrow += b.length
             placements.append(place)
 
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+'''Cosmic muon acceptance and track lengths.
+
+Muon tracks start on a horizontal "sky" plane just above the detector
+enclosure, which extends past its footprint by a margin on each side.
+Y is up.  The zenith angle follows an intensity of cos^n and, since
+the flux crosses a horizontal plane, cos(theta) is drawn with density
+cos^(n+1).  The azimuth is uniform and the energy follows a power law
+E^-gamma between two limits.  Tracks are straight lines.
+
+Each track is intersected with oriented boxes grouped as:
+
+ - tpc :: the volTPC* volumes, one column of track lengths per node
+
+ - cpa :: the CPA planes
+
+ - frame :: the wire frame bars (as their Box slabs)
+
+Only tracks crossing any box are kept.  For each the CosmicResult
+holds the start point, direction, energy, length in each TPC node and
+a bit set of the groups crossed (see FLAGS).  Its tables count the
+tracks crossing each TPC, each pair of TPCs and each combination of
+crossing the CPA and the frame, relative to the number generated.
+Batches of tracks are drawn and intersected in a process pool, batch i
+seeded by (seed, i).
+'''
+
+import numpy
+
+from lbne.geo.flat import Flat
+from lbne.geo.bounds import get_bounds
+from lbne.geo.decompose import node_boxes
+from lbne.geo.navigate import box_spans
+from lbne.geo.vertex import random_state
+
+ENCLOSURE = r'^volDetEnclosure$'
+GROUPS = (('tpc', r'^volTPC'), ('cpa', r'^volCPA'), ('frame', r'^volWF_.*(Side|Cross\d+)$'))
+
+# bits of CosmicResult.flags
+FLAGS = dict(tpc = 1, cpa = 2, frame = 4)
+
+
+def chords(points, dirs, rot, center, half):
+    '''Return (T,B) array of the length of each of the T rays (<points>,
+    unit <dirs>) inside each of the B oriented boxes (<rot>, <center>,
+    <half>), counting only the part ahead of the ray start.
+    '''
+    enter, leave = box_spans(points, dirs, rot, center, half)
+    return numpy.maximum(leave - enter, 0.0)
+
+
+class CosmicEngine(object):
+    '''Generate cosmic muon tracks and intersect them with the detector.
+
+    Everything needed is kept in numpy arrays so the engine can be
+    sent to worker processes.
+    '''
+
+    def __init__(self, geom, enclosure = ENCLOSURE, groups = GROUPS, margin = None,
+                 zenith_power = 2.0, energy_index = 2.7, energy_range = (1.0, 1000.0)):
+        '''Prepare to shoot muons from above the node matching
+        <enclosure> (default the nearest node holding all boxes) of
+        <geom> (constructed geometry or Flat) at the boxes of the nodes
+        matching the patterns of <groups>, a sequence of (name,
+        pattern).  The sky plane extends <margin> (LUNIT, default the
+        enclosure height) past the enclosure on each side.  Tracks
+        follow cos^<zenith_power> in zenith angle and
+        E^-<energy_index> over <energy_range> (GeV) in energy.
+        '''
+        flat = geom if isinstance(geom, Flat) else Flat(geom)
+
+        rot, center, half, group, column = [], [], [], [], []
+        self.groups = [name for name, pattern in groups]
+        self.tpc_paths = list()
+        for gind, (name, pattern) in enumerate(groups):
+            for node in flat.find(pattern):
+                boxes = node_boxes(flat, node)
+                if boxes is None:
+                    raise ValueError('Shape of "%s" is not made of Boxes' % flat.paths[node])
+                col = -1
+                if name == 'tpc':
+                    col = len(self.tpc_paths)
+                    self.tpc_paths.append(flat.paths[node])
+                for r, c, h in boxes:
+                    rot.append(r)
+                    center.append(c)
+                    half.append(h)
+                    group.append(gind)
+                    column.append(col)
+        if not rot:
+            raise ValueError('No volumes to intersect')
+        self.rot = numpy.array(rot)
+        self.center = numpy.array(center)
+        self.half = numpy.array(half)
+        self.group = numpy.array(group)
+        self.column = numpy.array(column)
+
+        # one box around all the others to skip tracks missing them all
+        ext = numpy.einsum('bij,bj->bi', numpy.abs(self.rot), self.half)
+        blo, bhi = (self.center - ext).min(axis=0), (self.center + ext).max(axis=0)
+        self.envelope = (numpy.identity(3)[None], 0.5*(blo + bhi)[None], 0.5*(bhi - blo)[None])
+
+        glo, ghi = get_bounds(flat.geom).nodes(flat)
+        found = flat.find(enclosure)
+        if len(found):
+            lo, hi = glo[found[0]], ghi[found[0]]
+        else:
+            lo, hi = blo, bhi
+        if margin is None:
+            margin = hi[1] - lo[1]
+        self.plane_height = hi[1]
+        self.plane_lo = numpy.array([lo[0] - margin, lo[2] - margin])
+        self.plane_hi = numpy.array([hi[0] + margin, hi[2] + margin])
+        self.plane_area = numpy.prod(self.plane_hi - self.plane_lo)
+
+        self.zenith_power = float(zenith_power)
+        self.energy_index = float(energy_index)
+        self.energy_range = tuple(float(e) for e in energy_range)
+
+    def tracks(self, count, rng):
+        '''
+        Return (points, dirs, energies) of <count> tracks drawn from <rng>.
+        '''
+        xz = self.plane_lo + (self.plane_hi - self.plane_lo) * rng.random_sample((count, 2))
+        points = numpy.empty((count, 3))
+        points[:,0], points[:,1], points[:,2] = xz[:,0], self.plane_height, xz[:,1]
+
+        cos = rng.random_sample(count) ** (1.0 / (self.zenith_power + 2.0))
+        sin = numpy.sqrt(1.0 - cos**2)
+        phi = 2*numpy.pi * rng.random_sample(count)
+        dirs = numpy.column_stack([sin*numpy.cos(phi), -cos, sin*numpy.sin(phi)])
+
+        emin, emax = self.energy_range
+        u = rng.random_sample(count)
+        if self.energy_index == 1.0:
+            energies = emin * (emax / emin) ** u
+        else:
+            p = 1.0 - self.energy_index
+            energies = (emin**p + u * (emax**p - emin**p)) ** (1.0 / p)
+        return points, dirs, energies
+
+    def intersect(self, points, dirs):
+        '''Return (lengths, flags) for tracks (<points>, <dirs>):
+        (T,N) track length in each of the N TPC nodes and the bit set
+        (see FLAGS) of groups crossed.
+        '''
+        near = chords(points, dirs, *self.envelope)[:,0] > 0.0
+        lengths = numpy.zeros((len(points), len(self.rot)))
+        lengths[near] = chords(points[near], dirs[near], self.rot, self.center, self.half)
+        ntpc = len(self.tpc_paths)
+        tpc = numpy.zeros((len(points), ntpc))
+        for col in range(ntpc):
+            tpc[:,col] = lengths[:,self.column == col].sum(axis=1)
+        flags = numpy.zeros(len(points), dtype=numpy.uint8)
+        for gind, name in enumerate(self.groups):
+            if name in FLAGS:
+                hit = (lengths[:,self.group == gind] > 0.0).any(axis=1)
+                flags |= numpy.where(hit, FLAGS[name], 0).astype(numpy.uint8)
+        return tpc, flags
+
+    def batch(self, count, rng):
+        '''
+        Return CosmicResult for <count> tracks drawn from <rng>.
+        '''
+        points, dirs, energies = self.tracks(count, rng)
+        lengths, flags = self.intersect(points, dirs)
+        keep = flags != 0
+        return CosmicResult(self.tpc_paths, count, self.plane_area,
+                            points[keep].astype(numpy.float32), dirs[keep].astype(numpy.float32),
+                            energies[keep].astype(numpy.float32), lengths[keep].astype(numpy.float32),
+                            flags[keep])
+
+    def run(self, count, seed = 0, processes = None, batch = 5000):
+        '''Return CosmicResult for <count> tracks drawn in batches of
+        <batch> by <processes> worker processes (default one per CPU,
+        run in this process if 1).
+        '''
+        if count <= 0:
+            raise ValueError('Number of tracks must be positive, got %d' % count)
+        sizes = [min(batch, count - start) for start in range(0, count, batch)]
+        tasks = [(seed, stream, size) for stream, size in enumerate(sizes)]
+        if processes == 1:
+            _init(self)
+            return CosmicResult.merge(map(_work, tasks))
+
+        import multiprocessing
+        pool = multiprocessing.Pool(processes, _init, (self,))
+        try:
+            parts = pool.map(_work, tasks)
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+        return CosmicResult.merge(parts)
+
+
+# per worker process state set by _init()
+_state = dict()
+
+
+def _init(engine):
+    _state['engine'] = engine
+
+
+def _work(task):
+    seed, stream, count = task
+    return _state['engine'].batch(count, random_state(seed, stream))
+
+
+class CosmicResult(object):
+    '''Tracks crossing the detector out of those generated.
+
+    Per kept track arrays: .points and .dirs (K,3), .energies (K,),
+    .lengths (K,N) in each of the N TPC nodes named in .tpc_paths and
+    .flags (K,) bits of FLAGS.  Also .generated tracks over a sky
+    plane of .plane_area (LUNIT^2).
+    '''
+
+    fields = ('points', 'dirs', 'energies', 'lengths', 'flags')
+
+    def __init__(self, tpc_paths, generated, plane_area, points, dirs, energies, lengths, flags):
+        self.tpc_paths = list(tpc_paths)
+        self.generated = int(generated)
+        self.plane_area = float(plane_area)
+        self.points = points
+        self.dirs = dirs
+        self.energies = energies
+        self.lengths = lengths
+        self.flags = flags
+
+    @classmethod
+    def merge(cls, parts):
+        '''
+        Return one CosmicResult holding all of <parts>.
+        '''
+        if not parts:
+            raise ValueError('No results to merge')
+        first = parts[0]
+        arrays = [numpy.concatenate([getattr(p, f) for p in parts]) for f in cls.fields]
+        return cls(first.tpc_paths, sum([p.generated for p in parts]), first.plane_area, *arrays)
+
+    def __len__(self):
+        return len(self.flags)
+
+    def tables(self):
+        '''Return dictionary of acceptance tables, counts over the
+        number generated:
+
+        - tpc :: (N,) crossing each TPC node
+
+        - tpc_pairs :: (N,N) crossing both of two TPC nodes
+
+        - multiplicity :: (N+1,) crossing that many TPC nodes, the
+          first holding all tracks crossing none, kept or not
+
+        - cpa_frame :: (2,2) crossing any TPC, indexed by crossing
+          the CPA and crossing the frame
+
+        - mean_length :: (N,) mean length in each TPC node of tracks crossing it
+        '''
+        hit = self.lengths > 0.0
+        ntpc = len(self.tpc_paths)
+        gen = float(self.generated)
+        intpc = (self.flags & FLAGS['tpc']) != 0
+        cpa = ((self.flags & FLAGS['cpa']) != 0)[intpc].astype(int)
+        frame = ((self.flags & FLAGS['frame']) != 0)[intpc].astype(int)
+        counts = hit.sum(axis=0)
+        multiplicity = numpy.bincount(hit.sum(axis=1), minlength=ntpc + 1)
+        multiplicity[0] = self.generated - numpy.count_nonzero(intpc)
+        with numpy.errstate(invalid='ignore'):
+            mean = numpy.where(counts, self.lengths.sum(axis=0) / numpy.maximum(counts, 1), 0.0)
+        return dict(
+            tpc = counts / gen,
+            tpc_pairs = numpy.dot(hit.T.astype(float), hit.astype(float)) / gen,
+            multiplicity = multiplicity / gen,
+            cpa_frame = numpy.bincount(2*cpa + frame, minlength=4).reshape(2, 2) / gen,
+            mean_length = mean,
+        )
+
+    def save(self, filename):
+        '''
+        Write the tracks and tables to the ".npz" <filename>.
+        '''
+        tables = dict([('table_' + k, v) for k, v in self.tables().items()])
+        arrays = dict([(f, getattr(self, f)) for f in self.fields])
+        arrays.update(tables)
+        numpy.savez_compressed(filename, tpc_paths = numpy.array(self.tpc_paths),
+                               generated = self.generated, plane_area = self.plane_area, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        '''
+        Return the CosmicResult saved to <filename>.
+        '''
+        dat = numpy.load(filename)
+        return cls(list(dat['tpc_paths']), int(dat['generated']), float(dat['plane_area']),
+                   *[dat[f] for f in cls.fields])
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+'''Rewrite Boolean shapes into equivalent sets of primitive shapes.
+
+The builders make hollow boxes (frame bars, field cages) as a Box
+minus a Box.  Navigating Booleans is expensive so this pass replaces
+each volume of such a shape with Box "slab" volumes of the same
+material which exactly tile it and which are placed directly in
+every mother of the original volume:
+
+ - 6 slabs for a closed shell (hole inside the outer box on all axes)
+ - 4 slabs for an open tube (hole goes through along one axis)
+ - 2 slabs for a pair of walls (hole goes through along two axes)
+'''
+
+import numpy
+
+from gegede import Quantity as Q
+
+from lbne.geo.flat import Flat, LUNIT, local_transform
+from lbne.geo.shapes import get_shape, boolean_transform, box_half
+from lbne.geo.transforms import get_interner
+
+# relative tolerance for deciding if faces coincide
+EPSILON = 1e-9
+
+
+def box_slabs(geom, shape):
+    '''Return list of (half, center) arrays of Boxes which exactly tile
+    the Boolean <shape> in its own frame.  Return None if <shape> is
+    not an axis-aligned Box minus a Box.
+    '''
+    shape = get_shape(geom, shape)
+    if type(shape).__name__ != 'Boolean' or shape.type != 'subtraction':
+        return None
+    first = get_shape(geom, shape.first)
+    second = get_shape(geom, shape.second)
+    if type(first).__name__ != 'Box' or type(second).__name__ != 'Box':
+        return None
+    rot, pos = boolean_transform(geom, shape)
+    if numpy.count_nonzero(rot) != 3:
+        return None
+
+    a = box_half(first)
+    b = numpy.dot(numpy.abs(rot), box_half(second))
+    eps = EPSILON * a.max()
+    lo, hi = -a.copy(), a.copy()
+    hole_lo, hole_hi = pos - b, pos + b
+
+    closed = list()
+    for axis in range(3):
+        if hole_lo[axis] <= lo[axis] + eps and hole_hi[axis] >= hi[axis] - eps:
+            continue            # hole goes all the way through
+        if hole_lo[axis] >= lo[axis] - eps and hole_hi[axis] <= hi[axis] + eps:
+            closed.append(axis)
+            continue
+        return None             # partial overlap, not a pattern we know
+    if len(closed) == 3 and numpy.any(hole_hi <= hole_lo):
+        return None
+
+    slabs = list()
+    for axis in closed:
+        for wlo, whi in [(lo[axis], hole_lo[axis]), (hole_hi[axis], hi[axis])]:
+            if whi - wlo <= eps:
+                continue
+            slo, shi = lo.copy(), hi.copy()
+            slo[axis], shi[axis] = wlo, whi
+            slabs.append((0.5*(shi - slo), 0.5*(shi + slo)))
+        lo[axis], hi[axis] = max(lo[axis], hole_lo[axis]), min(hi[axis], hole_hi[axis])
+    return slabs
+
+
+def node_boxes(flat, node):
+    '''Return list of (rot, center, half) of the oriented Boxes, in the
+    top frame of the Flat <flat>, which make up the shape of <node>:
+    the Box itself or the slabs of a Box-minus-Box (see box_slabs()).
+    Return None for other shapes.
+    '''
+    shape = flat.shape(node)
+    if shape is None:
+        return None
+    if type(shape).__name__ == 'Box':
+        slabs = [(box_half(shape), numpy.zeros(3))]
+    else:
+        slabs = box_slabs(flat.geom, shape)
+    if slabs is None:
+        return None
+    rot, pos = flat.rot[node], flat.pos[node]
+    return [(rot, numpy.dot(rot, center) + pos, half) for half, center in slabs]
+
+
+def decompose(geom, top = None):
+    '''Replace every volume below <top> (default world) which has a
+    Box-minus-Box shape and no daughters with its Box slabs.
+
+    Return list of names of the replaced volumes.
+    '''
+    store = geom.store.structure
+    flat = Flat(geom, top)
+    replaced = list()
+    for volname in sorted(set(flat.volumes)):
+        vol = store[volname]
+        if vol.shape is None or vol.placements:
+            continue
+        slabs = box_slabs(geom, vol.shape)
+        if not slabs:
+            continue
+
+        mothers = set([flat.volumes[flat.parent[i]] for i in flat.find(volname)
+                       if flat.parent[i] >= 0])
+        if not mothers:
+            continue
+
+        slab_vols = list()
+        for count, (half, center) in enumerate(slabs):
+            name = '%s_slab%d' % (vol.shape, count)
+            shape = geom.shapes.Box(name, *[Q(h, LUNIT) for h in half])
+            sv = geom.structure.Volume('%s_slab%d' % (volname, count),
+                                       material = vol.material, shape = shape)
+            slab_vols.append((sv, center))
+
+        for momname in sorted(mothers):
+            mom = store[momname]
+            placements = list()
+            for pname in mom.placements:
+                place = store[pname]
+                if place.volume != volname:
+                    placements.append(pname)
+                    continue
+                rot, pos = local_transform(store, place)
+                for sv, center in slab_vols:
+                    where = numpy.dot(rot, center) + pos
+                    spos = get_interner(geom).position(*where)
+                    splace = geom.structure.Placement(None, volume = sv, pos = spos, rot = place.rot)
+                    placements.append(splace.name)
+            store[momname] = mom._replace(placements = placements)
+        replaced.append(volname)
+    return replaced
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+'''A deterministic fingerprint of a constructed geometry.
+
+The fingerprint is a SHA-256 digest over the tree of volumes below the
+world: each volume hashes its name, its material, its shape and, in
+order, each placement's transform and daughter volume hash.  Materials
+and shapes hash their parameters and constituents the same way.  As
+exports write every material of the store, used or not, all of them
+are hashed too, in order of name.
+
+Names which gegede makes up for objects created without one (like
+"Box000123") are left out so the fingerprint does not depend on the
+order in which builders made things.  Quantities are hashed in base
+units to 10 significant digits to absorb round-off.
+
+Exported files carry the fingerprint (see lbne.geo.main) which
+read_fingerprint() recovers.
+'''
+
+import re
+import json
+import struct
+import hashlib
+
+TAG = 'lbne-geo-fingerprint'
+_tag_rx = re.compile(TAG + r': ([0-9a-f]{64})')
+
+
+def _anonymous_rx(geom):
+    types = list()
+    for part in geom.schema.values():
+        types += list(part.keys())
+    return re.compile(r'^(%s)\d{6}$' % '|'.join(sorted(types)))
+
+
+class Fingerprinter(object):
+    '''
+    Hash the objects of one geometry, remembering each.
+    '''
+
+    def __init__(self, geom):
+        self.geom = geom
+        self._anonymous = _anonymous_rx(geom)
+        self._cache = dict()
+
+    def _digest(self, *parts):
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def _name(self, name):
+        if name is None or self._anonymous.match(name):
+            return ''
+        return name
+
+    def value(self, val):
+        '''
+        Return a canonical string for a parameter value.
+        '''
+        if hasattr(val, 'to_base_units'):
+            base = val.to_base_units()
+            return '%.10g %s' % (base.magnitude, base.units)
+        if isinstance(val, float):
+            return '%.10g' % val
+        if isinstance(val, (list, tuple)):
+            return '[%s]' % ','.join([self.value(v) for v in val])
+        return str(val)
+
+    def _memo(self, kind, name, make):
+        key = (kind, name)
+        if key not in self._cache:
+            self._cache[key] = make()
+        return self._cache[key]
+
+    def matter(self, name):
+        '''
+        Return hash of the matter object <name>.
+        '''
+        def make():
+            obj = self.geom.store.matter[name]
+            parts = ['matter', type(obj).__name__, name]
+            for field, val in zip(obj._fields[1:], obj[1:]):
+                if isinstance(val, (list, tuple)):
+                    # components: (name, amount) referring to other matter
+                    val = [(self.matter(v[0]) if v[0] in self.geom.store.matter else v[0], v[1])
+                           for v in val]
+                parts += [field, self.value(val)]
+            return self._digest(*parts)
+        return self._memo('matter', name, make)
+
+    def transform(self, name):
+        '''
+        Return a canonical string for the Position or Rotation <name>, which may be None.
+        '''
+        if name is None:
+            return 'null'
+        obj = self.geom.store.structure[name]
+        return '%s(%s)' % (type(obj).__name__, ','.join([self.value(v) for v in obj[1:]]))
+
+    def shape(self, name):
+        '''
+        Return hash of the shape <name>.
+        '''
+        def make():
+            obj = self.geom.store.shapes[name]
+            parts = ['shape', type(obj).__name__, self._name(name)]
+            for field, val in zip(obj._fields[1:], obj[1:]):
+                if type(obj).__name__ == 'Boolean':
+                    if field in ('first', 'second'):
+                        val = self.shape(val)
+                    elif field in ('pos', 'rot'):
+                        val = self.transform(val)
+                parts += [field, self.value(val)]
+            return self._digest(*parts)
+        return self._memo('shape', name, make)
+
+    def volume(self, name):
+        '''
+        Return hash of the logical volume <name> and all below it.
+        '''
+        def make():
+            store = self.geom.store.structure
+            vol = store[name]
+            parts = ['volume', self._name(name),
+                     self.matter(vol.material) if vol.material else '',
+                     self.shape(vol.shape) if vol.shape else '',
+                     self.value(vol.params or [])]
+            for pname in vol.placements or []:
+                place = store[pname]
+                parts += ['placement', self._name(pname), self.transform(place.pos),
+                          self.transform(place.rot), self.volume(place.volume)]
+            return self._digest(*parts)
+        return self._memo('volume', name, make)
+
+
+def fingerprint(geom, top = None):
+    '''Return the hex fingerprint of the geometry <geom> below <top>
+    (default world) and of all the matter of <geom>.
+    '''
+    top = top or geom.world
+    if hasattr(top, 'name'):
+        top = top.name
+    fpr = Fingerprinter(geom)
+    parts = [fpr.volume(top)] + [fpr.matter(name) for name in sorted(geom.store.matter)]
+    return fpr._digest(*parts)
+
+
+def comment(fp):
+    '''
+    Return the text which marks a file as holding fingerprint <fp>.
+    '''
+    return ' %s: %s ' % (TAG, fp)
+
+
+def read_fingerprint(filename, head = 4096):
+    '''Return the fingerprint recorded in an exported GDML or binary
+    glTF file, or None.  Only the start of a GDML file is read.
+    '''
+    with open(filename, 'rb') as fp:
+        start = fp.read(head)
+        if start[:4] == b'glTF':
+            fp.seek(12)
+            jlen, jtype = struct.unpack('<I4s', fp.read(8))
+            doc = json.loads(fp.read(jlen).decode('utf-8'))
+            return doc.get('asset', {}).get('extras', {}).get('fingerprint')
+    match = _tag_rx.search(start.decode('utf-8', 'replace'))
+    if match:
+        return match.group(1)
+    return None
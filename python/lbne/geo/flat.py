@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+'''Flatten a constructed geometry into arrays of physical placements.
+
+GeGeDe keeps a geometry as a tree of logical volumes holding named
+placements.  Anything that needs to know where a volume actually ends
+up in space has to walk that tree and compose transforms.  The Flat
+object does that walk once and holds the result as numpy arrays, one
+row per physical node ("touchable"), in depth-first order so that the
+nodes below any node form a contiguous range.
+
+All lengths are plain floats in units of LUNIT (cm, as for GDML export).
+
+Rotations follow the GDML convention: a Rotation with angles (x,y,z)
+gives R = Rz*Ry*Rx and the daughter frame is placed in its mother
+with the inverse of R.
+'''
+
+import re
+import numpy
+
+LUNIT = 'cm'
+AUNIT = 'radian'
+
+
+def length(q):
+    '''
+    Return the Quantity <q> as a float in LUNIT.
+    '''
+    return q.to(LUNIT).magnitude
+
+
+def rotation_matrix(rot):
+    '''Return the 3x3 matrix taking daughter coordinates to mother
+    coordinates for the gegede Rotation <rot> (or None).
+    '''
+    if rot is None:
+        return numpy.identity(3)
+    ret = numpy.identity(3)
+    for axis, angle in enumerate((rot.x, rot.y, rot.z)):
+        a = angle.to(AUNIT).magnitude
+        if a == 0.0:
+            continue
+        c, s = numpy.cos(a), numpy.sin(a)
+        j, k = (axis+1)%3, (axis+2)%3
+        one = numpy.identity(3)
+        one[j,j] = one[k,k] = c
+        one[j,k], one[k,j] = -s, s
+        ret = numpy.dot(one, ret)
+    # snap the round-off from multiples of 90 degrees
+    ret[numpy.abs(ret) < 1e-12] = 0.0
+    return ret.T
+
+
+def rotation_angles(matrix):
+    '''Return the (x,y,z) angles in degrees of a Rotation which gives
+    the daughter-to-mother <matrix>.  This inverts rotation_matrix().
+    '''
+    a = numpy.asarray(matrix).T  # = Rz*Ry*Rx
+    cy = numpy.hypot(a[0,0], a[1,0])
+    y = numpy.arctan2(-a[2,0], cy)
+    if cy > 1e-12:
+        x = numpy.arctan2(a[2,1], a[2,2])
+        z = numpy.arctan2(a[1,0], a[0,0])
+    else:                       # gimbal lock, put it all in x
+        x = numpy.arctan2(-a[1,2], a[1,1])
+        z = 0.0
+    return tuple(numpy.degrees([x, y, z]))
+
+
+def local_transform(store, place):
+    '''Return (rot, pos) giving the transform of placement <place>
+    (name or object) into its mother frame.
+    '''
+    if isinstance(place, type("")):
+        place = store[place]
+    rot = rotation_matrix(store[place.rot] if place.rot else None)
+    pos = numpy.zeros(3)
+    if place.pos:
+        p = store[place.pos]
+        pos = numpy.array([length(p.x), length(p.y), length(p.z)])
+    return rot, pos
+
+
+class Flat(object):
+    '''The physical nodes of a geometry below a top volume.
+
+    Per-node data members, all indexed by node number:
+
+    .paths - path names like "volA/volB/volC:1" where ":N" marks the
+    Nth copy of a volume in the same mother (first copy unmarked)
+
+    .volumes - logical volume names
+
+    .placements - placement names (None for the top node)
+
+    .parent - index of the mother node (-1 for the top node)
+
+    .depth - number of steps from the top node
+
+    .end - one past the last node below this one
+
+    .lrot, .lpos - transform into the mother frame
+
+    .rot, .pos - transform into the top frame
+    '''
+
+    def __init__(self, geom, top = None):
+        self.geom = geom
+        store = geom.store.structure
+        top = top or geom.world
+        if hasattr(top, 'name'):
+            top = top.name
+
+        paths, volumes, placements, parent, depth = [], [], [], [], []
+        lrot, lpos, end = [], [], []
+
+        def walk(volname, path, place, mother, level):
+            me = len(volumes)
+            paths.append(path)
+            volumes.append(volname)
+            placements.append(place)
+            parent.append(mother)
+            depth.append(level)
+            end.append(None)
+            if place is None:
+                r, p = numpy.identity(3), numpy.zeros(3)
+            else:
+                r, p = local_transform(store, place)
+            lrot.append(r)
+            lpos.append(p)
+
+            copies = dict()
+            for pname in store[volname].placements or []:
+                daughter = store[pname].volume
+                copy = copies.get(daughter, 0)
+                copies[daughter] = copy + 1
+                dpath = path + '/' + daughter
+                if copy:
+                    dpath += ':%d' % copy
+                walk(daughter, dpath, pname, me, level + 1)
+            end[me] = len(volumes)
+
+        walk(top, top, None, -1, 0)
+
+        self.paths = paths
+        self.volumes = volumes
+        self.placements = placements
+        self.parent = numpy.array(parent, dtype=int)
+        self.depth = numpy.array(depth, dtype=int)
+        self.end = numpy.array(end, dtype=int)
+        self.lrot = numpy.array(lrot)
+        self.lpos = numpy.array(lpos)
+        self.rot = numpy.empty_like(self.lrot)
+        self.pos = numpy.empty_like(self.lpos)
+        self.update()
+
+    def __len__(self):
+        return len(self.volumes)
+
+    def update(self, first = 0, last = None):
+        '''Recompute global transforms of nodes in [first,last) from
+        their local ones.  Mothers must already be up to date.
+        '''
+        if last is None:
+            last = len(self)
+        for ind in range(first, last):
+            mom = self.parent[ind]
+            if mom < 0:
+                self.rot[ind] = self.lrot[ind]
+                self.pos[ind] = self.lpos[ind]
+                continue
+            self.rot[ind] = numpy.dot(self.rot[mom], self.lrot[ind])
+            self.pos[ind] = numpy.dot(self.rot[mom], self.lpos[ind]) + self.pos[mom]
+
+    def find(self, entry):
+        '''Return array of indices of nodes whose volume name matches
+        <entry>.  An exact name is tried first, then a regular
+        expression search.
+        '''
+        ret = [i for i,v in enumerate(self.volumes) if v == entry]
+        if not ret:
+            rx = re.compile(entry)
+            ret = [i for i,v in enumerate(self.volumes) if rx.search(v)]
+        return numpy.array(ret, dtype=int)
+
+    def shape(self, index):
+        '''
+        Return the shape object of the volume at node <index>.
+        '''
+        vol = self.geom.store.structure[self.volumes[index]]
+        if vol.shape is None:
+            return None
+        return self.geom.store.shapes[vol.shape]
+
+    def to_global(self, index, points):
+        '''
+        Transform (N,3) <points> from the frame of node <index> to the top frame.
+        '''
+        points = numpy.asarray(points, dtype=float)
+        return numpy.dot(points, self.rot[index].T) + self.pos[index]
+
+    def to_local(self, index, points):
+        '''
+        Transform (N,3) <points> from the top frame to the frame of node <index>.
+        '''
+        points = numpy.asarray(points, dtype=float)
+        return numpy.dot(points - self.pos[index], self.rot[index])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+'''Construct only the part of the builder graph a target needs.
+
+gegede.main.generate() constructs every builder reachable from the
+world.  A Session configures the whole graph (which is cheap) but
+calls construct() only for the builders below a requested target and
+for the prerequisites they share with the rest of the graph, by
+default the "materials" builder.  What was constructed stays in the
+session's one geometry so later requests only construct what is new:
+
+  session = Session(['config/35ton.cfg'])
+  drift = session.geometry('LongDrift')       # LongDrift and below
+  det = session.geometry('volThirtyFiveTon')  # adds the rest of the detector
+
+A target is a builder name or the name of the volume a builder makes
+(following the "vol<Name>" convention).  Any other volume name makes
+the session construct the world first.
+'''
+
+import gegede.configuration
+import gegede.interp
+import gegede.builder
+from gegede.construct import Geometry
+
+from lbne.geo import prune
+
+
+class Session(object):
+    '''
+    Demand driven construction from one configuration.
+    '''
+
+    def __init__(self, filenames, world_name = None, prerequisites = ('materials',)):
+        '''Configure the builders from the configuration <filenames>
+        below <world_name> (default the first section).  The builders
+        named in <prerequisites> are constructed before any target
+        when they exist in the graph.
+        '''
+        cfg = gegede.configuration.configure(filenames)
+        self.world = gegede.interp.make_builder(cfg, world_name)
+        gegede.builder.configure(self.world, cfg)
+        self.geom = Geometry()
+        self.prerequisites = list(prerequisites)
+
+        self.builders = dict()
+        stack = [self.world]
+        while stack:
+            builder = stack.pop()
+            if builder.name not in self.builders:
+                self.builders[builder.name] = builder
+                stack += builder.builders.values()
+
+    def constructed(self):
+        '''
+        Return names of the builders constructed so far.
+        '''
+        return sorted([n for n, b in self.builders.items() if hasattr(b, '_constructed')])
+
+    def builder(self, target):
+        '''Return the builder for <target>, a builder name or
+        "vol<Name>", or None if there is none.
+        '''
+        for name in (target, target[3:] if target.startswith('vol') else None):
+            if name in self.builders:
+                return self.builders[name]
+        return None
+
+    def construct(self, target = None):
+        '''Construct what <target> (default the world builder) needs,
+        if not yet done, and return the name of its volume.
+        '''
+        for name in self.prerequisites:
+            if name in self.builders:
+                gegede.builder.construct(self.builders[name], self.geom)
+
+        builder = self.builder(target) if target else self.world
+        if builder is not None:
+            gegede.builder.construct(builder, self.geom)
+            volume = builder.get_volume(0).name
+            if target in (None, builder.name, volume):
+                return volume
+
+        # some volume inside a builder
+        gegede.builder.construct(self.world, self.geom)
+        if target not in self.geom.store.structure:
+            raise ValueError('No builder or volume "%s"' % target)
+        return target
+
+    def geometry(self, target = None):
+        '''Return a new self-contained geometry with the volume of
+        <target> (default the world builder) as world, constructing
+        only what it needs (see lbne.geo.prune.extract()).
+        '''
+        return prune.extract(self.geom, self.construct(target))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+'''A live, in-memory geometry for alignment studies.
+
+The Live object holds the flattened nodes of a constructed geometry
+along with their global bounding boxes and, on demand, the TPC table.
+Placements may be moved in place, per physical node, without
+rebuilding anything: a translation of a node shifts the global
+transform and bounding box of every node below it, which, because
+nodes are kept in depth-first order, is a contiguous range.  Many
+nodes are moved with one vectorized prefix sum.
+
+Changes can be written back to the gegede geometry with save().
+'''
+
+import re
+import numpy
+from contextlib import contextmanager
+
+from lbne.geo.flat import Flat, rotation_angles, local_transform
+from lbne.geo.bounds import get_bounds
+from lbne.geo.tpc import TpcTable
+from lbne.geo.transforms import get_interner
+
+
+class Live(object):
+    '''
+    A geometry with movable placements.
+    '''
+
+    def __init__(self, geom, top = None):
+        self.geom = geom
+        self.flat = Flat(geom, top)
+        self.lo, self.hi = get_bounds(geom).nodes(self.flat)
+        self._tpcs = None
+        self._tpc_nodes = None
+
+    def __len__(self):
+        return len(self.flat)
+
+    def select(self, entry):
+        '''Return array of node indices matching <entry>.
+
+        The <entry> may be an index or a sequence of them, or a string
+        which is matched exactly against node paths, then volume names
+        and then as a regular expression against volume names (like
+        Flat.find()).  A string matching no node raises ValueError.
+        '''
+        flat = self.flat
+        if not isinstance(entry, type("")):
+            return numpy.atleast_1d(numpy.asarray(entry, dtype=int))
+        ret = [i for i,p in enumerate(flat.paths) if p == entry]
+        if not ret:
+            ret = [i for i,v in enumerate(flat.volumes) if v == entry]
+        if not ret:
+            rx = re.compile(entry)
+            ret = [i for i,v in enumerate(flat.volumes) if rx.search(v)]
+        if not ret:
+            raise ValueError('No node matches "%s"' % entry)
+        return numpy.array(ret, dtype=int)
+
+    def tpcs(self, **kwds):
+        '''Return the lbne.geo.tpc.TpcTable, kept up to date with any
+        moves.  Keywords are passed to its constructor on first call.
+        '''
+        if self._tpcs is None:
+            self._tpcs = TpcTable(self.flat, **kwds)
+            mask = numpy.zeros(len(self), dtype=bool)
+            mask[self._tpcs.nodes] = True
+            mask[self._tpcs.anodes] = True
+            self._tpc_nodes = mask
+        return self._tpcs
+
+    def translate(self, nodes, deltas):
+        '''Move the <nodes> by <deltas> in their mother frames.
+
+        The <nodes> is anything accepted by select().  The <deltas> is
+        an array of shape (N,3) or (3,) in LUNIT.  A node given more
+        than once moves by the sum of its deltas.  All nodes below a
+        moved node move with it.
+        '''
+        nodes = self.select(nodes)
+        if not len(nodes):
+            return
+        deltas = numpy.asarray(deltas, dtype=float) * numpy.ones((len(nodes), 3))
+        flat = self.flat
+
+        numpy.add.at(flat.lpos, nodes, deltas)
+
+        # global shift of each moved subtree
+        moms = flat.parent[nodes]
+        shift = numpy.einsum('nij,nj->ni', flat.rot[moms], deltas)
+        shift[moms < 0] = deltas[moms < 0]
+
+        # accumulate over the nested, contiguous subtree ranges
+        diff = numpy.zeros((len(flat) + 1, 3))
+        numpy.add.at(diff, nodes, shift)
+        numpy.add.at(diff, flat.end[nodes], -shift)
+        first, last = nodes.min(), flat.end[nodes].max()
+        total = numpy.cumsum(diff[first:last], axis=0)
+
+        flat.pos[first:last] += total
+        self.lo[first:last] += total
+        self.hi[first:last] += total
+
+        if self._tpcs is not None:
+            moved = numpy.any(total != 0.0, axis=1)
+            if numpy.any(moved & self._tpc_nodes[first:last]):
+                self._tpcs.refresh()
+
+    def place(self, nodes, positions):
+        '''
+        Set the <nodes> to absolute <positions> in their mother frames.
+        '''
+        nodes = self.select(nodes)
+        if len(numpy.unique(nodes)) != len(nodes):
+            raise ValueError('Nodes to place must be distinct')
+        positions = numpy.asarray(positions, dtype=float) * numpy.ones((len(nodes), 3))
+        self.translate(nodes, positions - self.flat.lpos[nodes])
+
+    def rotate(self, node, rot):
+        '''Set the rotation matrix of one <node> in its mother frame.
+        This recalculates the subtree node by node.
+        '''
+        node = self.select(node)[0]
+        flat = self.flat
+        flat.lrot[node] = rot
+        first, last = node, flat.end[node]
+        flat.update(first, last)
+        bounds = get_bounds(self.geom)
+        for ind in range(first, last):
+            lo, hi = bounds.volume(flat.volumes[ind])
+            center = numpy.dot(flat.rot[ind], 0.5*(lo + hi)) + flat.pos[ind]
+            half = numpy.dot(numpy.abs(flat.rot[ind]), 0.5*(hi - lo))
+            self.lo[ind], self.hi[ind] = center - half, center + half
+        if self._tpcs is not None and numpy.any(self._tpc_nodes[first:last]):
+            self._tpcs.refresh()
+
+    def state(self):
+        '''
+        Return a copy of the movable state for later restore().
+        '''
+        flat = self.flat
+        return [a.copy() for a in (flat.lrot, flat.lpos, flat.rot, flat.pos, self.lo, self.hi)]
+
+    def restore(self, state):
+        '''
+        Restore a state returned by state().
+        '''
+        flat = self.flat
+        for dst, src in zip((flat.lrot, flat.lpos, flat.rot, flat.pos, self.lo, self.hi), state):
+            dst[...] = src
+        if self._tpcs is not None:
+            self._tpcs.refresh()
+
+    @contextmanager
+    def translated(self, nodes, deltas):
+        '''
+        Context in which <nodes> are moved by <deltas>.
+        '''
+        saved = self.state()
+        self.translate(nodes, deltas)
+        try:
+            yield self
+        finally:
+            self.restore(saved)
+
+    def save(self):
+        '''Write the current local transforms back into the gegede
+        geometry, making new Position and Rotation objects for changed
+        placements.  All copies of a placement must agree.
+        '''
+        flat = self.flat
+        store = self.geom.store.structure
+        byplace = dict()
+        for ind, pname in enumerate(flat.placements):
+            if pname is not None:
+                byplace.setdefault(pname, list()).append(ind)
+
+        for pname, inds in sorted(byplace.items()):
+            lrot, lpos = flat.lrot[inds], flat.lpos[inds]
+            if not (numpy.allclose(lrot, lrot[0]) and numpy.allclose(lpos, lpos[0])):
+                raise ValueError('Copies of placement "%s" were moved differently' % pname)
+            place = store[pname]
+            old = local_transform(store, place)
+            if numpy.allclose(old[0], lrot[0]) and numpy.allclose(old[1], lpos[0]):
+                continue
+            interner = get_interner(self.geom)
+            store[pname] = place._replace(pos = interner.position(*lpos[0]),
+                                          rot = interner.rotation(*rotation_angles(lrot[0])))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+'''Reduce the level of detail (LOD) of a constructed geometry.
+
+A detailed subtree is replaced by its top (envelope) volume filled
+with a homogenized mixture which preserves the mass and elemental
+composition of everything that was inside it.  Daughters matching a
+"keep" pattern (eg, the TPC active volumes) survive and are placed
+directly in the homogenized volume.
+
+Named levels select volumes by the class name of the builder that
+produced them:
+
+ - full :: no change
+
+ - medium :: wire frames become solid and field cages are smeared
+   into the drift volume LAr
+
+ - coarse :: everything but the TPC volumes is smeared into the
+   detector or cryostat
+'''
+
+import re
+from collections import OrderedDict
+
+from gegede import Quantity as Q
+
+from lbne.geo.flat import Flat, rotation_angles
+from lbne.geo.transforms import get_interner
+from lbne.geo import material
+
+LEVELS = OrderedDict(
+    full = [],
+    medium = [('WireFrameOne', None), ('Drift', '^volTPC')],
+    coarse = [('WireFrameOne', None), ('Drift', '^volTPC'),
+              ('Detector', '^volTPC'), ('Cryostat', '^volTPC')],
+)
+
+
+def homogenize(geom, volume, keep = None):
+    '''Replace the contents of the logical <volume> with a homogenized
+    mixture, keeping any descendants whose name matches <keep>.
+
+    Return the new volume object.  The old one is replaced in the
+    geometry store.  If nothing but the kept descendants has mass the
+    volume keeps its own material.
+    '''
+    store = geom.store.structure
+    if hasattr(volume, 'name'):
+        volume = volume.name
+    vol = store[volume]
+    if vol.shape is None:
+        raise ValueError('Can not homogenize assembly volume "%s"' % volume)
+
+    flat = Flat(geom, volume)
+    rx = re.compile(keep) if keep else None
+    kept = list()
+    ind = 1
+    while ind < len(flat):
+        if rx and rx.search(flat.volumes[ind]):
+            kept.append(ind)
+            ind = flat.end[ind] # skip what is below
+            continue
+        ind += 1
+
+    cache = dict()
+    elements = material.element_masses(geom, volume, cache)
+    region = material.volume_capacity(geom, volume)
+    for ind in kept:
+        region -= material.volume_capacity(geom, flat.volumes[ind])
+        for ele, mass in material.element_masses(geom, flat.volumes[ind], cache).items():
+            elements[ele] -= mass
+    total = sum(elements.values())
+
+    if total > 0.0:
+        if region <= 0.0:
+            raise ValueError('No room left to homogenize volume "%s" around what it keeps' % volume)
+        mixname = volume + 'Homogenized'
+        components = [(ele, mass/total) for ele, mass in elements.items() if mass > 0.0]
+        geom.matter.Mixture(mixname, density = Q(total/region, 'g/cc'), components = components)
+    else:
+        mixname = vol.material
+
+    placements = list()
+    for ind in kept:
+        pos = get_interner(geom).position(*flat.pos[ind])
+        rot = get_interner(geom).rotation(*rotation_angles(flat.rot[ind]))
+        place = geom.structure.Placement(None, volume = flat.volumes[ind], pos = pos, rot = rot)
+        placements.append(place.name)
+
+    new = vol._replace(material = mixname, placements = placements)
+    store[volume] = new
+    return new
+
+
+def simplify(geom, builder, level = 'full', homogenize_list = None):
+    '''Reduce the level of detail of the volumes made by <builder> and
+    its sub-builders.
+
+    The <level> names an entry in LEVELS.  Alternatively, an explicit
+    <homogenize_list> of (builder class name, keep pattern) pairs may
+    be given.
+    '''
+    if homogenize_list is None:
+        if level not in LEVELS:
+            raise ValueError('Unknown level of detail: "%s"' % level)
+        homogenize_list = LEVELS[level]
+
+    builders = list()
+    def walk(b):
+        for sb in b.builders.values():
+            walk(sb)
+        if b not in builders:
+            builders.append(b)
+    walk(builder)
+
+    done = set()
+    for clsname, keep in homogenize_list:
+        for b in builders:
+            if type(b).__name__ != clsname:
+                continue
+            for name in b.volumes.keys():
+                if name in done:
+                    continue
+                done.add(name)
+                b.volumes[name] = homogenize(geom, name, keep)
+    return
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+'''Command line export of a geometry with provenance.
+
+This is like gegede-cli for the "gdml" format and adds "glb" (see
+lbne.geo.mesh).  The fingerprint of the geometry (see
+lbne.geo.fingerprint) is written into the output file.  If the output
+file already holds the same fingerprint it is left untouched, keeping
+its modification time, so downstream processing can be skipped.
+
+With --top only the tree below the given volume is constructed and
+exported (see lbne.geo.lazy and lbne.geo.prune).
+'''
+
+import os
+import sys
+import tempfile
+
+from lbne.geo.fingerprint import fingerprint, comment, read_fingerprint
+
+FORMATS = ('gdml', 'glb')
+
+
+def gdml_text(geom, fp):
+    '''
+    Return GDML text for <geom> marked with fingerprint <fp>.
+    '''
+    from lxml import etree
+    import gegede.export.gdml
+    root = gegede.export.gdml.convert(geom)
+    root.insert(0, etree.Comment(comment(fp)))
+    return gegede.export.gdml.dumps(root)
+
+
+def glb_data(geom, fp, **kwds):
+    '''
+    Return binary glTF data for <geom> marked with fingerprint <fp>.
+    '''
+    from lbne.geo import mesh
+    doc, blob = mesh.gltf(geom, **kwds)
+    doc['asset']['extras'] = dict(fingerprint = fp)
+    return mesh.glb_bytes(doc, blob)
+
+
+def write_file(filename, data):
+    '''
+    Write <data> to <filename> whole or not at all.
+    '''
+    outdir = os.path.dirname(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(dir = outdir, prefix = '.' + os.path.basename(filename))
+    try:
+        with os.fdopen(fd, 'wb') as fo:
+            fo.write(data)
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmpname, 0o666 & ~umask)
+        os.rename(tmpname, filename)
+    except:
+        os.unlink(tmpname)
+        raise
+
+
+def export(geom, filename, format = None, force = False):
+    '''Write <geom> to <filename> in the given <format> (default from
+    the file extension) unless the file exists with the same
+    fingerprint and <force> is false.  Return (fingerprint, written).
+    '''
+    format = format or os.path.splitext(filename)[1][1:]
+    if format not in FORMATS:
+        raise ValueError('Unsupported export format: "%s"' % format)
+
+    fp = fingerprint(geom)
+    if not force and os.path.exists(filename) and read_fingerprint(filename) == fp:
+        return fp, False
+
+    if format == 'gdml':
+        data = gdml_text(geom, fp)
+    else:
+        data = glb_data(geom, fp)
+
+    write_file(filename, data)
+    return fp, True
+
+
+def main(argv = None):
+    import argparse
+    import gegede.main
+    parser = argparse.ArgumentParser(description = 'Export a geometry unless unchanged')
+    parser.add_argument("-w", "--world", default=None,
+                        help="World builder name")
+    parser.add_argument("-f", "--format", default=None, choices = FORMATS,
+                        help = "Export format, guess by extension if not given")
+    parser.add_argument("-o", "--output", required=True,
+                        help="File to export to")
+    parser.add_argument("--force", action='store_true',
+                        help="Write even if the output has the same fingerprint")
+    parser.add_argument("--status", action='store_true',
+                        help="Exit with status 3 if the output was left unchanged")
+    parser.add_argument("-m", "--modules", default=None,
+                        help="Comma separated volumes or builders to write as GDML modules next to the output")
+    parser.add_argument("-t", "--top", default=None,
+                        help="Construct and export only the tree below this volume or builder")
+    parser.add_argument("config", nargs='+',
+                        help="Configuration file(s)")
+    args = parser.parse_args(argv)
+
+    if args.top:
+        from lbne.geo.lazy import Session
+        geom = Session(args.config, args.world).geometry(args.top)
+    else:
+        geom = gegede.main.generate(args.config, args.world)
+    if args.modules:
+        from lbne.geo import modular
+        outdir = os.path.dirname(os.path.abspath(args.output))
+        prefix = os.path.splitext(os.path.basename(args.output))[0]
+        written = modular.export(geom, outdir, args.modules.split(','), prefix = prefix, force = args.force)
+        for path, wrote in written:
+            print '%s %s' % ('Wrote' if wrote else 'Unchanged', path)
+        if args.status and not any([w for p, w in written]):
+            return 3
+        return 0
+
+    fp, written = export(geom, args.output, args.format, args.force)
+    if written:
+        print 'Wrote %s with fingerprint %s' % (args.output, fp)
+        return 0
+    print 'Unchanged %s with fingerprint %s' % (args.output, fp)
+    if args.status:
+        return 3
+    return 0
+
+
+if '__main__' == __name__:
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+'''
+Bulk properties of the matter and volumes of a constructed geometry.
+
+Densities are in g/cc, masses in g and volumes in LUNIT cubed (cc).
+'''
+
+from collections import OrderedDict
+
+from lbne.geo import shapes
+
+
+def density(geom, material):
+    '''
+    Return the density of the named <material> in g/cc.
+    '''
+    return geom.store.matter[material].density.to('g/cc').magnitude
+
+
+def atomic_mass(geom, element):
+    '''
+    Return the atomic mass of the named <element> in g/mole.
+    '''
+    return geom.store.matter[element].a.to('g/mole').magnitude
+
+
+def composition(geom, material):
+    '''Return ordered dictionary mapping element name to its mass
+    fraction in the named <material>.
+    '''
+    obj = geom.store.matter[material]
+    typename = type(obj).__name__
+    ret = OrderedDict()
+
+    if typename in ('Element', 'Composition'):
+        ret[material] = 1.0
+        return ret
+
+    if typename == 'Molecule':
+        masses = [(ele, num*atomic_mass(geom, ele)) for ele, num in obj.elements]
+        total = sum([m for e,m in masses])
+        for ele, m in masses:
+            ret[ele] = ret.get(ele, 0.0) + m/total
+        return ret
+
+    if typename == 'Mixture':
+        total = sum([frac for comp, frac in obj.components])
+        for comp, frac in obj.components:
+            for ele, efrac in composition(geom, comp).items():
+                ret[ele] = ret.get(ele, 0.0) + efrac*frac/total
+        return ret
+
+    raise ValueError('Can not determine composition of "%s" of type %s' % (material, typename))
+
+
+def volume_capacity(geom, volume):
+    '''Return the capacity of the logical <volume> shape.  For an
+    assembly this is the sum of the capacities of its daughters.
+    '''
+    store = geom.store.structure
+    if hasattr(volume, 'name'):
+        volume = volume.name
+    vol = store[volume]
+    if vol.shape is not None:
+        return shapes.capacity(geom, vol.shape)
+    return sum([volume_capacity(geom, store[p].volume) for p in vol.placements])
+
+
+def own_capacity(geom, volume):
+    '''Return the capacity of the logical <volume> which is filled by
+    its own material, that is excluding its daughters.
+    '''
+    store = geom.store.structure
+    if hasattr(volume, 'name'):
+        volume = volume.name
+    vol = store[volume]
+    if vol.shape is None:
+        return 0.0
+    daughters = sum([volume_capacity(geom, store[p].volume) for p in vol.placements])
+    return shapes.capacity(geom, vol.shape) - daughters
+
+
+def element_masses(geom, volume, cache = None):
+    '''Return ordered dictionary mapping element name to its mass in
+    the logical <volume> including all its daughters.
+
+    An optional <cache> dictionary keyed by volume name is used to
+    avoid repeating the calculation for volumes placed many times.
+    '''
+    store = geom.store.structure
+    if hasattr(volume, 'name'):
+        volume = volume.name
+    if cache is not None and volume in cache:
+        return cache[volume]
+
+    vol = store[volume]
+    ret = OrderedDict()
+    if vol.shape is not None:
+        mass = density(geom, vol.material) * own_capacity(geom, volume)
+        for ele, frac in composition(geom, vol.material).items():
+            ret[ele] = ret.get(ele, 0.0) + mass*frac
+    for pname in vol.placements:
+        for ele, mass in element_masses(geom, store[pname].volume, cache).items():
+            ret[ele] = ret.get(ele, 0.0) + mass
+
+    if cache is not None:
+        cache[volume] = ret
+    return ret
+
+
+def mass(geom, volume):
+    '''
+    Return the total mass in g of the logical <volume> including all its daughters.
+    '''
+    return sum(element_masses(geom, volume).values())
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+'''Export a constructed geometry as an instanced triangle mesh.
+
+The output is a binary glTF 2.0 (.glb) file which a browser viewer
+(three.js, Babylon.js) or Blender loads directly.  Each unique shape
+is tessellated once into one glTF mesh.  Each physical node is a glTF
+node carrying only its global transform and a reference to that mesh
+so repeated volumes, like the TPCs and frame bars, cost one transform
+each.
+
+Tessellation:
+
+ - Box - 12 triangles
+ - Tubs - a polygon of SEGMENTS sides per full turn
+ - Box minus Box - the Box slabs of lbne.geo.decompose.box_slabs
+ - other shapes - their bounding box
+
+Lighter files are made by culling nodes: by depth below the top, by
+material, or by dropping volumes which only hold daughters.
+'''
+
+import re
+import json
+import math
+import struct
+import numpy
+
+from lbne.geo.flat import Flat, length, AUNIT
+from lbne.geo.shapes import get_shape, box_half
+from lbne.geo.bounds import get_bounds
+from lbne.geo.decompose import box_slabs
+
+# number of sides of a full circle
+SEGMENTS = 32
+
+# LUNIT to glTF meters
+SCALE = 0.01
+
+# glTF constants
+FLOAT = 5126
+UINT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+# (normal axis, sign) of the six Box faces and their corners as (u,v) signs
+_faces = [(axis, sign) for axis in range(3) for sign in (-1.0, 1.0)]
+_corners = [(-1, -1), (1, -1), (1, 1), (-1, 1)]
+
+
+def box_mesh(half, center = (0.0, 0.0, 0.0)):
+    '''Return (positions, normals, indices) arrays for a box of <half>
+    dimensions at <center>.
+    '''
+    half = numpy.asarray(half, dtype=float)
+    center = numpy.asarray(center, dtype=float)
+    pos, nor, ind = list(), list(), list()
+    for axis, sign in _faces:
+        u, v = (axis + 1) % 3, (axis + 2) % 3
+        if sign < 0:
+            u, v = v, u         # keep triangles counter-clockwise seen from outside
+        base = len(pos)
+        for cu, cv in _corners:
+            p = numpy.zeros(3)
+            p[axis], p[u], p[v] = sign, cu, cv
+            pos.append(center + half*p)
+            n = numpy.zeros(3)
+            n[axis] = sign
+            nor.append(n)
+        ind.extend([base, base+1, base+2, base, base+2, base+3])
+    return numpy.array(pos), numpy.array(nor), numpy.array(ind)
+
+
+def tubs_mesh(rmin, rmax, dz, sphi, dphi):
+    '''
+    Return (positions, normals, indices) arrays for a cylinder segment.
+    '''
+    nseg = max(1, int(math.ceil(SEGMENTS * dphi / (2.0*math.pi))))
+    phis = sphi + dphi * numpy.arange(nseg + 1) / float(nseg)
+    cs, sn = numpy.cos(phis), numpy.sin(phis)
+    pos, nor, ind = list(), list(), list()
+
+    def quad(corners, normal):
+        base = len(pos)
+        for c in corners:
+            pos.append(c)
+            nor.append(normal)
+        ind.extend([base, base+1, base+2, base, base+2, base+3])
+
+    for i in range(nseg):
+        a, b = (cs[i], sn[i]), (cs[i+1], sn[i+1])
+        mid = numpy.array([0.5*(a[0]+b[0]), 0.5*(a[1]+b[1]), 0.0])
+        mid /= numpy.sqrt(numpy.sum(mid*mid))
+        quad([(rmax*a[0], rmax*a[1], -dz), (rmax*b[0], rmax*b[1], -dz),
+              (rmax*b[0], rmax*b[1], dz), (rmax*a[0], rmax*a[1], dz)], mid)
+        if rmin > 0.0:
+            quad([(rmin*a[0], rmin*a[1], dz), (rmin*b[0], rmin*b[1], dz),
+                  (rmin*b[0], rmin*b[1], -dz), (rmin*a[0], rmin*a[1], -dz)], -mid)
+        for z in (-dz, dz):
+            ring = [(rmin*a[0], rmin*a[1], z), (rmax*a[0], rmax*a[1], z),
+                    (rmax*b[0], rmax*b[1], z), (rmin*b[0], rmin*b[1], z)]
+            if z < 0:
+                ring.reverse()
+            quad(ring, (0.0, 0.0, 1.0 if z > 0 else -1.0))
+    if dphi < 2.0*math.pi:
+        for i, sign in [(0, -1.0), (nseg, 1.0)]:
+            c, s = cs[i], sn[i]
+            ring = [(rmin*c, rmin*s, -dz), (rmax*c, rmax*s, -dz),
+                    (rmax*c, rmax*s, dz), (rmin*c, rmin*s, dz)]
+            if sign > 0:
+                ring.reverse()
+            quad(ring, (-s*sign, c*sign, 0.0))
+    return numpy.array(pos, dtype=float), numpy.array(nor, dtype=float), numpy.array(ind)
+
+
+def merge_meshes(meshes):
+    '''
+    Return one (positions, normals, indices) made of several.
+    '''
+    pos, nor, ind = list(), list(), list()
+    offset = 0
+    for p, n, i in meshes:
+        pos.append(p)
+        nor.append(n)
+        ind.append(i + offset)
+        offset += len(p)
+    return numpy.vstack(pos), numpy.vstack(nor), numpy.concatenate(ind)
+
+
+def tessellate(geom, shape):
+    '''Return (positions, normals, indices) arrays of triangles
+    covering the surface of <shape> in its own frame.
+    '''
+    shape = get_shape(geom, shape)
+    typename = type(shape).__name__
+    if typename == 'Box':
+        return box_mesh(box_half(shape))
+    if typename == 'Tubs':
+        return tubs_mesh(length(shape.rmin), length(shape.rmax), length(shape.dz),
+                         shape.sphi.to(AUNIT).magnitude, shape.dphi.to(AUNIT).magnitude)
+    if typename == 'Boolean':
+        slabs = box_slabs(geom, shape)
+        if slabs:
+            return merge_meshes([box_mesh(h, c) for h, c in slabs])
+    lo, hi = get_bounds(geom).shape(shape)
+    return box_mesh(0.5*(hi - lo), 0.5*(hi + lo))
+
+
+def material_color(name):
+    '''
+    Return a stable RGBA color for the material <name>.
+    '''
+    hue = (sum([ord(c)*(i+1) for i, c in enumerate(name)]) % 360) / 360.0
+    rgb = [0.5 + 0.4*math.cos(2.0*math.pi*(hue + off)) for off in (0.0, 1/3.0, 2/3.0)]
+    return rgb + [1.0]
+
+
+def select_nodes(flat, max_depth = None, exclude = None, assemblies = False):
+    '''Return list of node indices of <flat> to draw.
+
+    Nodes deeper than <max_depth> below the top, or made of a material
+    matching the <exclude> pattern are culled.  Unless <assemblies> is
+    true, nodes which have daughters are also culled.
+    '''
+    store = flat.geom.store.structure
+    rx = re.compile(exclude) if exclude else None
+    ret = list()
+    for ind, volname in enumerate(flat.volumes):
+        vol = store[volname]
+        if vol.shape is None:
+            continue
+        if max_depth is not None and flat.depth[ind] > max_depth:
+            continue
+        if rx and rx.search(vol.material):
+            continue
+        leaf = flat.end[ind] == ind + 1
+        if max_depth is not None and flat.depth[ind] == max_depth:
+            leaf = True
+        if not (leaf or assemblies):
+            continue
+        ret.append(ind)
+    return ret
+
+
+class _Buffer(object):
+    '''
+    Accumulate glTF buffer views and accessors over one binary blob.
+    '''
+
+    def __init__(self):
+        self.chunks = list()
+        self.size = 0
+        self.views = list()
+        self.accessors = list()
+
+    def add(self, array, ctype, atype, target, minmax = False):
+        data = array.tobytes()
+        self.views.append(dict(buffer=0, byteOffset=self.size, byteLength=len(data), target=target))
+        pad = (-len(data)) % 4
+        self.chunks.append(data + b'\0'*pad)
+        self.size += len(data) + pad
+        acc = dict(bufferView=len(self.views)-1, componentType=ctype,
+                   count=len(array), type=atype)
+        if minmax:
+            acc['min'] = [float(v) for v in array.min(axis=0)]
+            acc['max'] = [float(v) for v in array.max(axis=0)]
+        self.accessors.append(acc)
+        return len(self.accessors) - 1
+
+    def blob(self):
+        return b''.join(self.chunks)
+
+
+def gltf(geom, top = None, max_depth = None, exclude = None, assemblies = False):
+    '''Return (json, binary) glTF content for the geometry <geom>
+    below the <top> volume.  See select_nodes() for culling.
+    '''
+    flat = geom if isinstance(geom, Flat) else Flat(geom, top)
+    geom = flat.geom
+    store = geom.store.structure
+    nodes = select_nodes(flat, max_depth, exclude, assemblies)
+
+    buf = _Buffer()
+    shape_prims = dict()                # shape name -> attributes, indices
+    meshes, mesh_index = list(), dict() # (shape, material) -> mesh index
+    materials, material_index = list(), dict()
+    gnodes = list()
+
+    for ind in nodes:
+        vol = store[flat.volumes[ind]]
+        if vol.shape not in shape_prims:
+            pos, nor, tri = tessellate(geom, vol.shape)
+            shape_prims[vol.shape] = (
+                dict(POSITION = buf.add(pos.astype('<f4'), FLOAT, 'VEC3', ARRAY_BUFFER, True),
+                     NORMAL = buf.add(nor.astype('<f4'), FLOAT, 'VEC3', ARRAY_BUFFER)),
+                buf.add(tri.astype('<u4'), UINT, 'SCALAR', ELEMENT_ARRAY_BUFFER))
+        if vol.material not in material_index:
+            material_index[vol.material] = len(materials)
+            materials.append(dict(name = vol.material, pbrMetallicRoughness = dict(
+                baseColorFactor = material_color(vol.material), metallicFactor = 0.0),
+                doubleSided = True))
+        key = (vol.shape, vol.material)
+        if key not in mesh_index:
+            attributes, indices = shape_prims[vol.shape]
+            mesh_index[key] = len(meshes)
+            meshes.append(dict(name = vol.shape, primitives = [dict(
+                attributes = attributes, indices = indices,
+                material = material_index[vol.material])]))
+
+        matrix = numpy.identity(4)
+        matrix[:3,:3] = flat.rot[ind]
+        matrix[:3,3] = flat.pos[ind]
+        gnodes.append(dict(name = flat.paths[ind], mesh = mesh_index[key],
+                           matrix = [float(v) for v in matrix.T.flatten()]))
+
+    # one root to carry the unit conversion
+    root = dict(name = flat.volumes[0], scale = [SCALE]*3,
+                children = list(range(1, len(gnodes) + 1)))
+    blob = buf.blob()
+    doc = dict(asset = dict(version = '2.0', generator = 'lbne.geo.mesh'),
+               scene = 0, scenes = [dict(nodes = [0])],
+               nodes = [root] + gnodes, meshes = meshes, materials = materials,
+               accessors = buf.accessors, bufferViews = buf.views,
+               buffers = [dict(byteLength = len(blob))])
+    return doc, blob
+
+
+def glb_bytes(doc, blob):
+    '''
+    Return the .glb file content for glTF <doc> and binary <blob>.
+    '''
+    text = json.dumps(doc, separators=(',', ':')).encode('utf-8')
+    text += b' ' * ((-len(text)) % 4)
+    blob += b'\0' * ((-len(blob)) % 4)
+    total = 12 + 8 + len(text) + 8 + len(blob)
+    return b''.join([struct.pack('<4sII', b'glTF', 2, total),
+                     struct.pack('<I4s', len(text), b'JSON'), text,
+                     struct.pack('<I4s', len(blob), b'BIN\0'), blob])
+
+
+def write_glb(filename, doc, blob):
+    '''
+    Write glTF <doc> and binary <blob> to a .glb file.
+    '''
+    with open(filename, 'wb') as fp:
+        fp.write(glb_bytes(doc, blob))
+
+
+def export(geom, filename, **kwds):
+    '''Write geometry <geom> to a binary glTF file <filename>.
+    Keywords are passed to gltf().
+    '''
+    doc, blob = gltf(geom, **kwds)
+    write_glb(filename, doc, blob)
+    return doc
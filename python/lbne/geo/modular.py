@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+'''Export a geometry as GDML modules, one per subsystem.
+
+Each chosen volume (a "module") and the volumes below it are written
+to their own GDML file.  A top file holds the rest of the tree.  Where
+a volume places a module, its physvol refers to the module's file:
+
+  <physvol>
+    <file name="WireFrame.gdml"/>
+    <positionref ref="..."/>
+    <rotationref ref="..."/>
+  </physvol>
+
+which Geant4 reads as that file's world volume.  A module file is a
+complete GDML document so a consumer needing only that part of the
+detector loads just it.
+
+Materials and the position and rotation defines are written once, to
+two XML fragment files which every GDML file includes as external
+entities (&materials; and &define;).
+
+A file is only rewritten if its content changes so modules can be
+cached and consumed independently.
+'''
+
+import os
+import copy
+
+from lxml import etree
+
+from lbne.geo.fingerprint import fingerprint, comment
+from lbne.geo.main import write_file
+
+_gdml_open = '<gdml xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ' \
+    'xsi:noNamespaceSchemaLocation="http://service-spi.web.cern.ch/service-spi/app/releases/GDML/schema/gdml.xsd">'
+
+
+def resolve_module(geom, name):
+    '''Return the volume name for module <name> which may be a volume
+    name or a builder name following the "vol<Name>" convention.
+    '''
+    store = geom.store.structure
+    for cand in (name, 'vol' + name):
+        if cand in store and type(store[cand]).__name__ == 'Volume':
+            return cand
+    raise ValueError('No volume for module "%s"' % name)
+
+
+def subtree(geom, top, stop = ()):
+    '''Return names of volumes from <top> down, daughters before their
+    mothers as GDML requires, not going below volumes in <stop>.
+    '''
+    store = geom.store.structure
+    seen, order = set(), list()
+
+    def walk(name):
+        if name in seen:
+            return
+        seen.add(name)
+        for pname in store[name].placements or []:
+            daughter = store[pname].volume
+            if daughter not in stop:
+                walk(daughter)
+        order.append(name)
+    walk(top)
+    return order
+
+
+def _shape_deps(geom, name, out):
+    shape = geom.store.shapes[name]
+    if type(shape).__name__ == 'Boolean':
+        _shape_deps(geom, shape.first, out)
+        _shape_deps(geom, shape.second, out)
+    out.add(name)
+
+
+def _fragment(element):
+    return etree.tostring(element, pretty_print = True)
+
+
+def split(geom, modules, top = None, prefix = 'top'):
+    '''Return list of (filename, text) for the modular GDML export of
+    <geom> below <top> (default world).  The <modules> is a list of
+    module names (see resolve_module()).  File names are the module
+    names plus ".gdml", <prefix> plus ".gdml" for the top file and
+    <prefix> plus "-define.xml" and "-materials.xml" for the shared
+    fragments.
+    '''
+    import gegede.export.gdml
+
+    top = top or geom.world
+    full = gegede.export.gdml.convert(geom)
+    define = full.find('define')
+    materials = full.find('materials')
+    solids = full.find('solids')
+    volumes = dict([(v.get('name'), v) for v in full.find('structure')])
+
+    define_file = prefix + '-define.xml'
+    materials_file = prefix + '-materials.xml'
+    doctype = '<!DOCTYPE gdml [\n<!ENTITY define SYSTEM "%s">\n<!ENTITY materials SYSTEM "%s">\n]>' % \
+        (define_file, materials_file)
+
+    names = [resolve_module(geom, m) for m in modules]
+    files = dict([(vol, mod + '.gdml') for vol, mod in zip(names, modules)])
+
+    ret = [(define_file, _fragment(define)), (materials_file, _fragment(materials))]
+    for volname, filename in [(top, prefix + '.gdml')] + zip(names, [files[n] for n in names]):
+        stop = set(files) - set([volname])
+        vols = subtree(geom, volname, stop)
+
+        needed = set()
+        for v in vols:
+            shape = geom.store.structure[v].shape
+            if shape:
+                _shape_deps(geom, shape, needed)
+        snode = etree.Element('solids')
+        for solid in solids:
+            if solid.get('name') in needed:
+                snode.append(copy.deepcopy(solid))
+
+        structure = etree.Element('structure')
+        for v in vols:
+            node = copy.deepcopy(volumes[v])
+            for ref in list(node.iter('volumeref')):
+                if ref.get('ref') in stop:
+                    ref.getparent().replace(ref, etree.Element('file', name = files[ref.get('ref')]))
+            structure.append(node)
+
+        setup = etree.Element('setup', name = 'Default', version = '0')
+        etree.SubElement(setup, 'world', ref = volname)
+
+        # entity references defeat pretty printing so assemble by hand
+        parts = ['<?xml version="1.0" encoding="UTF-8"?>', doctype, _gdml_open,
+                 '<!--%s-->' % comment(fingerprint(geom, volname)), '&define;', '&materials;']
+        parts += [_fragment(n).strip() for n in (snode, structure, setup)]
+        parts.append('</gdml>\n')
+        ret.append((filename, '\n'.join(parts).replace("'", '"')))
+    return ret
+
+
+def export(geom, outdir, modules, top = None, prefix = 'top', force = False):
+    '''Write the modular GDML export (see split()) to <outdir>.
+    Return list of (filename, written) with <written> false if the
+    file already had the same content and <force> is false.
+    '''
+    ret = list()
+    for filename, text in split(geom, modules, top, prefix):
+        path = os.path.join(outdir, filename)
+        same = False
+        if not force and os.path.exists(path):
+            with open(path, 'rb') as fp:
+                same = fp.read() == text
+        if not same:
+            write_file(path, text)
+        ret.append((path, not same))
+    return ret
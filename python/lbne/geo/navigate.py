@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+'''Batched navigation queries over a constructed geometry.
+
+The Navigator answers, for arrays of points given in the top frame,
+the Geant4-style questions a stepper asks:
+
+ - locate() - the deepest node holding each point
+
+ - safety() - the distance to the nearest boundary of that node, that
+   is its own surface or that of any of its daughters
+
+ - distance_to_out() - the distance along a direction to the next
+   boundary, leaving the node or entering one of its daughters
+
+The candidate nodes for each point are found with a BoxTree, a
+bounding volume hierarchy over the global extents of all nodes, so the
+cost grows as the log of the number of nodes.  The tree is walked for
+all points at once with numpy.
+
+Distances are exact for Boxes and for Booleans of Boxes such as the
+hollow boxes the builders make.  For other Booleans they are lower
+bounds, which is what a stepper needs to stay safe.
+'''
+
+import numpy
+
+from lbne.geo.flat import Flat
+from lbne.geo.bounds import get_bounds
+from lbne.geo.shapes import get_shape, boolean_transform, box_half, inside
+from lbne.geo.decompose import box_slabs
+
+INF = numpy.inf
+
+
+def _box_distance(lo, hi, points):
+    '''
+    Return Euclidean distance from each of <points> to the extents (lo, hi).
+    '''
+    gap = numpy.maximum(numpy.maximum(lo - points, points - hi), 0.0)
+    return numpy.sqrt(numpy.sum(gap*gap, axis=1))
+
+
+def _box_enter(lo, hi, points, dirs):
+    '''Return the distance along <dirs> from <points> to enter the
+    extents (lo, hi), 0 if already inside and INF on a miss.
+    '''
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        t1 = (lo - points) / dirs
+        t2 = (hi - points) / dirs
+    parallel = dirs == 0.0
+    within = (points >= lo) & (points <= hi)
+    t1 = numpy.where(parallel, numpy.where(within, -INF, INF), t1)
+    t2 = numpy.where(parallel, numpy.where(within, INF, -INF), t2)
+    near = numpy.max(numpy.minimum(t1, t2), axis=1)
+    far = numpy.min(numpy.maximum(t1, t2), axis=1)
+    hit = (near <= far) & (far >= 0.0)
+    return numpy.where(hit, numpy.maximum(near, 0.0), INF)
+
+
+def box_spans(points, dirs, rot, center, half):
+    '''Return (enter, leave) arrays (T,B) of the ray parameters at
+    which each of the T rays (<points>, <dirs>) enters and leaves each
+    of the B oriented boxes (<rot>, <center>, <half>), counting only
+    the part of the ray ahead of its start.  A ray misses a box where
+    enter >= leave.  With unit <dirs> the parameters are distances.
+    '''
+    local = numpy.einsum('bij,tbi->tbj', rot, points[:,None,:] - center[None,:,:])
+    ldir = numpy.einsum('bij,ti->tbj', rot, dirs)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        t1 = (-half[None] - local) / ldir
+        t2 = (half[None] - local) / ldir
+    # a ray parallel to a face is inside the slab for all t or for none
+    parallel = ldir == 0.0
+    within = numpy.abs(local) <= half[None]
+    t1 = numpy.where(parallel, numpy.where(within, -INF, INF), t1)
+    t2 = numpy.where(parallel, INF, t2)
+    enter = numpy.maximum(numpy.minimum(t1, t2).max(axis=2), 0.0)
+    leave = numpy.maximum(t1, t2).min(axis=2)
+    return enter, leave
+
+
+def _box_exit(half, points, dirs):
+    '''
+    Return the distance along <dirs> from <points> to leave the box of <half> dimensions.
+    '''
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        t = numpy.where(dirs > 0.0, (half - points) / dirs,
+                        numpy.where(dirs < 0.0, (-half - points) / dirs, INF))
+    return numpy.maximum(numpy.min(t, axis=1), 0.0)
+
+
+def _second(geom, shape, points, dirs = None):
+    '''
+    Return points, and dirs, in the frame of the second shape of Boolean <shape>.
+    '''
+    rot, pos = boolean_transform(geom, shape)
+    points = numpy.dot(points - pos, rot)
+    if dirs is None:
+        return points
+    return points, numpy.dot(dirs, rot)
+
+
+def _unsupported(shape):
+    return ValueError('Unsupported shape for navigation: "%s"' % shape.name)
+
+
+def safety_in(geom, shape, points):
+    '''Return distance from each of the (N,3) <points> inside <shape>
+    (in its frame) to its surface.
+    '''
+    shape = get_shape(geom, shape)
+    typename = type(shape).__name__
+    points = numpy.asarray(points, dtype=float)
+
+    if typename == 'Box':
+        return numpy.maximum(numpy.min(box_half(shape) - numpy.abs(points), axis=1), 0.0)
+
+    if typename == 'Boolean':
+        first = safety_in(geom, shape.first, points)
+        if shape.type == 'subtraction':
+            return numpy.minimum(first, safety_out(geom, shape.second, _second(geom, shape, points)))
+        second = safety_in(geom, shape.second, _second(geom, shape, points))
+        if shape.type == 'intersection':
+            return numpy.minimum(first, second)
+        if shape.type == 'union':
+            return numpy.maximum(first, second)
+
+    raise _unsupported(shape)
+
+
+def safety_out(geom, shape, points):
+    '''Return distance from each of the (N,3) <points> outside <shape>
+    (in its frame) to its surface.
+    '''
+    shape = get_shape(geom, shape)
+    typename = type(shape).__name__
+    points = numpy.asarray(points, dtype=float)
+
+    if typename == 'Box':
+        half = box_half(shape)
+        return _box_distance(-half, half, points)
+
+    if typename == 'Boolean':
+        slabs = box_slabs(geom, shape)
+        if slabs:
+            return numpy.min([_box_distance(c - h, c + h, points) for h, c in slabs], axis=0)
+        first = safety_out(geom, shape.first, points)
+        if shape.type == 'subtraction':
+            # inside the hole or outside the first shape
+            hole = _second(geom, shape, points)
+            within = inside(geom, shape.second, hole)
+            ret = first.copy()
+            if numpy.any(within):
+                ret[within] = safety_in(geom, shape.second, hole[within])
+            return ret
+        second = safety_out(geom, shape.second, _second(geom, shape, points))
+        if shape.type == 'intersection':
+            return numpy.maximum(first, second)
+        if shape.type == 'union':
+            return numpy.minimum(first, second)
+
+    raise _unsupported(shape)
+
+
+def distance_out(geom, shape, points, dirs):
+    '''Return distance from each of the (N,3) <points> inside <shape>
+    (in its frame) along the unit <dirs> to leave it.
+    '''
+    shape = get_shape(geom, shape)
+    typename = type(shape).__name__
+    points = numpy.asarray(points, dtype=float)
+    dirs = numpy.asarray(dirs, dtype=float)
+
+    if typename == 'Box':
+        return _box_exit(box_half(shape), points, dirs)
+
+    if typename == 'Boolean':
+        first = distance_out(geom, shape.first, points, dirs)
+        spts, sdirs = _second(geom, shape, points, dirs)
+        if shape.type == 'subtraction':
+            return numpy.minimum(first, distance_in(geom, shape.second, spts, sdirs))
+        if shape.type == 'intersection':
+            return numpy.minimum(first, distance_out(geom, shape.second, spts, sdirs))
+        if shape.type == 'union':
+            # a lower bound: the exit of the constituents holding the point
+            ret = numpy.where(inside(geom, shape.first, points), first, 0.0)
+            within = inside(geom, shape.second, spts)
+            if numpy.any(within):
+                second = distance_out(geom, shape.second, spts[within], sdirs[within])
+                ret[within] = numpy.maximum(ret[within], second)
+            return ret
+
+    raise _unsupported(shape)
+
+
+def distance_in(geom, shape, points, dirs):
+    '''Return distance from each of the (N,3) <points> outside <shape>
+    (in its frame) along the unit <dirs> to enter it, INF on a miss.
+    '''
+    shape = get_shape(geom, shape)
+    typename = type(shape).__name__
+    points = numpy.asarray(points, dtype=float)
+    dirs = numpy.asarray(dirs, dtype=float)
+
+    if typename == 'Box':
+        half = box_half(shape)
+        return _box_enter(-half, half, points, dirs)
+
+    if typename == 'Boolean':
+        first = distance_in(geom, shape.first, points, dirs)
+        if shape.type == 'union':
+            spts, sdirs = _second(geom, shape, points, dirs)
+            return numpy.minimum(first, distance_in(geom, shape.second, spts, sdirs))
+
+        # Where the ray enters the first shape, check the second.  This
+        # is exact when both are convex.
+        ret = first.copy()
+        hit = numpy.flatnonzero(first < INF)
+        if not len(hit):
+            return ret
+        entry = points[hit] + first[hit,None]*dirs[hit]
+        spts, sdirs = _second(geom, shape, entry, dirs[hit])
+        leave = distance_out(geom, shape.first, entry, dirs[hit])
+        within = inside(geom, shape.second, spts)
+        if shape.type == 'subtraction':
+            # entering at the hole, come out the other side of it
+            beyond = distance_out(geom, shape.second, spts, sdirs)
+            ok = ~within | (beyond < leave)
+            ret[hit] = numpy.where(within, first[hit] + beyond, first[hit])
+        elif shape.type == 'intersection':
+            enter = numpy.where(within, 0.0, distance_in(geom, shape.second, spts, sdirs))
+            ok = enter <= leave
+            ret[hit] = first[hit] + enter
+        else:
+            raise _unsupported(shape)
+        ret[hit[~ok]] = INF
+        return ret
+
+    raise _unsupported(shape)
+
+
+class BoxTree(object):
+    '''A bounding volume hierarchy over axis-aligned boxes.
+
+    Tree nodes are held in arrays: .lo and .hi extents, .left and
+    .right child indices (-1 for a leaf) and, for leaves, the .first
+    and .count of their entries in .items, the indices of the boxes.
+    '''
+
+    def __init__(self, lo, hi, leaf_size = 4):
+        self.box_lo = numpy.asarray(lo, dtype=float)
+        self.box_hi = numpy.asarray(hi, dtype=float)
+        center = 0.5*(self.box_lo + self.box_hi)
+
+        tlo, thi, left, right, first, count = [], [], [], [], [], []
+        items = list()
+
+        def build(sel):
+            me = len(tlo)
+            tlo.append(self.box_lo[sel].min(axis=0))
+            thi.append(self.box_hi[sel].max(axis=0))
+            left.append(-1)
+            right.append(-1)
+            first.append(len(items))
+            count.append(0)
+            if len(sel) <= leaf_size:
+                items.extend(sel)
+                count[me] = len(sel)
+                return me
+            axis = numpy.argmax(thi[me] - tlo[me])
+            order = sel[numpy.argsort(center[sel, axis], kind='mergesort')]
+            half = len(order) // 2
+            left[me] = build(order[:half])
+            right[me] = build(order[half:])
+            return me
+
+        build(numpy.arange(len(self.box_lo)))
+        self.lo = numpy.array(tlo)
+        self.hi = numpy.array(thi)
+        self.left = numpy.array(left, dtype=int)
+        self.right = numpy.array(right, dtype=int)
+        self.first = numpy.array(first, dtype=int)
+        self.count = numpy.array(count, dtype=int)
+        self.items = numpy.array(items, dtype=int)
+
+    def query(self, nqueries, test):
+        '''Return (queries, items) arrays of all pairs of a query and a
+        box for which test(queries, lo, hi) is true.  The <test> is
+        called with arrays of query indices and of the extents of tree
+        nodes or boxes to check.  A box passes only if its tree nodes
+        do.
+        '''
+        q = numpy.arange(nqueries)
+        n = numpy.zeros(nqueries, dtype=int)
+        outq, outi = list(), list()
+        while len(q):
+            ok = test(q, self.lo[n], self.hi[n])
+            q, n = q[ok], n[ok]
+            leaf = self.left[n] < 0
+
+            lq, ln = q[leaf], n[leaf]
+            counts = self.count[ln]
+            lq = numpy.repeat(lq, counts)
+            offset = numpy.arange(len(lq)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+            li = self.items[numpy.repeat(self.first[ln], counts) + offset]
+            ok = test(lq, self.box_lo[li], self.box_hi[li])
+            outq.append(lq[ok])
+            outi.append(li[ok])
+
+            q, n = q[~leaf], n[~leaf]
+            q = numpy.concatenate([q, q])
+            n = numpy.concatenate([self.left[n], self.right[n]])
+        return numpy.concatenate(outq), numpy.concatenate(outi)
+
+
+class Navigator(object):
+    '''Batched locate, safety and distance queries.
+
+    Nodes are those of a Flat, points and directions are (N,3) arrays
+    in its top frame and in LUNIT.  Volumes without a shape (assemblies)
+    are transparent: their daughters count as daughters of the nearest
+    mother with a shape.
+    '''
+
+    def __init__(self, geom, top = None):
+        '''Make a navigator over <geom>, a constructed geometry or a
+        Flat object.
+        '''
+        flat = geom if isinstance(geom, Flat) else Flat(geom, top)
+        self.flat = flat
+        self.geom = flat.geom
+        store = self.geom.store.structure
+
+        shapes = [store[v].shape for v in flat.volumes]
+        if shapes[0] is None:
+            raise ValueError('Top volume "%s" has no shape' % flat.volumes[0])
+        self.shape_names = sorted(set([s for s in shapes if s is not None]))
+        self.shape_id = numpy.array([-1 if s is None else self.shape_names.index(s) for s in shapes])
+
+        # nearest mother with a shape
+        self.mother = numpy.empty(len(flat), dtype=int)
+        for ind, mom in enumerate(flat.parent):
+            while mom >= 0 and self.shape_id[mom] < 0:
+                mom = flat.parent[mom]
+            self.mother[ind] = mom
+
+        self.lo, self.hi = get_bounds(self.geom).nodes(flat)
+        self.solid = numpy.flatnonzero(self.shape_id >= 0)
+        self.tree = BoxTree(self.lo[self.solid], self.hi[self.solid])
+
+    def _candidates(self, nqueries, test):
+        q, i = self.tree.query(nqueries, test)
+        return q, self.solid[i]
+
+    def _local(self, nodes, points, dirs = None):
+        flat = self.flat
+        rot = flat.rot[nodes]
+        local = numpy.einsum('nij,ni->nj', rot, points - flat.pos[nodes])
+        if dirs is None:
+            return local
+        return local, numpy.einsum('nij,ni->nj', rot, dirs)
+
+    def _per_shape(self, func, nodes, *arrays):
+        '''Return result of shape function <func> applied to arrays
+        split by the shape of <nodes>.
+        '''
+        ret = numpy.empty(len(nodes), dtype=float)
+        ids = self.shape_id[nodes]
+        for sid in numpy.unique(ids):
+            sel = ids == sid
+            ret[sel] = func(self.geom, self.shape_names[sid], *[a[sel] for a in arrays])
+        return ret.astype(bool) if func is inside else ret
+
+    def locate(self, points):
+        '''
+        Return array of the deepest node holding each of <points>, -1 if outside.
+        '''
+        points = numpy.asarray(points, dtype=float)
+
+        def test(q, lo, hi):
+            p = points[q]
+            return numpy.all((p >= lo) & (p <= hi), axis=1)
+        q, nodes = self._candidates(len(points), test)
+        ok = self._per_shape(inside, nodes, self._local(nodes, points[q]))
+        q, nodes = q[ok], nodes[ok]
+
+        # deepest wins: the last of each point's run when sorted by depth
+        order = numpy.lexsort((self.flat.depth[nodes], q))
+        q, nodes = q[order], nodes[order]
+        last = numpy.ones(len(q), dtype=bool)
+        last[:-1] = q[1:] != q[:-1]
+        ret = -numpy.ones(len(points), dtype=int)
+        ret[q[last]] = nodes[last]
+        return ret
+
+    def safety(self, points, nodes = None):
+        '''Return distance from each of <points> to the nearest boundary
+        of the node holding it (see locate(), which may be precomputed
+        as <nodes>).  Points outside the top node give NaN.
+        '''
+        points = numpy.asarray(points, dtype=float)
+        if nodes is None:
+            nodes = self.locate(points)
+        ret = numpy.full(len(points), numpy.nan)
+        found = numpy.flatnonzero(nodes >= 0)
+        if not len(found):
+            return ret
+        pts, mine = points[found], nodes[found]
+        dist = self._per_shape(safety_in, mine, self._local(mine, pts))
+
+        # daughters can only be nearer if their extent is
+        def test(q, lo, hi):
+            return _box_distance(lo, hi, pts[q]) < dist[q]
+        q, daus = self._candidates(len(pts), test)
+        sel = self.mother[daus] == mine[q]
+        q, daus = q[sel], daus[sel]
+        if len(q):
+            near = self._per_shape(safety_out, daus, self._local(daus, pts[q]))
+            numpy.minimum.at(dist, q, near)
+
+        ret[found] = dist
+        return ret
+
+    def distance_to_out(self, points, dirs, nodes = None):
+        '''Return distance from each of <points> along the unit <dirs>
+        to the next boundary: leaving the node holding it (see
+        locate(), which may be precomputed as <nodes>) or entering one
+        of its daughters.  Points outside the top node give NaN.
+        '''
+        points = numpy.asarray(points, dtype=float)
+        dirs = numpy.asarray(dirs, dtype=float)
+        if nodes is None:
+            nodes = self.locate(points)
+        ret = numpy.full(len(points), numpy.nan)
+        found = numpy.flatnonzero(nodes >= 0)
+        if not len(found):
+            return ret
+        pts, dds, mine = points[found], dirs[found], nodes[found]
+        lpts, ldirs = self._local(mine, pts, dds)
+        dist = self._per_shape(distance_out, mine, lpts, ldirs)
+
+        # daughters can only be hit first if their extent is
+        def test(q, lo, hi):
+            return _box_enter(lo, hi, pts[q], dds[q]) < dist[q]
+        q, daus = self._candidates(len(pts), test)
+        sel = self.mother[daus] == mine[q]
+        q, daus = q[sel], daus[sel]
+        if len(q):
+            lpts, ldirs = self._local(daus, pts[q], dds[q])
+            near = self._per_shape(distance_in, daus, lpts, ldirs)
+            numpy.minimum.at(dist, q, near)
+
+        ret[found] = dist
+        return ret
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+'''Extract a self-contained sub-geometry.
+
+Configurations build more than a consumer may need: the
+thirtyfive.Matter builder defines every element and mixture whether
+used or not and a full configuration includes the world box and the
+enclosure.  The extract() function returns a new geometry holding only
+what the tree below a chosen volume needs: its volumes, placements,
+positions, rotations, shapes (with Boolean constituents) and the
+materials with the mixtures, elements and isotopes they are made from.
+That volume becomes the world of the new geometry.
+'''
+
+from gegede.construct import Geometry
+
+from lbne.geo.transforms import renumber
+
+
+def closure(geom, top = None):
+    '''Return dictionary mapping store part name ("structure",
+    "shapes", "matter") to the set of names of objects of <geom> which
+    the tree below volume <top> (default world) refers to.
+    '''
+    top = top or geom.world
+    if hasattr(top, 'name'):
+        top = top.name
+    structure = geom.store.structure
+    if type(structure.get(top)).__name__ != 'Volume':
+        raise ValueError('No volume "%s"' % top)
+    shapes = geom.store.shapes
+    matter = geom.store.matter
+    ret = dict(structure = set(), shapes = set(), matter = set())
+
+    def add_transforms(obj):
+        for name in (obj.pos, obj.rot):
+            if name is not None:
+                ret['structure'].add(name)
+
+    def add_shape(name):
+        if name is None or name in ret['shapes']:
+            return
+        ret['shapes'].add(name)
+        shape = shapes[name]
+        if type(shape).__name__ == 'Boolean':
+            add_shape(shape.first)
+            add_shape(shape.second)
+            add_transforms(shape)
+
+    def add_matter(name):
+        if name is None or name in ret['matter']:
+            return
+        ret['matter'].add(name)
+        obj = matter[name]
+        for val in obj[1:]:
+            if isinstance(val, (list, tuple)):
+                # components: (name, amount) referring to other matter
+                for comp in val:
+                    if comp[0] in matter:
+                        add_matter(comp[0])
+
+    stack = [top]
+    while stack:
+        name = stack.pop()
+        if name in ret['structure']:
+            continue
+        ret['structure'].add(name)
+        vol = structure[name]
+        add_shape(vol.shape)
+        add_matter(vol.material)
+        for pname in vol.placements or []:
+            place = structure[pname]
+            ret['structure'].add(pname)
+            add_transforms(place)
+            stack.append(place.volume)
+    return ret
+
+
+def extract(geom, top):
+    '''Return a new geometry with volume <top> of <geom> as its world
+    and only the objects it needs (see closure()).  Objects keep their
+    order and, except for renumbered anonymous ones, their names.
+    '''
+    keep = closure(geom, top)
+    new = Geometry(geom.schema)
+    for part, names in keep.items():
+        src = getattr(geom.store, part)
+        dst = getattr(new.store, part)
+        for name, obj in src.items():
+            if name in names:
+                dst[name] = obj
+    new.set_world(top.name if hasattr(top, 'name') else top)
+    renumber(new)
+    return new
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+'''A long running geometry query server.
+
+Generating the geometry and building its navigator takes far longer
+than answering a batch of queries.  The server does it once, keeps
+the result in memory and answers batched queries from any number of
+clients over a Unix socket.  It polls the configuration files and the
+source files of the builder classes and, when one changes, reloads
+the builder modules and rebuilds in the background while queries are
+still answered from the previous geometry.
+
+Each message, in either direction, is:
+
+  uint32 (little endian) length of the header
+  header: a JSON object
+  arrays: raw C-ordered data of each array in header["arrays"]
+
+where header["arrays"] lists [dtype, shape] of the arrays which
+follow.  A request header holds "op" and any other arguments, a reply
+header holds "ok" and, if false, "error".  A malformed message gets
+an error reply after which the server closes the connection.  The ops
+are:
+
+ - info :: reply with "fingerprint", "world", "nodes" and "generation"
+ - locate :: points (N,3) -> node index per point, -1 outside
+ - safety :: points (N,3) -> distance to nearest boundary
+ - distance :: points (N,3), dirs (N,3) -> distance to next boundary
+ - nodes :: node indices -> reply with "paths" and "volumes"
+ - placement :: node indices -> global rotations (N,3,3) and positions (N,3)
+ - mass :: header "volumes" list -> mass in g of each logical volume
+
+Lengths are in lbne.geo.flat.LUNIT.  The Client class speaks this
+protocol and "lbne-geo-server" runs a server.
+'''
+
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import threading
+import traceback
+import SocketServer
+
+import numpy
+
+_length = struct.Struct('<I')
+
+
+def _recv_exact(sock, size):
+    chunks = list()
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise EOFError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_message(sock, header, arrays = ()):
+    '''
+    Send <header> dictionary and sequence of numpy <arrays> over <sock>.
+    '''
+    arrays = [numpy.ascontiguousarray(a) for a in arrays]
+    header = dict(header, arrays = [[a.dtype.str, list(a.shape)] for a in arrays])
+    text = json.dumps(header).encode('utf-8')
+    sock.sendall(_length.pack(len(text)) + text)
+    for a in arrays:
+        sock.sendall(a.tostring())
+
+
+def recv_message(sock):
+    '''
+    Return (header, arrays) received from <sock>.
+    '''
+    size, = _length.unpack(_recv_exact(sock, _length.size))
+    header = json.loads(_recv_exact(sock, size).decode('utf-8'))
+    if not isinstance(header, dict):
+        raise ValueError('Message header is not an object')
+    arrays = list()
+    for dtype, shape in header.pop('arrays', []):
+        dtype = numpy.dtype(str(dtype))
+        shape = [int(n) for n in shape]
+        if any([n < 0 for n in shape]):
+            raise ValueError('Negative array dimension')
+        count = int(numpy.prod(shape)) if shape else 1
+        data = _recv_exact(sock, count * dtype.itemsize)
+        arrays.append(numpy.frombuffer(data, dtype=dtype).reshape(shape))
+    return header, arrays
+
+
+class Model(object):
+    '''
+    A geometry made ready for queries.
+    '''
+
+    def __init__(self, geom, generation = 0):
+        from lbne.geo.navigate import Navigator
+        from lbne.geo.fingerprint import fingerprint
+        self.geom = geom
+        self.generation = generation
+        self.navigator = Navigator(geom)
+        self.flat = self.navigator.flat
+        self.fingerprint = fingerprint(geom)
+        self._masses = dict()
+
+    def _nodes(self, nodes):
+        nodes = numpy.asarray(nodes, dtype=int)
+        if len(nodes) and (nodes.min() < 0 or nodes.max() >= len(self.flat)):
+            raise ValueError('Node index out of range')
+        return nodes
+
+    def info(self, header, arrays):
+        return dict(fingerprint = self.fingerprint, world = self.geom.world,
+                    nodes = len(self.flat), generation = self.generation), []
+
+    def locate(self, header, arrays):
+        return dict(), [self.navigator.locate(arrays[0]).astype('<i4')]
+
+    def safety(self, header, arrays):
+        return dict(), [self.navigator.safety(arrays[0])]
+
+    def distance(self, header, arrays):
+        return dict(), [self.navigator.distance_to_out(arrays[0], arrays[1])]
+
+    def nodes(self, header, arrays):
+        nodes = self._nodes(arrays[0])
+        return dict(paths = [self.flat.paths[n] for n in nodes],
+                    volumes = [self.flat.volumes[n] for n in nodes]), []
+
+    def placement(self, header, arrays):
+        nodes = self._nodes(arrays[0])
+        return dict(), [self.flat.rot[nodes], self.flat.pos[nodes]]
+
+    def mass(self, header, arrays):
+        from lbne.geo.material import element_masses
+        store = self.geom.store.structure
+        ret = list()
+        for name in header['volumes']:
+            if type(store.get(name)).__name__ != 'Volume':
+                raise ValueError('No volume "%s"' % name)
+            ret.append(sum(element_masses(self.geom, name, self._masses).values()))
+        return dict(), [numpy.array(ret, dtype=float)]
+
+    OPS = ('info', 'locate', 'safety', 'distance', 'nodes', 'placement', 'mass')
+
+    def query(self, header, arrays):
+        '''
+        Return reply (header, arrays) to the request (<header>, <arrays>).
+        '''
+        op = header.get('op')
+        if op not in self.OPS:
+            raise ValueError('Unknown op "%s"' % op)
+        reply, out = getattr(self, op)(header, arrays)
+        reply['ok'] = True
+        return reply, out
+
+
+def module_files(builders):
+    '''Return dictionary mapping the names of the modules defining the
+    classes of <builders>, and of the packages holding them, to their
+    source files.
+    '''
+    ret = dict()
+    for builder in builders:
+        name = type(builder).__module__
+        while name:
+            mod = sys.modules.get(name)
+            filename = getattr(mod, '__file__', None)
+            if filename:
+                if filename.endswith(('.pyc', '.pyo')):
+                    filename = filename[:-1]
+                ret[name] = filename
+            name = name.rpartition('.')[0]
+    return ret
+
+
+def _stamp(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+class Loader(object):
+    '''Generate a geometry from configuration files and tell when the
+    files it came from change.
+    '''
+
+    def __init__(self, filenames, world_name = None, top = None):
+        '''Generate from the configuration <filenames> with world
+        builder <world_name>, keeping only the tree below <top> (see
+        lbne.geo.lazy) if given.
+        '''
+        if isinstance(filenames, type("")):
+            filenames = [filenames]
+        self.filenames = list(filenames)
+        self.world_name = world_name
+        self.top = top
+        self.modules = dict()
+        self.stamps = dict()
+
+    def load(self):
+        '''
+        Return a newly generated geometry and remember the files it depends on.
+        '''
+        from lbne.geo.lazy import Session
+        stamps = dict([(f, _stamp(f)) for f in self.filenames])
+        session = Session(self.filenames, self.world_name)
+        geom = session.geometry(self.top)
+        self.modules = module_files(session.builders.values())
+        stamps.update([(f, _stamp(f)) for f in self.modules.values()])
+        self.stamps = stamps
+        return geom
+
+    def changed(self):
+        '''
+        Return list of files changed since the last load().
+        '''
+        return sorted([f for f, s in self.stamps.items() if _stamp(f) != s])
+
+    def reload_modules(self):
+        '''Reload the builder modules, most deeply nested first so
+        packages pick up their modules' new contents.
+        '''
+        for name in sorted(self.modules, key = lambda n: -n.count('.')):
+            if name in sys.modules:
+                reload(sys.modules[name])
+
+
+class _Handler(SocketServer.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                header, arrays = recv_message(self.request)
+            except (EOFError, socket.error):
+                return
+            except (ValueError, TypeError) as err:
+                # the rest of the stream can not be trusted
+                error = 'Malformed request: %s: %s' % (type(err).__name__, err)
+                send_message(self.request, dict(ok = False, error = error))
+                return
+            model = self.server.model
+            try:
+                reply, out = model.query(header, arrays)
+            except Exception as err:
+                reply, out = dict(ok = False, error = '%s: %s' % (type(err).__name__, err)), []
+            send_message(self.request, reply, out)
+
+
+class GeometryServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    '''
+    Serve queries on a geometry over a Unix socket.
+    '''
+    daemon_threads = True
+
+    def __init__(self, path, loader, poll = 1.0):
+        '''Listen on the Unix socket <path> serving the geometry from
+        <loader> (a Loader), checking its files every <poll> seconds
+        (never if None).
+        '''
+        if os.path.exists(path):
+            os.unlink(path)
+        self.path = path
+        self.loader = loader
+        self.poll = poll
+        self.model = Model(loader.load())
+        self._stop = threading.Event()
+        SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+
+    def refresh(self):
+        '''Rebuild if the configuration or builder files changed.
+        Return true if the served geometry was replaced.  On failure
+        the old one is kept.
+        '''
+        changed = self.loader.changed()
+        if not changed:
+            return False
+        print 'Rebuilding on change of: %s' % ', '.join(changed)
+        try:
+            self.loader.reload_modules()
+            model = Model(self.loader.load(), self.model.generation + 1)
+        except Exception:
+            traceback.print_exc()
+            # do not retry until the files change again
+            self.loader.stamps = dict([(f, _stamp(f)) for f in self.loader.stamps])
+            return False
+        self.model = model
+        print 'Serving generation %d with fingerprint %s' % (model.generation, model.fingerprint)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll):
+            self.refresh()
+
+    def serve_forever(self, poll_interval = 0.5):
+        if self.poll is not None:
+            watcher = threading.Thread(target = self._watch)
+            watcher.daemon = True
+            watcher.start()
+        try:
+            SocketServer.UnixStreamServer.serve_forever(self, poll_interval)
+        finally:
+            self._stop.set()
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class Client(object):
+    '''
+    Query a GeometryServer.
+    '''
+
+    def __init__(self, path, timeout = None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+
+    def close(self):
+        self.sock.close()
+
+    def request(self, op, arrays = (), **kwds):
+        '''Send request <op> with <arrays> and header arguments <kwds>.
+        Return (header, arrays) of the reply.
+        '''
+        send_message(self.sock, dict(kwds, op = op), arrays)
+        header, arrays = recv_message(self.sock)
+        if not header.get('ok'):
+            raise RuntimeError(header.get('error', 'query failed'))
+        return header, arrays
+
+    def info(self):
+        return self.request('info')[0]
+
+    def locate(self, points):
+        return self.request('locate', [numpy.asarray(points, dtype=float)])[1][0]
+
+    def safety(self, points):
+        return self.request('safety', [numpy.asarray(points, dtype=float)])[1][0]
+
+    def distance(self, points, dirs):
+        return self.request('distance', [numpy.asarray(points, dtype=float),
+                                         numpy.asarray(dirs, dtype=float)])[1][0]
+
+    def nodes(self, nodes):
+        header = self.request('nodes', [numpy.asarray(nodes, dtype='<i4')])[0]
+        return header['paths'], header['volumes']
+
+    def placement(self, nodes):
+        rot, pos = self.request('placement', [numpy.asarray(nodes, dtype='<i4')])[1]
+        return rot, pos
+
+    def mass(self, volumes):
+        return self.request('mass', volumes = list(volumes))[1][0]
+
+
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Serve queries on a geometry')
+    parser.add_argument("-s", "--socket", default="lbne-geo.sock",
+                        help="Unix socket path to listen on")
+    parser.add_argument("-w", "--world", default=None,
+                        help="World builder name")
+    parser.add_argument("-t", "--top", default=None,
+                        help="Serve only the tree below this volume or builder")
+    parser.add_argument("-p", "--poll", default=1.0, type=float,
+                        help="Seconds between checks for changed files")
+    parser.add_argument("config", nargs='+',
+                        help="Configuration file(s)")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    server = GeometryServer(args.socket, Loader(args.config, args.world, args.top), args.poll)
+    print 'Serving %s on %s after %.1f s' % (server.model.fingerprint, args.socket, time.time() - start)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if '__main__' == __name__:
+    sys.exit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+'''
+Solid geometry of the gegede shapes.
+
+Shapes may be given as objects or by name.  Lengths are plain floats
+in units of lbne.geo.flat.LUNIT.
+'''
+
+import math
+import numpy
+
+from lbne.geo.flat import length, rotation_matrix, AUNIT
+
+
+def get_shape(geom, shape):
+    '''
+    Return the shape object for <shape> which may be a shape name.
+    '''
+    if isinstance(shape, type("")):
+        return geom.store.shapes[shape]
+    return shape
+
+
+def boolean_transform(geom, shape):
+    '''Return (rot, pos) placing the second shape of the Boolean
+    <shape> in the frame of the first.
+    '''
+    store = geom.store.structure
+    rot = rotation_matrix(store[shape.rot] if shape.rot else None)
+    pos = numpy.zeros(3)
+    if shape.pos:
+        p = store[shape.pos]
+        pos = numpy.array([length(p.x), length(p.y), length(p.z)])
+    return rot, pos
+
+
+def box_half(shape):
+    '''
+    Return array of half dimensions of Box <shape>.
+    '''
+    return numpy.array([length(shape.dx), length(shape.dy), length(shape.dz)], dtype=float)
+
+
+def box_overlap(geom, shape):
+    '''Return the volume common to the two Box shapes of Boolean
+    <shape> or None if it can not be calculated exactly.
+    '''
+    first = get_shape(geom, shape.first)
+    second = get_shape(geom, shape.second)
+    if type(first).__name__ != 'Box' or type(second).__name__ != 'Box':
+        return None
+    rot, pos = boolean_transform(geom, shape)
+    if numpy.count_nonzero(rot) != 3:
+        return None
+    a = box_half(first)
+    b = numpy.dot(numpy.abs(rot), box_half(second))
+    lo = numpy.maximum(-a, pos - b)
+    hi = numpy.minimum(+a, pos + b)
+    return numpy.prod(numpy.clip(hi - lo, 0.0, None))
+
+
+def capacity(geom, shape):
+    '''Return the volume enclosed by <shape> in LUNIT cubed.
+
+    Booleans are supported when both constituents are axis-aligned
+    Boxes.  Otherwise a ValueError is raised.
+    '''
+    shape = get_shape(geom, shape)
+    typename = type(shape).__name__
+
+    if typename == 'Box':
+        return numpy.prod(2.0*box_half(shape))
+
+    if typename == 'Tubs':
+        rmin, rmax, dz = length(shape.rmin), length(shape.rmax), length(shape.dz)
+        dphi = shape.dphi.to(AUNIT).magnitude
+        return 0.5 * dphi * (rmax**2 - rmin**2) * 2.0 * dz
+
+    if typename == 'Sphere':
+        rmin, rmax = length(shape.rmin), length(shape.rmax)
+        dphi = shape.dphi.to(AUNIT).magnitude
+        t1 = shape.stheta.to(AUNIT).magnitude
+        t2 = t1 + shape.dtheta.to(AUNIT).magnitude
+        return dphi * (math.cos(t1) - math.cos(t2)) * (rmax**3 - rmin**3) / 3.0
+
+    if typename == 'Boolean':
+        common = box_overlap(geom, shape)
+        if common is None:
+            raise ValueError('Can not calculate capacity of Boolean "%s"' % shape.name)
+        first = capacity(geom, shape.first)
+        if shape.type == 'subtraction':
+            return first - common
+        if shape.type == 'intersection':
+            return common
+        if shape.type == 'union':
+            return first + capacity(geom, shape.second) - common
+
+    raise ValueError('Unsupported shape type: "%s"' % typename)
+
+
+def _phi_inside(phi, sphi, dphi):
+    if dphi >= 2.0*math.pi:
+        return numpy.ones(len(phi), dtype=bool)
+    return numpy.mod(phi - sphi, 2.0*math.pi) <= dphi
+
+
+def inside(geom, shape, points):
+    '''Return boolean array, true for each of the (N,3) <points>, given
+    in the frame of <shape>, which are inside or on the surface of it.
+    '''
+    shape = get_shape(geom, shape)
+    typename = type(shape).__name__
+    points = numpy.asarray(points, dtype=float)
+    x, y, z = points[:,0], points[:,1], points[:,2]
+
+    if typename == 'Box':
+        h = box_half(shape)
+        return (numpy.abs(x) <= h[0]) & (numpy.abs(y) <= h[1]) & (numpy.abs(z) <= h[2])
+
+    if typename == 'Tubs':
+        rmin, rmax, dz = length(shape.rmin), length(shape.rmax), length(shape.dz)
+        r2 = x*x + y*y
+        ret = (r2 >= rmin*rmin) & (r2 <= rmax*rmax) & (numpy.abs(z) <= dz)
+        return ret & _phi_inside(numpy.arctan2(y, x), shape.sphi.to(AUNIT).magnitude,
+                                 shape.dphi.to(AUNIT).magnitude)
+
+    if typename == 'Sphere':
+        rmin, rmax = length(shape.rmin), length(shape.rmax)
+        r2 = x*x + y*y + z*z
+        ret = (r2 >= rmin*rmin) & (r2 <= rmax*rmax)
+        ret &= _phi_inside(numpy.arctan2(y, x), shape.sphi.to(AUNIT).magnitude,
+                           shape.dphi.to(AUNIT).magnitude)
+        theta = numpy.arctan2(numpy.hypot(x, y), z)
+        t1 = shape.stheta.to(AUNIT).magnitude
+        return ret & (theta >= t1) & (theta <= t1 + shape.dtheta.to(AUNIT).magnitude)
+
+    if typename == 'Boolean':
+        first = inside(geom, shape.first, points)
+        rot, pos = boolean_transform(geom, shape)
+        second = inside(geom, shape.second, numpy.dot(points - pos, rot))
+        if shape.type == 'subtraction':
+            return first & ~second
+        if shape.type == 'intersection':
+            return first & second
+        if shape.type == 'union':
+            return first | second
+
+    raise ValueError('Unsupported shape type: "%s"' % typename)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+'''Locate points in TPCs and convert them to drift coordinates.
+
+The table is derived from the constructed placements so whatever the
+builders did (eg, the 180 degree rotation of the short drift TPCs and
+the gaps and offsets of larsoft.Cryostat) is automatically followed.
+
+The anode of each TPC is taken to be the face, along the drift axis,
+closest to the anode plane volume (the wire frame).
+'''
+
+import numpy
+
+from lbne.geo.flat import Flat, length
+
+
+class TpcTable(object):
+    '''A table of TPC active volumes.
+
+    Per-TPC data members, indexed by TPC number:
+
+    .paths - path names of the TPC nodes
+
+    .nodes - indices of the TPC nodes in the Flat object
+
+    .lo, .hi - (N,3) global bounds of the active volume
+
+    .anode - position of the anode plane along the drift axis
+
+    .sign - +1/-1 if electrons drift toward increasing/decreasing
+    coordinate along the drift axis
+
+    All lengths are in units of lbne.geo.flat.LUNIT.
+    '''
+
+    def __init__(self, geom, tpcs = '^volTPC', anode = 'WireFrame', axis = 0):
+        '''Make table of TPCs in <geom> (constructed geometry or a Flat).
+
+        The <tpcs> and <anode> are volume name patterns matching the
+        TPC volumes and the volume holding the anode plane(s).  The
+        <axis> gives the drift axis (0=x).
+        '''
+        flat = geom if isinstance(geom, Flat) else Flat(geom)
+        self.flat = flat
+        self.axis = axis
+
+        self.nodes = flat.find(tpcs)
+        if not len(self.nodes):
+            raise ValueError('No TPC volumes matching "%s"' % tpcs)
+        self.anodes = flat.find(anode)
+        if not len(self.anodes):
+            raise ValueError('No anode volumes matching "%s"' % anode)
+        self.paths = [flat.paths[n] for n in self.nodes]
+
+        self._hdim = numpy.empty((len(self.nodes), 3))
+        for ind, node in enumerate(self.nodes):
+            shape = flat.shape(node)
+            if type(shape).__name__ != 'Box':
+                raise ValueError('TPC volume "%s" is not a box' % flat.volumes[node])
+            self._hdim[ind] = [length(shape.dx), length(shape.dy), length(shape.dz)]
+        self.refresh()
+
+    def refresh(self):
+        '''Recalculate the table from the current global transforms of
+        the TPC and anode nodes.  Call after these have been moved.
+        '''
+        flat, axis = self.flat, self.axis
+        rot = flat.rot[self.nodes]
+        for r, path in zip(rot, self.paths):
+            if numpy.count_nonzero(r) != 3:
+                raise ValueError('TPC volume "%s" is not axis aligned' % path)
+        half = numpy.einsum('nij,nj->ni', numpy.abs(rot), self._hdim)
+        self.lo = flat.pos[self.nodes] - half
+        self.hi = flat.pos[self.nodes] + half
+
+        anode_at = flat.pos[self.anodes, axis]
+        lo, hi = self.lo[:,axis], self.hi[:,axis]
+        lo_dist = numpy.abs(lo[:,None] - anode_at[None,:]).min(axis=1)
+        hi_dist = numpy.abs(hi[:,None] - anode_at[None,:]).min(axis=1)
+        self.sign = numpy.where(hi_dist < lo_dist, 1, -1)
+        self.anode = numpy.where(self.sign > 0, hi, lo)
+        self._cells = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def table(self):
+        '''
+        Return the table as a numpy structured array.
+        '''
+        ret = numpy.empty(len(self), dtype=[('path', 'S256'), ('anode', float),
+                                             ('sign', int), ('lo', float, 3),
+                                             ('hi', float, 3)])
+        ret['path'] = self.paths
+        ret['anode'] = self.anode
+        ret['sign'] = self.sign
+        ret['lo'] = self.lo
+        ret['hi'] = self.hi
+        return ret
+
+    def locate(self, points):
+        '''Return array of the TPC index holding each of the (N,3)
+        global <points> or -1 if not in any TPC.  Bounds are taken as
+        half open, [lo,hi).
+        '''
+        points = numpy.asarray(points, dtype=float)
+        if self._cells is None:
+            self._make_cells()
+        index = tuple(numpy.searchsorted(edges, points[:,axis], side='right')
+                      for axis, edges in enumerate(self._edges))
+        return self._cells[index]
+
+    def _make_cells(self):
+        '''Partition space by the TPC faces into a grid of cells each
+        lying in at most one TPC.  Cell i along an axis spans
+        [edges[i-1], edges[i]).
+        '''
+        self._edges = [numpy.unique(numpy.hstack((self.lo[:,a], self.hi[:,a])))
+                       for a in range(3)]
+        cells = numpy.empty([len(e)+1 for e in self._edges], dtype=int)
+        cells.fill(-1)
+        for ind, (lo, hi) in enumerate(zip(self.lo, self.hi)):
+            span = [slice(numpy.searchsorted(e, l)+1, numpy.searchsorted(e, h)+1)
+                    for e, l, h in zip(self._edges, lo, hi)]
+            cells[tuple(span)] = ind
+        self._cells = cells
+
+    def to_drift_coords(self, points):
+        '''Convert (N,3) global <points> to drift coordinates.
+
+        Return tuple (tpc, distance, sign) of arrays holding the TPC
+        index (-1 if outside all TPCs), the distance to the anode plane
+        along the drift axis (NaN if outside) and the drift direction
+        sign (0 if outside).
+        '''
+        points = numpy.asarray(points, dtype=float)
+        tpc = self.locate(points)
+        inside = tpc >= 0
+        sign = numpy.zeros(len(points), dtype=int)
+        sign[inside] = self.sign[tpc[inside]]
+        distance = numpy.empty(len(points))
+        distance.fill(numpy.nan)
+        distance[inside] = sign[inside] * (self.anode[tpc[inside]] - points[inside, self.axis])
+        return tpc, distance, sign
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+'''Interning of Position and Rotation objects.
+
+Builders place many volumes at the same offsets and with the same
+rotations.  Making a fresh anonymous Position or Rotation for each
+puts a separate define in the GDML for each.  Instead, builders ask
+the Interner of their geometry (see get_interner()) which returns the
+name of the one object holding a given transform, making it only the
+first time.  A zero position or an identity rotation is returned as
+None which the GDML export writes as its shared "center" and
+"identity".
+
+The Interner keeps the values of its transforms in compact arrays,
+see table(), and its index by value rounded to TOLERANCE.
+
+The intern_transforms() pass does the same for an already constructed
+geometry, merging duplicate transforms made by any builder.
+'''
+
+import re
+import array
+import numpy
+
+from gegede import Quantity as Q
+
+from lbne.geo.flat import LUNIT
+
+# values (in LUNIT or degree) closer than this are the same
+TOLERANCE = 1e-9
+
+_units = dict(Position = LUNIT, Rotation = 'degree')
+
+
+def _magnitudes(kind, values):
+    '''
+    Return list of floats in the unit for <kind> from Quantities, strings or floats.
+    '''
+    unit = _units[kind]
+    ret = list()
+    for v in values:
+        if isinstance(v, type("")):
+            v = Q(v)
+        if hasattr(v, 'to'):
+            v = v.to(unit).magnitude
+        ret.append(float(v))
+    return ret
+
+
+class Interner(object):
+    '''
+    Canonical Position and Rotation objects of a geometry.
+    '''
+
+    def __init__(self, geom):
+        '''Make an interner for <geom>, indexing the Position and
+        Rotation objects it already holds.
+        '''
+        self.geom = geom
+        self._index = dict([(k, dict()) for k in _units])
+        self._names = dict([(k, list()) for k in _units])
+        self._values = dict([(k, array.array('d')) for k in _units])
+        for obj in geom.store.structure.values():
+            kind = type(obj).__name__
+            if kind in _units:
+                self.add(obj)
+
+    def _key(self, values):
+        return tuple([int(round(v / TOLERANCE)) for v in values])
+
+    def _register(self, kind, key, name, values):
+        self._index[kind][key] = name
+        self._names[kind].append(name)
+        self._values[kind].extend(values)
+
+    def add(self, obj):
+        '''Index an existing Position or Rotation <obj>.  Return the
+        name of the canonical object with its value, which may be its
+        own name, or None if it is a null transform.
+        '''
+        kind = type(obj).__name__
+        values = _magnitudes(kind, [obj.x, obj.y, obj.z])
+        key = self._key(values)
+        if not any(key):
+            return None
+        name = self._index[kind].get(key)
+        if name is not None and name in self.geom.store.structure:
+            return name
+        self._register(kind, key, obj.name, values)
+        return obj.name
+
+    def _intern(self, kind, values):
+        raw = values
+        values = _magnitudes(kind, values)
+        key = self._key(values)
+        if not any(key):
+            return None
+        name = self._index[kind].get(key)
+        if name is not None and name in self.geom.store.structure:
+            return name
+        unit = _units[kind]
+        quants = [v if hasattr(v, 'to') else Q(m, unit) for v, m in zip(raw, values)]
+        maker = getattr(self.geom.structure, kind)
+        obj = maker(None, *quants)
+        self._register(kind, key, obj.name, values)
+        return obj.name
+
+    def position(self, x = 0.0, y = 0.0, z = 0.0):
+        '''Return the name of the Position with the given coordinates,
+        or None if all are zero.  Each may be a Quantity, a string or a
+        float in LUNIT.
+        '''
+        return self._intern('Position', (x, y, z))
+
+    def rotation(self, x = 0.0, y = 0.0, z = 0.0):
+        '''Return the name of the Rotation with the given angles, or
+        None if all are zero.  Each may be a Quantity, a string or a
+        float in degrees.
+        '''
+        return self._intern('Rotation', (x, y, z))
+
+    def table(self, kind):
+        '''Return (names, values) of the transforms of <kind>
+        ("Position" or "Rotation") made or indexed so far with values
+        an (N,3) array in LUNIT or degrees.
+        '''
+        values = numpy.frombuffer(self._values[kind], dtype=float) if len(self._values[kind]) else numpy.zeros(0)
+        return list(self._names[kind]), values.reshape(-1, 3)
+
+
+def get_interner(geom):
+    '''
+    Return the Interner of <geom>, making it on first call.
+    '''
+    interner = getattr(geom, '_interner', None)
+    if interner is None:
+        interner = Interner(geom)
+        geom._interner = interner
+    return interner
+
+
+def _rename_refs(obj, rename):
+    '''
+    Return <obj> with its references to structure objects and shapes renamed.
+    '''
+    kind = type(obj).__name__
+    change = dict()
+    fields = dict(Placement = ('volume', 'pos', 'rot'),
+                  Boolean = ('first', 'second', 'pos', 'rot'),
+                  Volume = ('shape',)).get(kind, ())
+    for field in fields:
+        old = getattr(obj, field)
+        if old in rename:
+            change[field] = rename[old]
+    if kind == 'Volume' and obj.placements:
+        places = [rename.get(p, p) for p in obj.placements]
+        if places != list(obj.placements):
+            change['placements'] = places
+    if not change:
+        return obj
+    return obj._replace(**change)
+
+
+def renumber(geom):
+    '''Give the anonymous structure objects and shapes of <geom> the
+    names gegede would give them now, after objects were removed from
+    their store.  Otherwise names made later from the store size may
+    collide.  Return dictionary mapping old to new names.
+
+    Anonymous Volumes, Placements and shapes are renamed too, so this
+    must run after construction: names held outside the store, like a
+    builder's volumes, are not updated.  The Interner and the Bounds
+    cache of <geom> are rebuilt.
+    '''
+    rename = dict()
+    for part in ('structure', 'shapes'):
+        store = getattr(geom.store, part)
+        anonymous = re.compile(r'^(%s)\d{6}$' % '|'.join(sorted(geom.schema[part].keys())))
+        for index, name in enumerate(store.keys()):
+            match = anonymous.match(name)
+            if match:
+                new = '%s%06d' % (match.group(1), index)
+                if new != name:
+                    rename[name] = new
+    if not rename:
+        return rename
+
+    for part in ('structure', 'shapes'):
+        store = getattr(geom.store, part)
+        items = store.items()
+        store.clear()
+        for name, obj in items:
+            obj = _rename_refs(obj, rename)
+            if name in rename:
+                name = rename[name]
+                obj = obj._replace(name = name)
+            store[name] = obj
+    if geom.world in rename:
+        geom.set_world(rename[geom.world])
+
+    # both are keyed by the old names
+    geom._interner = Interner(geom)
+    bounds = getattr(geom, '_bounds', None)
+    if bounds is not None:
+        bounds.invalidate()
+    return rename
+
+
+def intern_transforms(geom):
+    '''Merge duplicate Position and Rotation objects of <geom>, and
+    drop null ones, rewriting the Placements and Booleans which refer
+    to them.  Return the number of objects removed.
+    '''
+    store = geom.store.structure
+    interner = Interner(geom)           # the first of each value is canonical
+
+    rename = dict()
+    for name, obj in store.items():
+        if type(obj).__name__ in _units:
+            canon = interner.add(obj)
+            if canon != name:
+                rename[name] = canon
+    if not rename:
+        geom._interner = Interner(geom)
+        return 0
+
+    for name, obj in store.items():
+        store[name] = _rename_refs(obj, rename)
+    for name, shape in geom.store.shapes.items():
+        geom.store.shapes[name] = _rename_refs(shape, rename)
+    for name in rename:
+        del store[name]
+    renumber(geom)
+    geom._interner = Interner(geom)
+    return len(rename)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+'''Sample interaction vertices uniformly in mass.
+
+The VertexSampler selects the material regions of a constructed
+geometry (each node's shape less its daughters) found in the subtrees
+of some volumes and, optionally, made of some materials.  It
+precomputes each region's mass and an alias table so a region is
+picked in constant time.  Points are then drawn uniformly in the
+region's bounding box and rejected if outside its shape or inside a
+daughter, all in numpy batches.
+
+Random numbers come from numpy.random.RandomState seeded with (seed,
+stream) so a sample is reproducible and parallel jobs given distinct
+streams draw independent sequences.
+'''
+
+import re
+import numpy
+from collections import namedtuple
+
+from lbne.geo.flat import Flat, local_transform
+from lbne.geo.bounds import get_bounds
+from lbne.geo import shapes, material
+
+# Arrays of global points (N,3) and, per point, the index of its node,
+# of its volume name in .volume_names and of its material name in
+# .material_names of the sampler.
+Vertices = namedtuple('Vertices', 'points node volume material')
+
+
+def random_state(seed = None, stream = 0):
+    '''
+    Return a RandomState for the given <seed> and parallel <stream> number.
+    '''
+    if seed is None:
+        return numpy.random.RandomState()
+    return numpy.random.RandomState([seed, stream])
+
+
+def alias_table(weights):
+    '''Return (prob, alias) arrays of Vose's alias table for sampling
+    indices in proportion to <weights>.
+    '''
+    weights = numpy.asarray(weights, dtype=float)
+    num = len(weights)
+    scaled = weights * num / weights.sum()
+    prob = numpy.zeros(num)
+    alias = numpy.arange(num)
+    small = [i for i in range(num) if scaled[i] < 1.0]
+    large = [i for i in range(num) if scaled[i] >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s], alias[s] = scaled[s], l
+        scaled[l] -= 1.0 - scaled[s]
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    for i in small + large:
+        prob[i] = 1.0
+    return prob, alias
+
+
+class VertexSampler(object):
+    '''Sample points uniformly in mass.
+
+    The .nodes array holds the Flat node index of each material region
+    and .mass its mass in g.
+    '''
+
+    def __init__(self, geom, within = None, materials = None, top = None):
+        '''Select material regions in <geom> (constructed geometry or
+        a Flat object) which are in the subtree of any volume matching
+        the <within> pattern (default: everything) and which are made
+        of a material matching the <materials> pattern (default: any).
+        '''
+        flat = geom if isinstance(geom, Flat) else Flat(geom, top)
+        self.flat = flat
+        geom = flat.geom
+        store = geom.store.structure
+
+        roots = flat.find(within) if within else [0]
+        selected = numpy.zeros(len(flat), dtype=bool)
+        for root in roots:
+            selected[root:flat.end[root]] = True
+        rx = re.compile(materials) if materials else None
+
+        nodes, mass = list(), list()
+        for ind in numpy.flatnonzero(selected):
+            vol = store[flat.volumes[ind]]
+            if vol.shape is None:
+                continue
+            if rx and not (vol.material == materials or rx.search(vol.material)):
+                continue
+            m = material.density(geom, vol.material) * material.own_capacity(geom, vol.name)
+            if m <= 0.0:
+                continue
+            nodes.append(ind)
+            mass.append(m)
+        if not nodes:
+            raise ValueError('No material selected within "%s" of "%s"' % (within, materials))
+
+        self.nodes = numpy.array(nodes, dtype=int)
+        self.mass = numpy.array(mass)
+        self.total_mass = self.mass.sum()
+        self._prob, self._alias = alias_table(self.mass)
+
+        vols = [flat.volumes[n] for n in self.nodes]
+        mats = [store[v].material for v in vols]
+        self.volume_names = sorted(set(vols))
+        self.material_names = sorted(set(mats))
+        self._volume = numpy.array([self.volume_names.index(v) for v in vols])
+        self._material = numpy.array([self.material_names.index(m) for m in mats])
+
+        bounds = get_bounds(geom)
+        self._regions = list()
+        for vol in vols:
+            lo, hi = bounds.volume(vol)
+            daughters = list()
+            for pname in store[vol].placements:
+                rot, pos = local_transform(store, pname)
+                daughters.append((store[pname].volume, rot, pos))
+            accept = material.own_capacity(geom, vol) / numpy.prod(hi - lo)
+            self._regions.append((vol, lo, hi, daughters, accept))
+
+    def _inside_volume(self, volname, points):
+        store = self.flat.geom.store.structure
+        vol = store[volname]
+        if vol.shape is not None:
+            return shapes.inside(self.flat.geom, vol.shape, points)
+        ret = numpy.zeros(len(points), dtype=bool)
+        for pname in vol.placements:
+            ret |= self._inside_placement(pname, points)
+        return ret
+
+    def _inside_placement(self, pname, points):
+        store = self.flat.geom.store.structure
+        rot, pos = local_transform(store, pname)
+        return self._inside_volume(store[pname].volume, numpy.dot(points - pos, rot))
+
+    def _region_points(self, region, count, rng):
+        '''
+        Return (count,3) points uniform in <region> in its node frame.
+        '''
+        volname, lo, hi, daughters, accept = self._regions[region]
+        geom = self.flat.geom
+        shape = geom.store.structure[volname].shape
+        got, have = list(), 0
+        while have < count:
+            want = int(1.1 * (count - have) / accept) + 16
+            cand = lo + (hi - lo) * rng.random_sample((want, 3))
+            keep = shapes.inside(geom, shape, cand)
+            for dvol, rot, pos in daughters:
+                if not numpy.any(keep):
+                    break
+                sub = cand[keep]
+                keep[numpy.flatnonzero(keep)[self._inside_volume(dvol, numpy.dot(sub - pos, rot))]] = False
+            cand = cand[keep][:count - have]
+            got.append(cand)
+            have += len(cand)
+        return numpy.vstack(got)
+
+    def sample(self, count, seed = None, stream = 0, rng = None):
+        '''Return Vertices holding <count> points sampled uniformly in
+        mass.  Use a given RandomState <rng> or make one from <seed> and
+        <stream>.
+        '''
+        if rng is None:
+            rng = random_state(seed, stream)
+        num = len(self.nodes)
+        pick = rng.randint(0, num, size=count)
+        alias = rng.random_sample(count) >= self._prob[pick]
+        pick[alias] = self._alias[pick[alias]]
+
+        points = numpy.empty((count, 3))
+        order = numpy.argsort(pick, kind='mergesort')
+        counts = numpy.bincount(pick, minlength=num)
+        start = 0
+        for region, n in enumerate(counts):
+            if not n:
+                continue
+            sel = order[start:start+n]
+            start += n
+            local = self._region_points(region, n, rng)
+            points[sel] = self.flat.to_global(self.nodes[region], local)
+
+        return Vertices(points, self.nodes[pick], self._volume[pick], self._material[pick])
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+'''Photon visibility library from the constructed geometry.
+
+The visibility of a paddle from a point is the fraction of isotropic
+scintillation light emitted there which reaches the paddle directly:
+its solid angle over 4 pi with any part hidden by opaque volumes
+removed.  It is estimated by sampling a stratified grid of points on
+each paddle and summing, over the sample rays not blocked, their share
+of the paddle area times the cosine of incidence over 4 pi r^2.
+
+No paddle volumes are built.  The paddles sit in the plane of the wire
+frames, one in each bay between the horizontal members (the short
+sides and cross pieces) of each frame, and are taken to see light on
+both faces (see frame_paddles()).  Opaque volumes are those below the
+detector not made of a transparent material (the frame bars and the
+CPAs, and the field cages where built).  Box-minus-Box shapes block as
+their slabs, other shapes as their bounding box.  Rayleigh scattering,
+absorption and reflection are ignored.
+
+The TPC volumes are divided into voxels of a given pitch and the
+voxel centers are distributed in chunks over a process pool.  The
+result is written as a (voxels, paddles) float32 ".npy" file, read
+back memory mapped, next to a ".npz" file describing the voxels and
+paddles (see Library).
+'''
+
+import numpy
+from collections import namedtuple
+
+from gegede import Quantity as Q
+
+from lbne.geo.flat import Flat, LUNIT
+from lbne.geo.bounds import get_bounds
+from lbne.geo.decompose import node_boxes
+from lbne.geo.navigate import box_spans
+from lbne.geo.shapes import box_half
+from lbne.geo.vertex import random_state
+
+FRAMES = r'^volWF_(Small|Medium|Large)$'
+TPCS = r'^volTPC'
+TRANSPARENT = ('LiquidArgon',)
+
+# Per TPC node: its path, global rotation (3,3) and position (3), the
+# half dimensions (3) of its box, the number of voxels on each axis (3)
+# and the index of its first voxel in the library.
+Grid = namedtuple('Grid', 'path rot pos half shape offset')
+
+
+def _local_extents(flat, nodes):
+    '''Return (lo, hi) of each of <nodes> in the frame of its mother node.'''
+    bounds = get_bounds(flat.geom)
+    lo, hi = list(), list()
+    for n in nodes:
+        vlo, vhi = bounds.volume(flat.volumes[n])
+        center = numpy.dot(flat.lrot[n], 0.5*(vlo + vhi)) + flat.lpos[n]
+        half = numpy.dot(numpy.abs(flat.lrot[n]), 0.5*(vhi - vlo))
+        lo.append(center - half)
+        hi.append(center + half)
+    return numpy.array(lo), numpy.array(hi)
+
+
+def frame_paddles(flat, frames = FRAMES):
+    '''Return (names, paddles) for the paddles in the bays of the wire
+    frame nodes matching <frames>.  The <paddles> array is (P,3,3)
+    holding for each paddle its global center and two half-side
+    vectors.  Frames are in their local YZ plane with the members
+    along Y ("long sides") bounding the bays in Z.
+    '''
+    names, paddles = list(), list()
+    for frame in flat.find(frames):
+        daughters = numpy.flatnonzero(flat.parent == frame)
+        if not len(daughters):
+            continue
+        lo, hi = _local_extents(flat, daughters)
+        height = (hi[:,1] - lo[:,1]).max()
+        across = (hi[:,1] - lo[:,1]) < 0.5*height
+        if not across.any():
+            continue
+        zlo, zhi = lo[across,2].max(), hi[across,2].min()
+        order = numpy.argsort(lo[across,1])
+        ylo, yhi = lo[across,1][order], hi[across,1][order]
+        for bay, (top, bottom) in enumerate(zip(yhi[:-1], ylo[1:])):
+            if bottom <= top or zhi <= zlo:
+                continue
+            center = numpy.array([0.0, 0.5*(top + bottom), 0.5*(zlo + zhi)])
+            rot = flat.rot[frame]
+            paddles.append([flat.to_global(frame, center[None,:])[0],
+                            rot[:,1] * 0.5*(bottom - top),
+                            rot[:,2] * 0.5*(zhi - zlo)])
+            names.append('%s#%d' % (flat.paths[frame], bay))
+    if not paddles:
+        raise ValueError('No paddles found in frames matching "%s"' % frames)
+    return names, numpy.array(paddles)
+
+
+def occluders(flat, top = 0, transparent = TRANSPARENT):
+    '''Return (lo, hi) arrays (B,3) of the global boxes which block
+    light: the shapes of nodes below node <top> not made of a
+    <transparent> material.
+    '''
+    store = flat.geom.store.structure
+    glo, ghi = get_bounds(flat.geom).nodes(flat)
+    lo, hi = list(), list()
+    for n in range(top + 1, flat.end[top]):
+        vol = store[flat.volumes[n]]
+        if vol.shape is None or vol.material in transparent:
+            continue
+        boxes = node_boxes(flat, n)
+        if boxes is None:
+            lo.append(glo[n])
+            hi.append(ghi[n])
+            continue
+        for rot, center, half in boxes:
+            ext = numpy.dot(numpy.abs(rot), half)
+            lo.append(center - ext)
+            hi.append(center + ext)
+    return numpy.array(lo).reshape(-1, 3), numpy.array(hi).reshape(-1, 3)
+
+
+def voxelize(flat, tpcs = TPCS, pitch = Q('5 cm')):
+    '''Return (grids, centers) dividing each Box node matching <tpcs>
+    into voxels no larger than <pitch> (Quantity or LUNIT) on a side.
+    The <grids> is a list of Grid, one per node, and <centers> the
+    (N,3) array of global voxel centers, TPC by TPC, each in C order
+    over its local (x,y,z) voxel indices.
+    '''
+    if hasattr(pitch, 'to'):
+        pitch = pitch.to(LUNIT).magnitude
+    grids, centers, offset = list(), list(), 0
+    for n in flat.find(tpcs):
+        shape = flat.shape(n)
+        if type(shape).__name__ != 'Box':
+            raise ValueError('TPC volume "%s" is not a Box' % flat.volumes[n])
+        half = box_half(shape)
+        counts = numpy.maximum(numpy.ceil(2*half / pitch), 1).astype(int)
+        axes = [(numpy.arange(c) + 0.5) * (2*h / c) - h for c, h in zip(counts, half)]
+        local = numpy.array(numpy.meshgrid(*axes, indexing='ij')).reshape(3, -1).T
+        centers.append(flat.to_global(n, local))
+        grids.append(Grid(flat.paths[n], flat.rot[n].copy(), flat.pos[n].copy(),
+                          half, counts, offset))
+        offset += len(local)
+    if not grids:
+        raise ValueError('No TPC volumes matching "%s"' % tpcs)
+    return grids, numpy.vstack(centers)
+
+
+def paddle_samples(paddles, samples, rng):
+    '''Return (points, weights, normals, owner) for a jittered grid of
+    about <samples> points on each paddle.  The <weights> are the
+    paddle area each point stands for and <owner> the paddle index.
+    '''
+    side = max(int(round(numpy.sqrt(samples))), 1)
+    npad = len(paddles)
+    # stratified (s, t) in [-1, 1]: one uniform point per cell
+    cell = numpy.array(numpy.meshgrid(numpy.arange(side), numpy.arange(side), indexing='ij')).reshape(2, -1).T
+    st = 2.0 * (cell[None,:,:] + rng.random_sample((npad, side*side, 2))) / side - 1.0
+    center, u, v = paddles[:,0], paddles[:,1], paddles[:,2]
+    points = center[:,None,:] + st[...,0:1] * u[:,None,:] + st[...,1:2] * v[:,None,:]
+    normal = numpy.cross(u, v)
+    area = 4.0 * numpy.sqrt((normal**2).sum(axis=1))
+    normal /= (area / 4.0)[:,None]
+    count = side*side
+    weights = numpy.repeat(area / count, count)
+    return (points.reshape(-1, 3), weights, numpy.repeat(normal, count, axis=0),
+            numpy.repeat(numpy.arange(npad), count))
+
+
+def blocked(starts, ends, lo, hi):
+    '''Return boolean array telling which of the segments from
+    <starts> to <ends> (both (N,3)) pass through any of the boxes
+    (<lo>, <hi>).
+    '''
+    ret = numpy.zeros(len(starts), dtype=bool)
+    delta = ends - starts
+    axes = numpy.identity(3)[None]
+    for blo, bhi in zip(lo, hi):
+        # only segments whose own extent touches the box
+        near = numpy.all((numpy.minimum(starts, ends) < bhi) & (numpy.maximum(starts, ends) > blo), axis=1)
+        near &= ~ret
+        if not near.any():
+            continue
+        enter, leave = box_spans(starts[near], delta[near], axes,
+                                 0.5*(blo + bhi)[None], 0.5*(bhi - blo)[None])
+        ret[numpy.flatnonzero(near)[(enter[:,0] < leave[:,0]) & (enter[:,0] < 1.0)]] = True
+    return ret
+
+
+def visibility(points, paddles, lo, hi, samples = 16, rng = None):
+    '''Return (N,P) array of the visibility of each of <paddles> (see
+    frame_paddles()) from each of the (N,3) <points> with light
+    blocked by the boxes (<lo>, <hi>) (see occluders()).  Each paddle
+    is sampled at about <samples> points drawn from <rng>.
+    '''
+    if rng is None:
+        rng = random_state()
+    points = numpy.asarray(points, dtype=float)
+    targets, weights, normals, owner = paddle_samples(paddles, samples, rng)
+    npad = len(paddles)
+    npoint, ntarget = len(points), len(targets)
+    delta = targets[None,:,:] - points[:,None,:]
+    r2 = (delta**2).sum(axis=2)
+    cos = numpy.abs((delta * normals[None,:,:]).sum(axis=2)) / numpy.sqrt(r2)
+    share = weights[None,:] * cos / (4*numpy.pi*r2)
+    hidden = blocked(numpy.repeat(points, ntarget, axis=0), numpy.tile(targets, (npoint, 1)), lo, hi)
+    share[hidden.reshape(npoint, ntarget)] = 0.0
+    ret = numpy.zeros((npoint, npad))
+    for pad in range(npad):
+        ret[:,pad] = share[:,owner == pad].sum(axis=1)
+    return ret
+
+
+# per worker process state set by _init()
+_state = dict()
+
+
+def _init(paddles, lo, hi, samples, seed):
+    _state.update(paddles = paddles, lo = lo, hi = hi, samples = samples, seed = seed)
+
+
+def _work(task):
+    stream, start, points = task
+    rng = random_state(_state['seed'], stream)
+    vis = visibility(points, _state['paddles'], _state['lo'], _state['hi'], _state['samples'], rng)
+    return start, vis.astype(numpy.float32)
+
+
+class Library(object):
+    '''A photon visibility library.
+
+    .visibility - (voxels, paddles) float32 array, memory mapped when loaded
+
+    .centers - (voxels, 3) global voxel centers in LUNIT
+
+    .grids - list of Grid, one per TPC
+
+    .paddles, .paddle_names - the paddles (see frame_paddles())
+    '''
+
+    def __init__(self, visibility, centers, grids, paddles, paddle_names):
+        self.visibility = visibility
+        self.centers = centers
+        self.grids = grids
+        self.paddles = paddles
+        self.paddle_names = paddle_names
+
+    def voxel(self, points):
+        '''
+        Return array of the voxel index holding each of (N,3) global <points>, -1 if none.
+        '''
+        points = numpy.asarray(points, dtype=float)
+        ret = -numpy.ones(len(points), dtype=int)
+        for grid in self.grids:
+            local = numpy.dot(points - grid.pos, grid.rot)
+            inside = numpy.all(numpy.abs(local) <= grid.half, axis=1) & (ret < 0)
+            ijk = numpy.floor((local[inside] + grid.half) / (2*grid.half) * grid.shape).astype(int)
+            ijk = numpy.minimum(ijk, grid.shape - 1)
+            ret[inside] = grid.offset + numpy.ravel_multi_index(ijk.T, grid.shape)
+        return ret
+
+    def __call__(self, points):
+        '''
+        Return (N,P) visibility at (N,3) global <points>, zero outside the voxels.
+        '''
+        vox = self.voxel(points)
+        ret = numpy.zeros((len(vox), len(self.paddles)), dtype=numpy.float32)
+        ret[vox >= 0] = self.visibility[vox[vox >= 0]]
+        return ret
+
+    @staticmethod
+    def meta_name(filename):
+        return filename[:-4] + '.npz' if filename.endswith('.npy') else filename + '.npz'
+
+    def save_meta(self, filename):
+        g = self.grids
+        numpy.savez(Library.meta_name(filename), centers = self.centers,
+                    paddles = self.paddles, paddle_names = numpy.array(self.paddle_names),
+                    grid_paths = numpy.array([x.path for x in g]),
+                    grid_rot = numpy.array([x.rot for x in g]),
+                    grid_pos = numpy.array([x.pos for x in g]),
+                    grid_half = numpy.array([x.half for x in g]),
+                    grid_shape = numpy.array([x.shape for x in g]),
+                    grid_offset = numpy.array([x.offset for x in g]))
+
+    @classmethod
+    def load(cls, filename, mmap_mode = 'r'):
+        '''
+        Return the Library written to the ".npy" <filename> by generate().
+        '''
+        vis = numpy.load(filename, mmap_mode = mmap_mode)
+        meta = numpy.load(Library.meta_name(filename))
+        grids = [Grid(*args) for args in zip(list(meta['grid_paths']), meta['grid_rot'],
+                                             meta['grid_pos'], meta['grid_half'],
+                                             meta['grid_shape'], meta['grid_offset'])]
+        return cls(vis, meta['centers'], grids, meta['paddles'], list(meta['paddle_names']))
+
+
+def generate(geom, filename, pitch = Q('5 cm'), samples = 16, processes = None,
+             chunk = 64, seed = 0, tpcs = TPCS, frames = FRAMES, transparent = TRANSPARENT):
+    '''Write the visibility library of <geom> (constructed geometry
+    or Flat) to the ".npy" <filename> and return it as a Library.
+
+    Voxels of <pitch> fill the TPC nodes matching <tpcs>, paddles are
+    in the bays of the frames matching <frames> and about <samples>
+    points are sampled on each.  Voxels are handed out in <chunk>s to
+    <processes> worker processes (default one per CPU, run in this
+    process if 1).  Chunk number i draws from random_state(seed, i)
+    so the result does not depend on <processes>.
+    '''
+    from numpy.lib.format import open_memmap
+
+    flat = geom if isinstance(geom, Flat) else Flat(geom)
+    grids, centers = voxelize(flat, tpcs, pitch)
+    names, paddles = frame_paddles(flat, frames)
+
+    # opaque volumes below the nearest node holding all TPCs
+    tpc_nodes = flat.find(tpcs)
+    top = tpc_nodes[0]
+    while not all([top <= n < flat.end[top] for n in tpc_nodes]):
+        top = flat.parent[top]
+    lo, hi = occluders(flat, top, transparent)
+
+    out = open_memmap(filename, mode = 'w+', dtype = numpy.float32,
+                      shape = (len(centers), len(paddles)))
+    tasks = [(i, s, centers[s:s+chunk]) for i, s in enumerate(range(0, len(centers), chunk))]
+    pool = None
+    if processes == 1:
+        _init(paddles, lo, hi, samples, seed)
+        results = map(_work, tasks)
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes, _init, (paddles, lo, hi, samples, seed))
+        results = pool.imap_unordered(_work, tasks)
+    try:
+        for start, vis in results:
+            out[start:start+len(vis)] = vis
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    out.flush()
+    del out
+
+    lib = Library(None, centers, grids, paddles, names)
+    lib.save_meta(filename)
+    return Library.load(filename)
@@ -12,6 +12,13 @@ setup(name = 'lbne-geometry',
       # These are just what were developed against.  Older versions may be okay.
       install_requires=[
           "gegede",
+          "numpy",
       ],
+      entry_points = {
+          'console_scripts': [
+              'lbne-geo-export = lbne.geo.main:main',
+              'lbne-geo-server = lbne.geo.server:main',
+          ],
+      },
   )
 
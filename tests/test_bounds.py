@@ -0,0 +1,73 @@
+#!/usr/bin/python
+
+import os
+import numpy
+
+import gegede.main
+from gegede import Quantity as Q
+from lbne.geo.flat import Flat
+from lbne.geo.bounds import get_bounds, envelope
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def check_contained(cfgname):
+    'Each node must be inside the extent of its mother'
+    geom = gegede.main.generate(os.path.join(cfgdir, cfgname))
+    flat = Flat(geom)
+    lo, hi = get_bounds(geom).nodes(flat)
+    eps = 1e-9
+    for ind in range(1, len(flat)):
+        mom = flat.parent[ind]
+        assert numpy.all(lo[ind] >= lo[mom] - eps), flat.paths[ind]
+        assert numpy.all(hi[ind] <= hi[mom] + eps), flat.paths[ind]
+
+def test_bounds_35ton():
+    check_contained('35ton.cfg')
+
+def test_bounds_35ton_larsoft():
+    check_contained('35ton-larsoft.cfg')
+
+def test_bounds_cache():
+    geom = gegede.main.generate(os.path.join(cfgdir, '35ton.cfg'))
+    bounds = get_bounds(geom)
+    store = geom.store.structure
+
+    # Boolean is bounded by its first shape
+    cage = store['volLongCage']
+    lo, hi = bounds.volume(cage)
+    outer = geom.get_shape(geom.get_shape(cage).first)
+    assert numpy.allclose(hi, [outer.dx.to('cm').magnitude,
+                               outer.dy.to('cm').magnitude,
+                               outer.dz.to('cm').magnitude])
+    assert bounds.volume(cage) is bounds.volume(cage)
+
+    # replacing the volume drops the cached extent
+    cpa = store['volCPA']
+    old = bounds.volume(cpa)
+    shape = geom.shapes.Box(None, Q('1m'), Q('2m'), Q('3m'))
+    store['volCPA'] = cpa._replace(shape=shape.name)
+    new = bounds.volume('volCPA')
+    assert not numpy.allclose(old[1], new[1])
+    assert numpy.allclose(new[1], [100, 200, 300])
+
+    # a tight envelope for two placements
+    place = geom.structure.Placement(None, volume='volCPA',
+                                     pos=geom.structure.Position(None, x=Q('1m')))
+    dx, dy, dz = envelope(geom, [place])
+    assert abs(dx.to('cm').magnitude - 200) < 1e-9
+    assert abs(dz.to('cm').magnitude - 300) < 1e-9
+
+    # an assembly follows a placement replaced under the same name
+    asm = geom.structure.Volume('volTestAssembly', placements=[place.name])
+    lo, hi = bounds.volume(asm)
+    assert numpy.allclose([lo[0], hi[0]], [0, 200])
+    store[place.name] = place._replace(pos=geom.structure.Position(None, x=Q('2m')).name)
+    lo, hi = bounds.volume(asm)
+    assert numpy.allclose([lo[0], hi[0]], [100, 300])
+
+if '__main__' == __name__:
+    test_bounds_35ton()
+    test_bounds_35ton_larsoft()
+    test_bounds_cache()
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+
+import os
+import time
+import tempfile
+
+import numpy
+import gegede.main
+from lbne.geo import cosmics
+from lbne.geo.flat import Flat
+from lbne.geo.vertex import random_state
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+cfgfile = os.path.join(cfgdir, '35ton.cfg')
+
+def test_chords():
+    rot = numpy.array([numpy.identity(3)])
+    center = numpy.array([[0.0, 0.0, 0.0]])
+    half = numpy.array([[1.0, 2.0, 3.0]])
+    points = numpy.array([[0.0, 10.0, 0.0], [0.5, 10.0, 0.0], [5.0, 10.0, 0.0], [0.0, 0.0, 0.0], [-5.0, 0.0, -5.0]])
+    dirs = numpy.array([[0.0, -1.0, 0.0], [0.0, -1.0, 0.0], [0.0, -1.0, 0.0], [0.0, 1.0, 0.0],
+                        [numpy.sqrt(0.5), 0.0, numpy.sqrt(0.5)]])
+    got = cosmics.chords(points, dirs, rot, center, half)[:,0]
+    assert numpy.allclose(got, [4.0, 4.0, 0.0, 2.0, 2*numpy.sqrt(2.0)])
+
+    # rotated a quarter turn about X the box is 3 high
+    rot = numpy.array([[[1.0, 0.0, 0.0], [0.0, 0.0, -1.0], [0.0, 1.0, 0.0]]])
+    assert numpy.allclose(cosmics.chords(points[:1], dirs[:1], rot, center, half), 6.0)
+
+def test_tracks():
+    geom = gegede.main.generate(cfgfile)
+    engine = cosmics.CosmicEngine(geom, zenith_power = 2.0)
+    points, dirs, energies = engine.tracks(100000, random_state(1))
+    assert numpy.allclose((dirs**2).sum(axis=1), 1.0)
+    assert numpy.all(dirs[:,1] < 0)
+    # density cos^(n+1) has mean cos (n+2)/(n+3)
+    assert abs(-dirs[:,1].mean() - 0.8) < 0.005
+    assert energies.min() >= 1.0 and energies.max() <= 1000.0
+    assert numpy.median(energies) < 3.0
+
+def test_engine():
+    geom = gegede.main.generate(cfgfile)
+    flat = Flat(geom)
+    engine = cosmics.CosmicEngine(geom)
+    assert len(engine.tpc_paths) == len(flat.find('^volTPC'))
+
+    # straight down through the middle of each TPC
+    points = flat.pos[flat.find('^volTPC')].copy()
+    points[:,1] = engine.plane_height
+    dirs = numpy.tile([0.0, -1.0, 0.0], (len(points), 1))
+    lengths, flags = engine.intersect(points, dirs)
+    heights = [2*flat.shape(n).dy.to('cm').magnitude for n in flat.find('^volTPC')]
+    assert numpy.allclose(numpy.diag(lengths), heights)
+    assert numpy.all(flags & cosmics.FLAGS['tpc'])
+
+    res = engine.run(20000, seed = 3, processes = 2)
+    assert res.generated == 20000
+    assert 0 < len(res) < res.generated
+    tables = res.tables()
+    assert numpy.allclose(tables['tpc'] * res.generated, (res.lengths > 0).sum(axis=0))
+    intpc = numpy.count_nonzero(res.flags & cosmics.FLAGS['tpc'])
+    assert numpy.isclose(tables['multiplicity'].sum(), 1.0)
+    assert numpy.isclose(tables['multiplicity'][0] * res.generated, res.generated - intpc)
+    assert numpy.isclose(tables['multiplicity'][1:].sum() * res.generated, intpc)
+    assert numpy.isclose(tables['cpa_frame'].sum() * res.generated, intpc)
+    assert numpy.allclose(numpy.diag(tables['tpc_pairs']), tables['tpc'])
+
+    # independent of the number of processes, and saved whole
+    again = engine.run(20000, seed = 3, processes = 1)
+    assert numpy.all(again.lengths == res.lengths)
+    filename = os.path.join(tempfile.mkdtemp(), 'cosmics.npz')
+    res.save(filename)
+    back = cosmics.CosmicResult.load(filename)
+    try:
+        engine.run(0)
+    except ValueError:
+        pass
+    else:
+        assert False, 'empty run accepted'
+    assert back.tpc_paths == res.tpc_paths
+    assert numpy.all(back.flags == res.flags)
+
+def bench_engine(count = 1000000):
+    geom = gegede.main.generate(cfgfile)
+    engine = cosmics.CosmicEngine(geom)
+    start = time.time()
+    res = engine.run(count)
+    took = time.time() - start
+    print '%d tracks, %d kept in %.1f s, %.0f tracks/s' % (count, len(res), took, count / took)
+    print 'TPC acceptance:', ' '.join(['%.4f' % a for a in res.tables()['tpc']])
+
+if '__main__' == __name__:
+    test_chords()
+    test_tracks()
+    test_engine()
+    bench_engine()
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+
+import os
+import time
+import numpy
+
+import gegede.main
+from lbne.geo import material, decompose
+from lbne.geo.flat import Flat
+from lbne.geo.shapes import get_shape, box_half, boolean_transform
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def booleans(geom):
+    flat = Flat(geom)
+    ret = set()
+    for ind in range(len(flat)):
+        shape = flat.shape(ind)
+        if type(shape).__name__ == 'Boolean':
+            ret.add(shape.name)
+    return ret
+
+def check_slabs(geom, shape, npoints = 100000):
+    'Points in the Boolean must be in exactly one slab'
+    shape = get_shape(geom, shape)
+    slabs = decompose.box_slabs(geom, shape)
+    assert slabs
+    outer = box_half(get_shape(geom, shape.first))
+    inner = box_half(get_shape(geom, shape.second))
+    rot, pos = boolean_transform(geom, shape)
+    points = numpy.random.RandomState(0).uniform(-outer, outer, (npoints, 3))
+    local = numpy.dot(points - pos, rot)
+    in_bool = ~numpy.all(numpy.abs(local) < inner, axis=1)
+    nslabs = numpy.zeros(npoints, dtype=int)
+    for half, center in slabs:
+        nslabs += numpy.all(numpy.abs(points - center) < half, axis=1)
+    assert numpy.all(nslabs[in_bool] == 1)
+    assert numpy.all(nslabs[~in_bool] == 0)
+    return len(slabs)
+
+def check_decompose(cfgname):
+    geom = gegede.main.generate(os.path.join(cfgdir, cfgname))
+    want = material.element_masses(geom, geom.world)
+    before = booleans(geom)
+    assert before
+    for name in before:
+        assert check_slabs(geom, name) in (4, 6)
+
+    replaced = decompose.decompose(geom)
+    assert replaced
+    assert not booleans(geom)
+    got = material.element_masses(geom, geom.world)
+    for ele, mass in want.items():
+        assert abs(got[ele] - mass) <= 1e-9 * mass, (ele, got[ele], mass)
+
+def test_node_boxes():
+    'Global boxes of a node fill its shape'
+    geom = gegede.main.generate(os.path.join(cfgdir, '35ton-larsoft.cfg'))
+    flat = Flat(geom)
+    for ind in range(len(flat)):
+        boxes = decompose.node_boxes(flat, ind)
+        shape = flat.shape(ind)
+        if boxes is None:
+            assert shape is None
+            continue
+        volume = sum([8*numpy.prod(half) for rot, center, half in boxes])
+        assert abs(volume - material.volume_capacity(geom, flat.volumes[ind])) < 1e-6 * volume
+
+def test_decompose_35ton():
+    check_decompose('35ton.cfg')
+
+def test_decompose_35ton_larsoft():
+    check_decompose('35ton-larsoft.cfg')
+
+def bench_navigation(npoints = 1000000):
+    '''Time ROOT "where am I" queries with and without Booleans.'''
+    import ROOT
+    from gegede.export import Exporter
+    for slabs in [False, True]:
+        geom = gegede.main.generate(os.path.join(cfgdir, '35ton.cfg'))
+        if slabs:
+            decompose.decompose(geom)
+        gdmlfile = '35ton-%s.gdml' % ('slabs' if slabs else 'booleans')
+        exporter = Exporter('gdml')
+        exporter.convert(geom)
+        exporter.output(gdmlfile)
+        tgeo = ROOT.TGeoManager.Import(gdmlfile)
+        start = time.time()
+        tgeo.Test(npoints)
+        print '%s: %.3f s for %d points' % (gdmlfile, time.time() - start, npoints)
+
+if '__main__' == __name__:
+    test_node_boxes()
+    test_decompose_35ton()
+    test_decompose_35ton_larsoft()
+    bench_navigation()
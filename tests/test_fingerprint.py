@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+import os
+import time
+import tempfile
+
+import gegede.main
+from gegede import Quantity as Q
+from lbne.geo.fingerprint import fingerprint, read_fingerprint
+from lbne.geo.transforms import renumber
+from lbne.geo.prune import closure
+from lbne.geo import main
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+cfgfile = os.path.join(cfgdir, '35ton.cfg')
+
+def test_fingerprint():
+    geom = gegede.main.generate(cfgfile)
+    fp = fingerprint(geom)
+    assert len(fp) == 64
+    assert fingerprint(gegede.main.generate(cfgfile)) == fp
+    assert fingerprint(gegede.main.generate(os.path.join(cfgdir, '35ton-larsoft.cfg'))) != fp
+
+    # shift every anonymous name
+    store = geom.store.structure
+    items = store.items()
+    store.clear()
+    geom.structure.Position(None)
+    for name, obj in items:
+        store[name] = obj
+    assert renumber(geom)
+    assert fingerprint(geom) == fp
+
+    # a moved placement
+    place = [p for p in store.values() if type(p).__name__ == 'Placement' and p.pos][0]
+    pos = store[place.pos]
+    moved = geom.structure.Position(None, pos.x + Q('1mm'), pos.y, pos.z)
+    store[place.name] = place._replace(pos = moved.name)
+    assert fingerprint(geom) != fp
+    store[place.name] = place
+    assert fingerprint(geom) == fp
+
+    # a changed material
+    argon = geom.store.matter['LiquidArgon']
+    geom.store.matter['LiquidArgon'] = argon._replace(density = 1.01*argon.density)
+    assert fingerprint(geom) != fp
+    geom.store.matter['LiquidArgon'] = argon
+    assert fingerprint(geom) == fp
+
+    # a changed material no volume uses, which is still exported
+    unused = sorted(set(geom.store.matter) - closure(geom)['matter'])
+    assert unused
+    obj = geom.store.matter[unused[0]]
+    geom.store.matter[obj.name] = obj._replace(density = 1.01*obj.density)
+    assert fingerprint(geom) != fp
+
+def test_export_skip():
+    geom = gegede.main.generate(cfgfile)
+    fp = fingerprint(geom)
+    for ext in ['gdml', 'glb']:
+        filename = os.path.join(tempfile.gettempdir(), 'test_fingerprint.' + ext)
+        if os.path.exists(filename):
+            os.unlink(filename)
+        assert main.export(geom, filename) == (fp, True)
+        assert read_fingerprint(filename) == fp
+        mtime = os.stat(filename).st_mtime
+        time.sleep(0.01)
+        assert main.export(geom, filename) == (fp, False)
+        assert os.stat(filename).st_mtime == mtime
+        assert main.main(['--status', '-o', filename, cfgfile]) == 3
+        assert main.export(geom, filename, force = True) == (fp, True)
+
+if '__main__' == __name__:
+    test_fingerprint()
+    test_export_skip()
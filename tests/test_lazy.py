@@ -0,0 +1,62 @@
+#!/usr/bin/python
+
+import os
+import time
+
+import gegede.main
+from lbne.geo.lazy import Session
+from lbne.geo.prune import extract
+from lbne.geo.fingerprint import fingerprint
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+cfgfile = os.path.join(cfgdir, '35ton.cfg')
+
+def test_lazy():
+    full = gegede.main.generate(cfgfile)
+    session = Session(cfgfile)
+    assert session.constructed() == []
+
+    drift = session.geometry('LongDrift')
+    assert drift.world == 'volLongDrift'
+    assert fingerprint(drift) == fingerprint(extract(full, 'volLongDrift'))
+    assert 'materials' in session.constructed()
+    assert 'LongCage' in session.constructed()
+    assert 'ShortDrift' not in session.constructed()
+    assert 'CPA' not in session.constructed()
+
+    # memoized: the rest of the detector is added to what is there
+    count = len(session.geom.store.structure)
+    det = session.geometry('volThirtyFiveTon')
+    assert fingerprint(det) == fingerprint(extract(full, 'volThirtyFiveTon'))
+    assert len(session.geom.store.structure) > count
+    count = len(session.geom.store.structure)
+    assert 'world' not in session.constructed()
+    again = session.geometry('LongDrift')
+    assert fingerprint(again) == fingerprint(drift)
+    assert len(session.geom.store.structure) == count
+
+    # the whole and a volume not made by a builder of its own
+    assert fingerprint(session.geometry()) == fingerprint(extract(full, full.world))
+    assert fingerprint(session.geometry('volWF_SmallCross1')) == fingerprint(extract(full, 'volWF_SmallCross1'))
+
+def test_unknown():
+    try:
+        Session(cfgfile).geometry('volNoSuch')
+    except ValueError:
+        pass
+    else:
+        assert False, 'unknown target accepted'
+
+def bench_lazy(count = 5):
+    for target in [None, 'ThirtyFiveTon', 'LongDrift', 'CPA']:
+        start = time.time()
+        for ind in range(count):
+            Session(cfgfile).geometry(target)
+        print '%-15s %.3f s' % (target or 'world', (time.time() - start) / count)
+
+if '__main__' == __name__:
+    test_lazy()
+    test_unknown()
+    bench_lazy()
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+
+import os
+import time
+import numpy
+
+import gegede.main
+from lbne.geo.flat import Flat
+from lbne.geo.live import Live
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def make_live(cfgname = '35ton.cfg'):
+    return Live(gegede.main.generate(os.path.join(cfgdir, cfgname)))
+
+def test_live_translate():
+    live = make_live()
+    flat = live.flat
+    tpcs = live.tpcs()
+    anode0 = tpcs.anode.copy()
+    pos0, lo0 = flat.pos.copy(), live.lo.copy()
+
+    drift = live.select('volLongDrift')
+    assert len(drift) == 1
+    below = numpy.zeros(len(flat), dtype=bool)
+    below[drift[0]:flat.end[drift[0]]] = True
+
+    with live.translated('volLongDrift', [1.0, 0.0, 0.0]):
+        assert numpy.allclose(flat.pos[below] - pos0[below], [1.0, 0.0, 0.0])
+        assert numpy.allclose(flat.pos[~below], pos0[~below])
+        assert numpy.allclose(live.lo - lo0, flat.pos - pos0)
+        moved = ['LongDrift' in p for p in tpcs.paths]
+        assert numpy.allclose((tpcs.anode - anode0)[moved], 1.0)
+        assert numpy.allclose((tpcs.anode - anode0)[~numpy.array(moved)], 0.0)
+
+    assert numpy.allclose(flat.pos, pos0)
+    assert numpy.allclose(tpcs.anode, anode0)
+
+    # a repeated node moves by the sum of its deltas, locally and globally
+    node = drift[0]
+    with live.translated([node, node], [[1.0, 0.0, 0.0], [0.0, 2.0, 0.0]]):
+        assert numpy.allclose(flat.pos[below] - pos0[below], [1.0, 2.0, 0.0])
+        flat.update(0, len(flat))
+        assert numpy.allclose(flat.pos[below] - pos0[below], [1.0, 2.0, 0.0])
+    assert numpy.allclose(flat.pos, pos0)
+
+    try:
+        live.place([node, node], [0.0, 0.0, 0.0])
+    except ValueError:
+        pass
+    else:
+        assert False, 'repeated node placed'
+
+    try:
+        live.select('^volNoSuch')
+    except ValueError:
+        pass
+    else:
+        assert False, 'empty selection accepted'
+
+def test_live_matches_rebuild():
+    'Moving then saving must agree with flattening the saved geometry'
+    live = make_live('35ton-larsoft.cfg')
+    tpcs = live.select('^volTPC')
+    assert len(tpcs) == 8
+    deltas = numpy.random.RandomState(0).normal(0, 0.1, (len(tpcs), 3))
+    live.translate(tpcs, deltas)
+    live.translate('volWireFrame', [0, 0.5, 0])
+    live.save()
+    again = Flat(live.geom)
+    assert not numpy.allclose(again.pos[tpcs], make_live('35ton-larsoft.cfg').flat.pos[tpcs])
+    assert again.paths == live.flat.paths
+    assert numpy.allclose(again.pos, live.flat.pos)
+
+def bench_alignment(nhyp = 10000):
+    live = make_live('35ton-larsoft.cfg')
+    tpcs = live.select('^volTPC')
+    assert len(tpcs) == 8
+    deltas = numpy.random.RandomState(0).normal(0, 0.1, (nhyp, len(tpcs), 3))
+    saved = live.state()
+    start = time.time()
+    for hyp in deltas:
+        live.translate(tpcs, hyp)
+        live.restore(saved)
+    print '%.0f hypotheses/second' % (nhyp / (time.time() - start))
+
+if '__main__' == __name__:
+    test_live_translate()
+    test_live_matches_rebuild()
+    bench_alignment()
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+import os
+import time
+import tempfile
+
+import gegede.main
+from lbne.geo import material, lod
+from lbne.geo.flat import Flat
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def make_geom(level):
+    cfgs = [os.path.join(cfgdir,'35ton.cfg')]
+    if level != 'full':
+        lodcfg = os.path.join(tempfile.gettempdir(), '35ton-%s-lod.cfg' % level)
+        text = open(os.path.join(cfgdir,'35ton-lod.cfg')).read()
+        open(lodcfg,'w').write(text.replace("lod = 'coarse'", "lod = '%s'" % level))
+        cfgs.append(lodcfg)
+    return gegede.main.generate(cfgs)
+
+def test_lod_preserves_mass():
+    full = make_geom('full')
+    want = material.element_masses(full, full.world)
+    nfull = len(Flat(full))
+    for level in lod.LEVELS:
+        geom = make_geom(level)
+        got = material.element_masses(geom, geom.world)
+        assert set(got) == set(want)
+        for ele, mass in want.items():
+            assert abs(got[ele] - mass) <= 1e-9 * mass, (level, ele, got[ele], mass)
+        nodes = len(Flat(geom))
+        assert level == 'full' or nodes < nfull
+        # TPCs always survive
+        assert len(Flat(geom).find('^volTPC')) == 8
+        print '%s: %d nodes' % (level, nodes)
+
+def test_lod_massless():
+    geom = make_geom('full')
+    store = geom.store.structure
+    argon = geom.store.matter['LiquidArgon']
+    geom.store.matter['TestVacuum'] = argon._replace(name = 'TestVacuum', density = 0*argon.density)
+
+    # nothing but what is kept has mass
+    drift = store['volLongDrift']
+    store['volLongDrift'] = drift._replace(material = 'TestVacuum')
+    want = material.element_masses(geom, 'volLongDrift')
+    new = lod.homogenize(geom, 'volLongDrift', keep = '^vol(TPC|LongCage)')
+    assert new.material == 'TestVacuum'
+    got = material.element_masses(geom, 'volLongDrift')
+    for ele, mass in want.items():
+        assert abs(got[ele] - mass) <= 1e-9 * mass
+
+    # no mass at all
+    cpa = store['volCPA']
+    store['volCPA'] = cpa._replace(material = 'TestVacuum')
+    assert lod.homogenize(geom, 'volCPA').material == 'TestVacuum'
+
+def bench_navigation(npoints = 1000000):
+    '''Time ROOT "where am I" queries for each level of detail.'''
+    import ROOT
+    from gegede.export import Exporter
+    for level in lod.LEVELS:
+        geom = make_geom(level)
+        gdmlfile = '35ton-%s.gdml' % level
+        exporter = Exporter('gdml')
+        exporter.convert(geom)
+        exporter.output(gdmlfile)
+        tgeo = ROOT.TGeoManager.Import(gdmlfile)
+        start = time.time()
+        tgeo.Test(npoints)
+        print '%s: %.3f s for %d points' % (level, time.time() - start, npoints)
+
+if '__main__' == __name__:
+    test_lod_preserves_mass()
+    test_lod_massless()
+    bench_navigation()
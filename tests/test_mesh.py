@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+import os
+import json
+import struct
+import tempfile
+import numpy
+
+import gegede.main
+from lbne.geo.flat import Flat
+from lbne.geo.bounds import get_bounds
+from lbne.geo import mesh
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def read_glb(filename):
+    with open(filename, 'rb') as fp:
+        data = fp.read()
+    magic, version, total = struct.unpack('<4sII', data[:12])
+    assert magic == b'glTF' and version == 2 and total == len(data)
+    jlen, jtype = struct.unpack('<I4s', data[12:20])
+    assert jtype == b'JSON'
+    doc = json.loads(data[20:20+jlen].decode('utf-8'))
+    blen, btype = struct.unpack('<I4s', data[20+jlen:28+jlen])
+    assert btype == b'BIN\0'
+    return doc, data[28+jlen:28+jlen+blen]
+
+def test_box_mesh():
+    pos, nor, ind = mesh.box_mesh([1.0, 2.0, 3.0])
+    assert len(ind) == 36
+    assert numpy.allclose(numpy.abs(pos).max(axis=0), [1, 2, 3])
+    # outward normals: each triangle's winding agrees with its normal
+    tri = pos[ind.reshape(-1, 3)]
+    cross = numpy.cross(tri[:,1] - tri[:,0], tri[:,2] - tri[:,0])
+    assert numpy.all(numpy.sum(cross * nor[ind[::3]], axis=1) > 0)
+
+def test_export():
+    geom = gegede.main.generate(os.path.join(cfgdir, '35ton.cfg'))
+    flat = Flat(geom)
+    filename = os.path.join(tempfile.gettempdir(), 'test_mesh.glb')
+    mesh.export(flat, filename)
+    doc, blob = read_glb(filename)
+    assert len(blob) == doc['buffers'][0]['byteLength']
+
+    leaves = mesh.select_nodes(flat)
+    assert len(doc['nodes']) == len(leaves) + 1
+    shapes = set([geom.store.structure[flat.volumes[i]].shape for i in leaves])
+    positions = set([m['primitives'][0]['attributes']['POSITION'] for m in doc['meshes']])
+    assert len(positions) == len(shapes) < len(leaves)
+
+    # every node's vertices land inside that node's global extent
+    lo, hi = get_bounds(geom).nodes(flat)
+    for ind, node in zip(leaves, doc['nodes'][1:]):
+        acc = doc['accessors'][doc['meshes'][node['mesh']]['primitives'][0]['attributes']['POSITION']]
+        view = doc['bufferViews'][acc['bufferView']]
+        start = view['byteOffset']
+        pos = numpy.frombuffer(blob[start:start+view['byteLength']], dtype='<f4').reshape(-1, 3)
+        matrix = numpy.array(node['matrix']).reshape(4, 4).T
+        pos = numpy.dot(pos, matrix[:3,:3].T) + matrix[:3,3]
+        assert numpy.all(pos >= lo[ind] - 1e-3) and numpy.all(pos <= hi[ind] + 1e-3), node['name']
+
+    # culling
+    lighter = mesh.export(flat, filename, max_depth = 3, exclude = 'Argon')
+    assert len(lighter['nodes']) < len(doc['nodes'])
+    assert not [m for m in lighter['materials'] if 'Argon' in m['name']]
+
+if '__main__' == __name__:
+    test_box_mesh()
+    test_export()
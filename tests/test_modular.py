@@ -0,0 +1,69 @@
+#!/usr/bin/python
+
+import os
+import tempfile
+from lxml import etree
+
+import gegede.main
+import gegede.export.gdml
+from lbne.geo import modular
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def structure(root):
+    'Map volume name to list of daughter refs'
+    ret = dict()
+    for vol in root.find('structure'):
+        ret[vol.get('name')] = [(pv.find('volumeref').get('ref') if pv.find('volumeref') is not None
+                                 else pv.find('file').get('name'),
+                                 pv.find('positionref').get('ref'))
+                                for pv in vol.findall('physvol')]
+    return ret
+
+def load(filename):
+    parser = etree.XMLParser(load_dtd = True, resolve_entities = True, no_network = True)
+    return etree.parse(filename, parser).getroot()
+
+def assemble(filename, seen = None):
+    '''Return structure of a modular file with file references
+    replaced by the module world volume'''
+    root = load(filename)
+    ret = structure(root)
+    outdir = os.path.dirname(filename)
+    for vol, daughters in ret.items():
+        for ind, (ref, pos) in enumerate(daughters):
+            if ref.endswith('.gdml'):
+                sub = os.path.join(outdir, ref)
+                world = load(sub).find('setup/world').get('ref')
+                ret.update(assemble(sub))
+                daughters[ind] = (world, pos)
+    return ret
+
+def test_modular():
+    geom = gegede.main.generate(os.path.join(cfgdir, '35ton.cfg'))
+    whole = structure(gegede.export.gdml.convert(geom))
+    outdir = tempfile.mkdtemp()
+    modules = ['WireFrame', 'LongDrift', 'ShortDrift']
+    written = modular.export(geom, outdir, modules, prefix = '35ton')
+    assert all([w for p, w in written])
+    names = sorted([os.path.basename(p) for p, w in written])
+    assert names == sorted(['35ton-define.xml', '35ton-materials.xml', '35ton.gdml'] +
+                           [m + '.gdml' for m in modules])
+
+    # the modules put back together make the whole
+    assert assemble(os.path.join(outdir, '35ton.gdml')) == whole
+
+    # a module stands alone and holds only its part
+    part = load(os.path.join(outdir, 'WireFrame.gdml'))
+    assert part.find('setup/world').get('ref') == 'volWireFrame'
+    assert 'volLongDrift' not in structure(part)
+    assert len(part.find('materials')) == len(load(os.path.join(outdir, '35ton.gdml')).find('materials'))
+
+    # unchanged files are left alone
+    again = modular.export(geom, outdir, modules, prefix = '35ton')
+    assert not any([w for p, w in again])
+
+if '__main__' == __name__:
+    test_modular()
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+import os
+import time
+import numpy
+
+import gegede.main
+from gegede import Quantity as Q
+from lbne.geo.shapes import inside
+from lbne.geo.navigate import Navigator, safety_in, safety_out, distance_in, distance_out
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def make_nav(cfgname = '35ton.cfg'):
+    return Navigator(gegede.main.generate(os.path.join(cfgdir, cfgname)))
+
+def random_dirs(rng, count):
+    dirs = rng.normal(size=(count, 3))
+    return dirs / numpy.sqrt(numpy.sum(dirs*dirs, axis=1))[:,None]
+
+def test_hollow_box():
+    geom = gegede.main.generate(os.path.join(cfgdir, '35ton.cfg'))
+    outer = geom.shapes.Box(None, Q('1cm'), Q('1cm'), Q('1cm'))
+    hole = geom.shapes.Box(None, Q('0.5cm'), Q('0.5cm'), Q('2cm'))
+    tube = geom.shapes.Boolean(None, type='subtraction', first=outer, second=hole)
+
+    pts = numpy.array([[0.75, 0.0, 0.0], [0.0, 0.9, 0.5], [0.0, 0.0, 0.0], [3.0, 0.0, 0.0]])
+    assert list(inside(geom, tube, pts)) == [True, True, False, False]
+    assert numpy.allclose(safety_in(geom, tube, pts[:2]), [0.25, 0.1])
+    assert numpy.allclose(safety_out(geom, tube, pts[2:]), [0.5, 2.0])
+
+    dirs = numpy.array([[-1.0, 0.0, 0.0], [0.0, -1.0, 0.0], [0.0, 0.0, 1.0], [-1.0, 0.0, 0.0]])
+    assert numpy.allclose(distance_out(geom, tube, pts[:2], dirs[:2]), [0.25, 0.4])
+    assert numpy.allclose(distance_in(geom, tube, pts[2:], dirs[2:]), [numpy.inf, 2.0])
+    # through the hole and out the far side
+    assert numpy.isinf(distance_in(geom, tube, [[0.0, 0.0, -5.0]], [[0.0, 0.0, 1.0]]))[0]
+
+def brute_safety(nav, points, nodes):
+    'Check every daughter of every node'
+    ret = list()
+    for p, node in zip(points, nodes):
+        p = p[None,:]
+        shape = nav.flat.shape(node)
+        best = safety_in(nav.geom, shape, nav._local(numpy.array([node]), p))[0]
+        for dau in numpy.flatnonzero(nav.mother == node):
+            local = nav._local(numpy.array([dau]), p)
+            best = min(best, safety_out(nav.geom, nav.flat.shape(dau), local)[0])
+        ret.append(best)
+    return numpy.array(ret)
+
+def test_navigate():
+    nav = make_nav()
+    rng = numpy.random.RandomState(0)
+    lo, hi = nav.lo[1], nav.hi[1]
+    points = lo + (hi - lo) * rng.random_sample((2000, 3))
+    nodes = nav.locate(points)
+    assert numpy.all(nodes >= 0)
+
+    safety = nav.safety(points, nodes)
+    assert numpy.allclose(safety[:200], brute_safety(nav, points[:200], nodes[:200]))
+
+    # moving by less than the safety stays in the same node
+    dirs = random_dirs(rng, len(points))
+    assert numpy.all(nav.locate(points + 0.999*safety[:,None]*dirs) == nodes)
+
+    # just short of the boundary stays, just past it leaves
+    dist = nav.distance_to_out(points, dirs, nodes)
+    assert numpy.all(dist >= safety - 1e-9)
+    eps = 1e-6
+    short = nav.locate(points + (dist - eps)[:,None]*dirs)
+    assert numpy.all(short == nodes)
+    past = nav.locate(points + (dist + eps)[:,None]*dirs)
+    assert numpy.all(past != nodes)
+
+def test_outside():
+    nav = make_nav()
+    far = numpy.array([[1e9, 0.0, 0.0]])
+    assert nav.locate(far)[0] == -1
+    assert numpy.isnan(nav.safety(far)[0])
+    assert numpy.isnan(nav.distance_to_out(far, [[1.0, 0.0, 0.0]])[0])
+
+def bench_navigate(count = 1000000):
+    nav = make_nav()
+    rng = numpy.random.RandomState(1)
+    lo, hi = nav.lo[1], nav.hi[1]
+    points = lo + (hi - lo) * rng.random_sample((count, 3))
+    dirs = random_dirs(rng, count)
+    start = time.time()
+    nodes = nav.locate(points)
+    t1 = time.time()
+    nav.safety(points, nodes)
+    t2 = time.time()
+    nav.distance_to_out(points, dirs, nodes)
+    t3 = time.time()
+    print 'locate: %.2g/s, safety: %.2g/s, distance_to_out: %.2g/s' % \
+        (count/(t1-start), count/(t2-t1), count/(t3-t2))
+
+if '__main__' == __name__:
+    test_hollow_box()
+    test_navigate()
+    test_outside()
+    bench_navigate()
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+
+import os
+import tempfile
+
+import gegede.main
+import gegede.export.gdml
+from lbne.geo import prune, main
+from lbne.geo.fingerprint import Fingerprinter, fingerprint, read_fingerprint
+from lbne.geo.flat import Flat
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def check(cfgfile, top):
+    geom = gegede.main.generate(os.path.join(cfgdir, cfgfile))
+    part = prune.extract(geom, top)
+    assert part.world == top
+
+    # same tree, less of everything else
+    assert Fingerprinter(part).volume(top) == Fingerprinter(geom).volume(top)
+    assert fingerprint(part) != fingerprint(geom, top)
+    assert sorted(part.store.matter) == sorted(prune.closure(geom, top)['matter'])
+    assert len(part.store.matter) < len(geom.store.matter)
+    assert len(part.store.structure) < len(geom.store.structure)
+    assert len(part.store.shapes) <= len(geom.store.shapes)
+
+    # paths below the top are the same and no volume outside is kept
+    assert Flat(part).paths == Flat(geom, top).paths
+    inside = set(Flat(geom, top).volumes)
+    outside = [n for n, o in geom.store.structure.items()
+               if type(o).__name__ == 'Volume' and n not in inside]
+    assert outside
+    assert not [n for n in outside if n in part.store.structure]
+
+    # self-contained
+    root = gegede.export.gdml.convert(part)
+    assert root.find('setup/world').get('ref') == top
+    assert len(root.find('materials')) == len(part.store.matter)
+
+    # new anonymous objects do not collide with kept ones
+    count = len(part.store.structure)
+    part.structure.Position(None)
+    assert len(part.store.structure) == count + 1
+    return geom, part
+
+def test_cryostat():
+    geom, part = check('35ton-larsoft.cfg', 'volCryostat')
+    assert 'volworld' in geom.store.structure
+    assert 'volworld' not in part.store.structure
+
+def test_detector():
+    geom, part = check('35ton.cfg', 'volThirtyFiveTon')
+    assert 'volDetEnclosure' in geom.store.structure
+    assert 'volDetEnclosure' not in part.store.structure
+
+def test_main():
+    outfile = os.path.join(tempfile.mkdtemp(), 'cryostat.gdml')
+    cfgfile = os.path.join(cfgdir, '35ton-larsoft.cfg')
+    assert main.main(['-t', 'volCryostat', '-o', outfile, cfgfile]) == 0
+    geom = gegede.main.generate(cfgfile)
+    assert read_fingerprint(outfile) == fingerprint(prune.extract(geom, 'volCryostat'))
+
+if '__main__' == __name__:
+    test_cryostat()
+    test_detector()
+    test_main()
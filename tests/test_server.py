@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+import os
+import time
+import json
+import shutil
+import socket
+import tempfile
+import threading
+
+import numpy
+import gegede.main
+from lbne.geo import server
+from lbne.geo.navigate import Navigator
+from lbne.geo.material import mass
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def start(cfgfile, poll = None):
+    path = os.path.join(tempfile.mkdtemp(), 'geo.sock')
+    srv = server.GeometryServer(path, server.Loader(cfgfile), poll)
+    thread = threading.Thread(target = srv.serve_forever, kwargs = dict(poll_interval = 0.05))
+    thread.daemon = True
+    thread.start()
+    return srv, path, thread
+
+def stop(srv, thread):
+    srv.shutdown()
+    thread.join()
+    srv.server_close()
+
+def test_queries():
+    cfgfile = os.path.join(cfgdir, '35ton.cfg')
+    geom = gegede.main.generate(cfgfile)
+    nav = Navigator(geom)
+    srv, path, thread = start(cfgfile)
+    client = server.Client(path)
+    try:
+        info = client.info()
+        assert info['nodes'] == len(nav.flat)
+        assert info['generation'] == 0
+
+        points = numpy.random.RandomState(1).uniform(-300, 300, (1000, 3))
+        dirs = numpy.random.RandomState(2).normal(size = (1000, 3))
+        dirs /= numpy.sqrt((dirs**2).sum(axis=1))[:,None]
+        nodes = client.locate(points)
+        assert numpy.all(nodes == nav.locate(points))
+        assert numpy.allclose(client.safety(points), nav.safety(points), equal_nan = True)
+        assert numpy.allclose(client.distance(points, dirs), nav.distance_to_out(points, dirs), equal_nan = True)
+
+        found = numpy.unique(nodes[nodes >= 0])
+        paths, volumes = client.nodes(found)
+        assert paths == [nav.flat.paths[n] for n in found]
+        rot, pos = client.placement(found)
+        assert numpy.allclose(pos, nav.flat.pos[found])
+        assert rot.shape == (len(found), 3, 3)
+
+        assert numpy.allclose(client.mass(['volCPA']), [mass(geom, 'volCPA')])
+        try:
+            client.mass(['volNoSuch'])
+        except RuntimeError:
+            pass
+        else:
+            assert False, 'unknown volume accepted'
+        # the connection survives an error
+        assert client.info()['fingerprint'] == info['fingerprint']
+    finally:
+        client.close()
+        stop(srv, thread)
+    assert not os.path.exists(path)
+
+def test_malformed():
+    srv, path, thread = start(os.path.join(cfgdir, '35ton.cfg'))
+    try:
+        bad = ['{"op": "info"', '[1, 2]',
+               json.dumps(dict(op = 'locate', arrays = [['<f8', [2, 'x']]])),
+               json.dumps(dict(op = 'locate', arrays = [['no such', [1, 3]]]))]
+        for text in bad:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(10)
+            sock.connect(path)
+            sock.sendall(server._length.pack(len(text)) + text)
+            header, arrays = server.recv_message(sock)
+            assert header['ok'] is False
+            assert header['error'].startswith('Malformed request')
+            # then the connection is closed
+            assert sock.recv(1) == ''
+            sock.close()
+
+        # and the server still answers
+        client = server.Client(path)
+        assert client.info()['generation'] == 0
+        client.close()
+    finally:
+        stop(srv, thread)
+
+def test_rebuild():
+    tmpdir = tempfile.mkdtemp()
+    cfgfile = os.path.join(tmpdir, 'larsoft.cfg')
+    shutil.copy(os.path.join(cfgdir, '35ton-larsoft.cfg'), cfgfile)
+    srv, path, thread = start(cfgfile)
+    client = server.Client(path)
+    try:
+        before = client.info()
+        assert not srv.refresh()
+
+        text = open(cfgfile).read().replace('Q("100 m")', 'Q("90 m")')
+        open(cfgfile, 'w').write(text)
+        os.utime(cfgfile, (time.time() + 10, time.time() + 10))
+        assert srv.refresh()
+        after = client.info()
+        assert after['generation'] == 1
+        assert after['fingerprint'] != before['fingerprint']
+
+        # a broken configuration keeps the old geometry
+        open(cfgfile, 'w').write(text.replace('[Cryostat]', '[Cryo'))
+        os.utime(cfgfile, (time.time() + 20, time.time() + 20))
+        assert not srv.refresh()
+        assert client.info() == after
+    finally:
+        client.close()
+        stop(srv, thread)
+
+def bench_server(count = 1000, batch = 1000):
+    srv, path, thread = start(os.path.join(cfgdir, '35ton.cfg'))
+    client = server.Client(path)
+    points = numpy.random.RandomState(1).uniform(-300, 300, (batch, 3))
+    for op in ['info', 'locate', 'safety']:
+        args = () if op == 'info' else (points,)
+        start_time = time.time()
+        for ind in range(count // 10):
+            getattr(client, op)(*args)
+        took = (time.time() - start_time) / (count // 10)
+        print '%-8s %.2f ms per request of %d points' % (op, took * 1e3, batch)
+    client.close()
+    stop(srv, thread)
+
+if '__main__' == __name__:
+    test_queries()
+    test_malformed()
+    test_rebuild()
+    bench_server()
@@ -0,0 +1,50 @@
+#!/usr/bin/python
+
+import os
+import numpy
+
+import gegede.main
+from lbne.geo.tpc import TpcTable
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def check_tpcs(cfgname):
+    geom = gegede.main.generate(os.path.join(cfgdir, cfgname))
+    tt = TpcTable(geom)
+    assert len(tt) == 8, 'Found %d TPCs' % len(tt)
+
+    # short drifts on -x side drift toward +x and vice versa
+    for path, sign, lo, hi in zip(tt.paths, tt.sign, tt.lo, tt.hi):
+        if path.rsplit('_')[-1][1] == 'S':
+            assert sign == +1, path
+        else:
+            assert sign == -1, path
+
+    centers = 0.5*(tt.lo + tt.hi)
+    tpc, distance, sign = tt.to_drift_coords(centers)
+    assert numpy.all(tpc == numpy.arange(len(tt)))
+    assert numpy.allclose(distance, 0.5*(tt.hi - tt.lo)[:,0])
+
+    outside = numpy.array([[1e4, 0, 0]])
+    tpc, distance, sign = tt.to_drift_coords(outside)
+    assert tpc[0] == -1 and sign[0] == 0 and numpy.isnan(distance[0])
+
+    # compare to brute force
+    points = numpy.random.RandomState(0).uniform(-300, 300, (100000, 3))
+    tpc = tt.locate(points)
+    for ind, (lo, hi) in enumerate(zip(tt.lo, tt.hi)):
+        inside = numpy.all((points >= lo) & (points < hi), axis=1)
+        assert numpy.all(tpc[inside] == ind)
+        assert numpy.all(tpc[~inside] != ind)
+
+def test_tpc_35ton():
+    check_tpcs('35ton.cfg')
+
+def test_tpc_35ton_larsoft():
+    check_tpcs('35ton-larsoft.cfg')
+
+if '__main__' == __name__:
+    test_tpc_35ton()
+    test_tpc_35ton_larsoft()
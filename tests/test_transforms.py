@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+import os
+import numpy
+
+import gegede.main
+import gegede.export.gdml
+from gegede import Quantity as Q
+from lbne.geo.flat import Flat
+from lbne.geo.bounds import get_bounds
+from lbne.geo.transforms import get_interner, intern_transforms, renumber
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def make_geom(cfgname = '35ton.cfg'):
+    return gegede.main.generate(os.path.join(cfgdir, cfgname))
+
+def count(geom, kind):
+    return len([o for o in geom.store.structure.values() if type(o).__name__ == kind])
+
+def test_interner():
+    geom = make_geom()
+    interner = get_interner(geom)
+    a = interner.position(x=Q('1m'), y=Q('2cm'))
+    assert interner.position(x=100.0, y='20mm') == a
+    assert interner.position(x=Q('1m'), y=Q('2cm'), z=Q('1e-12cm')) == a
+    assert interner.position(x=Q('1m')) != a
+    assert interner.position() is None
+    assert interner.rotation(y=Q('0deg')) is None
+    assert interner.rotation(x=Q('90deg')) == interner.rotation(x=0.5*numpy.pi*Q('radian'))
+
+    names, values = interner.table('Position')
+    assert numpy.allclose(values[names.index(a)], [100, 2, 0])
+
+def test_builders_interned():
+    for cfg in ['35ton.cfg', '35ton-larsoft.cfg']:
+        geom = make_geom(cfg)
+        before = count(geom, 'Position') + count(geom, 'Rotation')
+        assert intern_transforms(geom) == 0
+        assert count(geom, 'Position') + count(geom, 'Rotation') == before
+
+def test_intern_pass():
+    geom = make_geom()
+    flat = Flat(geom)
+    store = geom.store.structure
+
+    # duplicate every transform as a builder not using the interner would
+    for name, place in store.items():
+        if type(place).__name__ != 'Placement':
+            continue
+        change = dict()
+        for field, kind in [('pos', 'Position'), ('rot', 'Rotation')]:
+            old = getattr(place, field)
+            if old:
+                obj = store[old]
+                change[field] = getattr(geom.structure, kind)(None, obj.x, obj.y, obj.z).name
+            else:
+                change[field] = getattr(geom.structure, kind)(None).name
+        store[name] = place._replace(**change)
+    npos, nrot = count(geom, 'Position'), count(geom, 'Rotation')
+
+    removed = intern_transforms(geom)
+    assert removed > 0
+    assert count(geom, 'Position') + count(geom, 'Rotation') == npos + nrot - removed
+
+    again = Flat(geom)
+    assert again.paths == flat.paths
+    assert numpy.allclose(again.pos, flat.pos)
+    assert numpy.allclose(again.rot, flat.rot)
+
+    # anonymous objects can still be made and the result exported
+    for n in range(100):
+        geom.structure.Position(None, x=Q(n, 'cm'))
+        geom.structure.Placement(None, volume=flat.volumes[1])
+    gegede.export.gdml.convert(geom)
+
+def test_renumber():
+    geom = make_geom()
+    a = get_interner(geom).position(x=Q('3m'))
+    get_bounds(geom).volume(geom.world)
+
+    # shift every anonymous name
+    store = geom.store.structure
+    items = store.items()
+    store.clear()
+    geom.structure.Position(None)
+    for name, obj in items:
+        store[name] = obj
+    rename = renumber(geom)
+    assert a in rename
+
+    # the caches follow the new names
+    b = get_interner(geom).position(x=Q('3m'))
+    assert b == rename[a]
+    assert store[b].x == Q('3m')
+    assert not get_bounds(geom)._volumes
+
+if '__main__' == __name__:
+    test_interner()
+    test_builders_interned()
+    test_intern_pass()
+    test_renumber()
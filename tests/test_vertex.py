@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+import os
+import time
+import numpy
+
+import gegede.main
+from lbne.geo.flat import Flat
+from lbne.geo.tpc import TpcTable
+from lbne.geo.vertex import VertexSampler, alias_table
+from lbne.geo import material
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+
+def make_flat():
+    return Flat(gegede.main.generate(os.path.join(cfgdir, '35ton.cfg')))
+
+def test_alias_table():
+    weights = numpy.array([1.0, 0.0, 5.0, 2.0, 2.0])
+    prob, alias = alias_table(weights)
+    # probability mass of each index from the table
+    got = prob.copy()
+    for i, a in enumerate(alias):
+        got[a] += 1.0 - prob[i]
+    assert numpy.allclose(got / len(weights), weights / weights.sum())
+
+def test_vertex_tpcs():
+    flat = make_flat()
+    vs = VertexSampler(flat, within = '^volTPC', materials = 'LiquidArgon')
+    assert len(vs.nodes) == 8
+    assert vs.material_names == ['LiquidArgon']
+
+    verts = vs.sample(200000, seed = 1)
+    tpc = TpcTable(flat).locate(verts.points)
+    assert numpy.all(tpc >= 0)
+
+    # same seed and stream reproduce, other streams do not
+    again = vs.sample(1000, seed = 1)
+    assert numpy.all(again.points == vs.sample(1000, seed = 1).points)
+    other = vs.sample(1000, seed = 1, stream = 1)
+    assert not numpy.all(other.points == again.points)
+
+    # uniform in mass means equal density TPCs are hit in proportion to their mass
+    frac = numpy.bincount(verts.node, minlength = len(flat))[vs.nodes] / float(len(verts.node))
+    want = vs.mass / vs.total_mass
+    assert numpy.all(numpy.abs(frac - want) < 5*numpy.sqrt(want/len(verts.node)))
+
+def test_vertex_enclosure():
+    flat = make_flat()
+    geom = flat.geom
+    vs = VertexSampler(flat, within = 'volDetEnclosure')
+    assert abs(vs.total_mass - material.mass(geom, 'volDetEnclosure')) < 1e-6 * vs.total_mass
+    verts = vs.sample(200000, seed = 2)
+    concrete = vs.material_names.index('Concrete')
+    frac = numpy.mean(verts.material == concrete)
+    want = vs.mass[vs._material == concrete].sum() / vs.total_mass
+    assert abs(frac - want) < 5*numpy.sqrt(want*(1-want)/len(verts.node))
+
+    # concrete vertices are outside the detector
+    det = flat.find('volThirtyFiveTon')[0]
+    local = flat.to_local(det, verts.points[verts.material == concrete])
+    half = numpy.array([s.to('cm').magnitude for s in geom.get_shape('ThirtyFiveTon')[1:]])
+    assert not numpy.any(numpy.all(numpy.abs(local) < half, axis=1))
+
+def bench_vertex(count = 5000000):
+    flat = make_flat()
+    for within, mats in [('^volTPC', 'LiquidArgon'), ('volDetEnclosure', None)]:
+        vs = VertexSampler(flat, within = within, materials = mats)
+        start = time.time()
+        vs.sample(count, seed = 0)
+        print '%s: %.2g vertices/second' % (within, count / (time.time() - start))
+
+if '__main__' == __name__:
+    test_alias_table()
+    test_vertex_tpcs()
+    test_vertex_enclosure()
+    bench_vertex()
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+
+import os
+import time
+import tempfile
+
+import numpy
+import gegede.main
+from gegede import Quantity as Q
+from lbne.geo import visibility
+from lbne.geo.flat import Flat
+from lbne.geo.vertex import random_state
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+srcdir = os.path.dirname(testdir)
+cfgdir = os.path.join(srcdir,'config')
+cfgfile = os.path.join(cfgdir, '35ton-larsoft.cfg')
+
+def rectangle_fraction(a, b, d):
+    'Solid angle fraction of a 2a by 2b rectangle seen from distance d on its axis'
+    return numpy.arctan(a*b / (d*numpy.sqrt(a*a + b*b + d*d))) / numpy.pi
+
+def test_solid_angle():
+    paddle = numpy.array([[[0.0, 0.0, 0.0], [0.0, 20.0, 0.0], [0.0, 0.0, 10.0]]])
+    points = numpy.array([[d, 0.0, 0.0] for d in [5.0, 20.0, 100.0]] + [[-50.0, 0.0, 0.0]])
+    nobox = numpy.zeros((0, 3))
+    vis = visibility.visibility(points, paddle, nobox, nobox, 400, random_state(1))[:,0]
+    want = rectangle_fraction(20.0, 10.0, numpy.abs(points[:,0]))
+    assert numpy.allclose(vis, want, rtol = 0.02), (vis, want)
+
+    # a box between hides it from that side only
+    lo, hi = numpy.array([[10.0, -30.0, -30.0]]), numpy.array([[12.0, 30.0, 30.0]])
+    vis = visibility.visibility(points, paddle, lo, hi, 400, random_state(1))[:,0]
+    assert numpy.all(vis[1:3] == 0.0)
+    assert vis[0] > 0.0 and vis[3] > 0.0
+
+def test_library():
+    geom = gegede.main.generate(cfgfile)
+    flat = Flat(geom)
+    names, paddles = visibility.frame_paddles(flat)
+    # one bay per cross piece plus one in each of 4 frames
+    assert len(names) == sum([1 for v in flat.volumes if 'Cross' in v]) + 4
+    lo, hi = visibility.occluders(flat)
+    assert len(lo) and numpy.all(hi > lo)
+
+    filename = os.path.join(tempfile.mkdtemp(), 'vis.npy')
+    lib = visibility.generate(geom, filename, pitch = Q('40 cm'), samples = 4, processes = 2, chunk = 16)
+    assert isinstance(lib.visibility, numpy.memmap)
+    assert lib.visibility.shape == (len(lib.centers), len(names))
+    assert numpy.all(lib.visibility >= 0.0)
+    assert numpy.all(lib.visibility.sum(axis=1) <= 0.5)
+    assert numpy.all(lib.voxel(lib.centers) == numpy.arange(len(lib.centers)))
+    assert numpy.all(lib(lib.centers) == lib.visibility)
+    assert lib.voxel(numpy.array([[1e4, 0.0, 0.0]]))[0] == -1
+
+    # frame bars cast shadows: light reaches paddles less than unobstructed
+    nobox = numpy.zeros((0, 3))
+    clear = visibility.visibility(lib.centers[:16], lib.paddles, nobox, nobox, 4, random_state(0, 0))
+    assert numpy.all(lib.visibility[:16] <= clear + 1e-7)
+    assert numpy.any(lib.visibility[:16] < clear - 1e-7)
+
+    # same result in one process, written to its own file
+    other = os.path.join(os.path.dirname(filename), 'vis1.npy')
+    again = visibility.generate(geom, other, pitch = Q('40 cm'), samples = 4, processes = 1, chunk = 16)
+    assert numpy.all(again.visibility == lib.visibility)
+    # and a check which can fail: another seed gives another library
+    other = os.path.join(os.path.dirname(filename), 'vis2.npy')
+    differ = visibility.generate(geom, other, pitch = Q('40 cm'), samples = 4, processes = 1, chunk = 16, seed = 1)
+    assert numpy.any(differ.visibility != lib.visibility)
+
+def bench_library(pitch = '10 cm', samples = 16):
+    geom = gegede.main.generate(cfgfile)
+    filename = os.path.join(tempfile.mkdtemp(), 'vis.npy')
+    start = time.time()
+    lib = visibility.generate(geom, filename, pitch = Q(pitch), samples = samples)
+    took = time.time() - start
+    print '%d voxels x %d paddles in %.1f s, %.0f voxels/s' % \
+        (lib.visibility.shape[0], lib.visibility.shape[1], took, lib.visibility.shape[0] / took)
+
+if '__main__' == __name__:
+    test_solid_angle()
+    test_library()
+    bench_library()